@@ -34,16 +34,77 @@ signal.signal(signal.SIGINT, signal_handler)
 #}
 smtp_crd = None
 
-print("Orchestrator Service")
-orch_srv = OrchestratorService(
-    address     = "127.0.0.1",
-    db_conn_str = "sqlite:///share/orch/orchestrator.sqlite", 
-    smtp_crd    = smtp_crd
-)
-# change the logging ini file and log file paths
-orch_srv.setLogger(FileLogger("Orchestrator",config_file="etc/orch/logging.ini",logfile="logs/orch/orchestrator.log"))
-
-orch_srv.start()
-time.sleep(1)
-orch_srv.wait()
-orch_srv.stopService()
+# maximum number of concurrent executions (None: number of cpus). Executions
+# beyond this limit (or beyond max_per_pipeline / max_per_owner) are queued
+max_workers = None
+
+# run the local executions in pre-forked worker processes (forked by a fork
+# server), recycled after worker_max_tasks executions or when using more
+# than worker_max_memory bytes. The pipelines run in them get an orch_access
+# without the orchestrator manager, as the ones run as jobs
+warm_workers      = False
+worker_max_tasks  = 100
+worker_max_memory = None
+
+# results and outputs larger than inline_threshold bytes are kept in the
+# artifact store (None: always in the database). The executions stored keep
+# references to it, so it must not move
+artifact_dir     = "share/orch/artifacts"
+inline_threshold = 65536
+
+# the output of the running local executions is written to log files in
+# log_dir, so it can be followed while they run (None: captured until they
+# finish)
+log_dir = "logs/orch/executions"
+
+# number of threads serving the api requests (None: werkzeug development
+# server, one request at a time). Idle or stalled connections are closed
+# after request_timeout seconds and the requests in flight are given up to
+# drain_timeout seconds to finish when stopping. The long polls and the
+# output streams leave their thread while waiting, at most max_waiters of
+# them at the same time (the others are answered with 503). At most
+# max_connections connections are open, idle keep alive ones are closed
+# to make room for new ones
+threads         = 16
+request_timeout = 15
+drain_timeout   = 30
+max_waiters     = 256
+max_connections = 512
+
+# connection pool of the database, shared by all the managers (and the
+# credential vaults) using it. The connections are checked before use
+db_pool = {
+    "pool_size"     : 10,
+    "max_overflow"  : 20,
+    "pool_pre_ping" : True
+}
+
+# the warm workers are forked by a fork server, which imports this script
+# (as __mp_main__) in each one of them
+if __name__ == "__main__":
+    print("Orchestrator Service")
+    orch_srv = OrchestratorService(
+        address           = "127.0.0.1",
+        db_conn_str       = "sqlite:///share/orch/orchestrator.sqlite",
+        smtp_crd          = smtp_crd,
+        max_workers       = max_workers,
+        warm_workers      = warm_workers,
+        worker_max_tasks  = worker_max_tasks,
+        worker_max_memory = worker_max_memory,
+        artifact_dir      = artifact_dir,
+        inline_threshold  = inline_threshold,
+        log_dir           = log_dir,
+        threads           = threads,
+        request_timeout   = request_timeout,
+        drain_timeout     = drain_timeout,
+        max_waiters       = max_waiters,
+        max_connections   = max_connections,
+        db_pool           = db_pool
+    )
+    # change the logging ini file and log file paths
+    orch_srv.setLogger(FileLogger("Orchestrator",config_file="etc/orch/logging.ini",logfile="logs/orch/orchestrator.log"))
+
+    orch_srv.start()
+    time.sleep(1)
+    orch_srv.wait()
+    orch_srv.stopService()
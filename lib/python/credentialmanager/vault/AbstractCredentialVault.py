@@ -4,7 +4,7 @@ import json
 import base64
 import ast
 import time
-from sqlalchemy import create_engine, and_, inspect
+from sqlalchemy import and_, inspect
 from sqlalchemy.sql import func
 from sqlalchemy import *
 from datetime import datetime
@@ -14,6 +14,7 @@ from ..Credential import *
 from ..exceptions import *
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
+from .SharedEngine import getSharedEngine
 
 class AbstractCredentialVault(BasicLogger):
     
@@ -58,7 +59,7 @@ class AbstractCredentialVault(BasicLogger):
         
     def __init__(self, owner, conn_str, table_name="credentials"):
         print("credential vault",conn_str)
-        self.__engine = create_engine(conn_str,  connect_args={'timeout': 1})
+        self.__engine = getSharedEngine(conn_str)
         self.__table_name = table_name
         self.__id = "default"
         self.__owner = owner
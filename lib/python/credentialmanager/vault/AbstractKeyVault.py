@@ -1,7 +1,7 @@
 # Abstract Key Vault module for Credential Manager
 
 import base64
-from sqlalchemy import create_engine, and_, inspect
+from sqlalchemy import and_, inspect
 from sqlalchemy.sql import func, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import *
@@ -12,6 +12,7 @@ from ..EncryptionKey import *
 from ..ProtectedEncryptionKey import *
 import pandas as pd
 from sqlalchemy.pool import StaticPool
+from .SharedEngine import getSharedEngine
 
 class AbstractKeyVault(BasicLogger):
     """
@@ -19,7 +20,7 @@ class AbstractKeyVault(BasicLogger):
     """
 
     def __init__(self, owner, conn_str, table_name="key_chain"):
-        self.__engine = create_engine(conn_str, connect_args={'timeout': 1})
+        self.__engine = getSharedEngine(conn_str)
         self.__table_name = table_name
         self.__id = "default"
         self.__owner = owner
@@ -8,13 +8,14 @@ import jsonpickle
 import time
 import traceback
 
-from sqlalchemy import create_engine, and_, inspect
+from sqlalchemy import and_, inspect
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.sql import func
 from sqlalchemy import *
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.sql import text
 from sqlalchemy.pool import StaticPool
+from .SharedEngine import getSharedEngine
 
 from Crypto.Hash import SHA256
 from Crypto.Signature import pkcs1_15
@@ -26,22 +27,24 @@ from ..ShamirImplementation import *
 class AbstractSharedTokenVault(BasicLogger):
 
     def query(self, sql):
-        e = None
+        error = None
         for retry in range(0,10):
             try:
                 result = self.getEngine().execute(sql).fetchall() 
                 return result
             except Exception as e:
+                error = e
+                # retry operation. The engine is shared with the other
+                # vaults and managers, its pool is kept: a connection lost
+                # is invalidated by sqlalchemy and replaced on the next use
                 time.sleep(10)
-                self.getEngine().dispose()
-                self.__engine = create_engine(self.conn_str, connect_args={'timeout': 1})
 
-        raise RuntimeError("CredentialMananger:Could not execute Query: %s: %s" % (sql,e))
+        raise RuntimeError("CredentialMananger:Could not execute Query: %s: %s" % (sql,error))
 
     def __init__(self, owner, conn_str, table_name="shared_token"):
         print("shared token vault:",conn_str)
         self.__shamir = ShamirImplementation()
-        self.__engine = create_engine(conn_str, connect_args={'timeout': 1})
+        self.__engine = getSharedEngine(conn_str)
         self.__table_name = table_name
         self.conn_str = conn_str
         self.__id = "default"
@@ -0,0 +1,23 @@
+# Shared engines for the vaults
+#
+# the vaults of the same connection string (and the orchestrator managers,
+# when the orchestrator is available) share one engine and its connection
+# pool, from the engine registry of the orchestrator. Without it, every
+# vault creates its own engine as before.
+#
+# The sqlite engines of the registry wait busy_timeout seconds (30) for a
+# locked database, in place of the timeout of 1 second the vaults gave to
+# their own engines (connect_args timeout). The engines of the other
+# databases check their connections before using them (pool_pre_ping).
+
+from sqlalchemy import create_engine
+
+try:
+    from orch.base.db.EngineRegistry import EngineRegistry
+except ImportError:
+    EngineRegistry = None
+
+def getSharedEngine(conn_str):
+    if EngineRegistry is not None:
+        return EngineRegistry.getEngine(conn_str)
+    return create_engine(conn_str, connect_args={'timeout': 1})
@@ -0,0 +1,58 @@
+# AsyncOrchestrator
+#
+# asyncio variant of the Orchestrator api client. It has the same methods
+# as Orchestrator, as coroutines: each call runs the Orchestrator one in a
+# pool of max_concurrency threads sharing a pooled client, so many calls
+# gathered together (e.g. hundreds of getExecutionStatus) run concurrently
+# over at most max_concurrency keep alive connections.
+#
+#   async with AsyncOrchestrator() as orch:
+#       status = await asyncio.gather(*[ orch.getExecutionStatus(i) for i in ids ])
+
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import inspect
+import asyncio
+
+from .Orchestrator import Orchestrator
+
+class AsyncOrchestrator(object):
+    def __init__(self, api_url="http://127.0.0.1:8020", max_concurrency=32):
+        self.api_url         = api_url
+        self.max_concurrency = max_concurrency
+        self.client          = Orchestrator(api_url, pooled=True, pool_size=max_concurrency)
+        self.executor        = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="orch-client")
+
+    async def call(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return "<AsyncOrchestrator[api_url=%s, max_concurrency=%d]>" % (self.api_url, self.max_concurrency)
+
+def asyncMethod(name):
+    fn = getattr(Orchestrator, name)
+
+    @functools.wraps(fn)
+    async def method(self, *args, **kwargs):
+        return await self.call(getattr(self.client, name), *args, **kwargs)
+    return method
+
+def mirrorMethods(cls):
+    # the public methods of Orchestrator as coroutines
+    for name, fn in inspect.getmembers(Orchestrator, inspect.isfunction):
+        # generators (e.g. iterExecutionList) are not mirrored
+        if not name.startswith("_") and name not in vars(cls) and not inspect.isgeneratorfunction(fn):
+            setattr(cls, name, asyncMethod(name))
+
+mirrorMethods(AsyncOrchestrator)
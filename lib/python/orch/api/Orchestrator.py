@@ -4,6 +4,7 @@ import dill
 import base64
 import urllib
 from datetime import datetime
+import time
 
 from .Execution import Execution
 from .ScheduledEvent import ScheduledEvent
@@ -14,13 +15,14 @@ from .Executor import *
 from ..base import AbstractApiClient
 from ..exceptions import PipelineExecutionError, ImplementationIsNotAFunction, APIResponseError, PipelineSchedulingError
 from ..orchestrator import RemoteProcedureNotificationSubscriber
+from ..pipelinemanager import PipelineDAG
 
 from credentialmanager.Credential import Credential
 from credentialmanager.EncryptionKey import EncryptionKey
 
 class Orchestrator(AbstractApiClient):
-    def __init__(self, api_url="http://127.0.0.1:8020"):
-        super().__init__(api_url)
+    def __init__(self, api_url="http://127.0.0.1:8020", pooled=True, pool_size=10):
+        super().__init__(api_url, pooled=pooled, pool_size=pool_size)
         
     def status(self):
         return self.get("/")
@@ -129,7 +131,7 @@ class Orchestrator(AbstractApiClient):
 
     def register(self, name,fn, token_list=None, new_version =False):
         
-        if not isfunction(fn):
+        if not isfunction(fn) and not isinstance(fn, PipelineDAG):
             raise ImplementationIsNotAFunction(fn)
         
         post_data = {
@@ -188,6 +190,60 @@ class Orchestrator(AbstractApiClient):
         
         raise RuntimeError("you must provide a valid execution_id")
 
+    def getExecutionOutput(self, exec_id, offset=0, error_offset=0):
+        # output of an execution from the given offsets. While it runs, call
+        # it again with the returned offsets to get the new lines
+        if exec_id is not None:
+            try:
+                return self.get("/execution/%s/output?offset=%d&error_offset=%d" % (exec_id, offset, error_offset))
+            except Exception as e:
+                raise e
+
+        raise RuntimeError("you must provide a valid execution_id")
+
+    def waitExecution(self, exec_id, timeout=None, poll_timeout=50, max_retries=10, max_backoff=30):
+        # blocks until the execution finishes (or timeout seconds) with long
+        # polls of at most poll_timeout seconds (the service caps them at its
+        # max_wait_timeout). Returns the last response, with the execution
+        # state and whether it is done. A busy service (503) is asked again
+        # after 1, 2, 4... seconds (at most max_backoff), max_retries times
+        # in a row before raising its error
+        if exec_id is None:
+            raise RuntimeError("you must provide a valid execution_id")
+
+        start   = time.time()
+        retries = 0
+        while True:
+            wait = poll_timeout
+            if timeout is not None:
+                wait = max(0, min(poll_timeout, timeout - (time.time() - start)))
+
+            try:
+                response = self.get("/execution/%s/wait?timeout=%s" % (exec_id, wait), timeout=wait + 30)
+            except APIResponseError as e:
+                # the service has max_waiters waiting requests already
+                if not str(e).startswith("503:") or retries >= max_retries:
+                    raise e
+
+                backoff = min(2 ** retries, max_backoff)
+                if timeout is not None:
+                    left = timeout - (time.time() - start)
+                    if left <= 0:
+                        raise e
+                    backoff = min(backoff, left)
+
+                retries += 1
+                time.sleep(backoff)
+                continue
+
+            retries = 0
+
+            if response is None or response["code"] != 202 or response["done"]:
+                return response
+
+            if timeout is not None and time.time() - start >= timeout:
+                return response
+
     def getExecution(self, exec_id):
         if exec_id is not None:
             try:
@@ -205,6 +261,36 @@ class Orchestrator(AbstractApiClient):
         
         raise RuntimeError("you must provide a valid execution_id")
      
+    def getExecutionsStatus(self, exec_ids, return_value=False):
+        # status of many executions in one request. Returns a dict
+        # execution id -> status (None for the unknown ones)
+        if exec_ids is not None:
+            json_response = self.post("/execution/status", json={ "ids": list(exec_ids), "return_value": return_value })
+            if json_response["code"] == 204:
+                status = { exec_id: None for exec_id in json_response["missing"] }
+                status.update(json_response["executions"])
+                return status
+            else:
+                raise APIResponseError("%d:%s" % (json_response["code"],json_response["status"]))
+
+        raise RuntimeError("you must provide a list of execution ids")
+
+    def getExecutions(self, exec_ids):
+        # executions of many ids in one request, in the order of exec_ids
+        # (None for the unknown ones)
+        if exec_ids is not None:
+            exec_ids = list(exec_ids)
+            json_response = self.post("/execution/get", json={ "ids": exec_ids })
+            if json_response["code"] == 204:
+                executions = {}
+                for sobj in json_response["executions"]:
+                    executions[sobj["uuid"]] = Execution.fromJson(dill.loads(base64.b64decode(sobj["sobj"].encode("utf8"))))
+                return [ executions.get(exec_id) for exec_id in exec_ids ]
+            else:
+                raise APIResponseError("%d:%s" % (json_response["code"],json_response["status"]))
+
+        raise RuntimeError("you must provide a list of execution ids")
+
     def cancelExecution(self, exec_id):
         if exec_id is not None:
             try:
@@ -225,12 +311,36 @@ class Orchestrator(AbstractApiClient):
     def notifyExecution(self, target):
         print("notifyExecution only works when executing within the orchestrator")
         
-    def getExecutionList(self, name):
-        if name is not None or name!="":
+    def getExecutionList(self, name, after_id=None, limit=None, since=None, until=None, fields=None, order=None):
+        # executions of a pipeline. With after_id, limit, since, until
+        # (datetimes, on the creation), fields or order ("asc" or "desc") a
+        # page of them is returned, sorted by id (use the id of the last one
+        # as after_id for the next page). With fields, the executions are
+        # dicts with those fields (plus id and uuid)
+        if name is not None and name!="":
+            params = {}
+            if after_id is not None:
+                params["after_id"] = after_id
+            if limit is not None:
+                params["limit"] = limit
+            if since is not None:
+                params["since"] = since.isoformat()
+            if until is not None:
+                params["until"] = until.isoformat()
+            if fields is not None:
+                params["fields"] = ",".join(fields)
+            if order is not None:
+                params["order"] = order
+
             try:
-                response = self.get("/execution/%s/list" % name)
+                uri = "/execution/%s/list" % name
+                if len(params) > 0:
+                    uri = "%s?%s" % (uri, urllib.parse.urlencode(params))
+                response = self.get(uri)
                 obj_list = []
                 if response["code"]==204:
+                    if fields is not None:
+                        return response["executions"]
                     for sobj in response["executions"]:
                         obj = Execution.fromJson(dill.loads(base64.b64decode(sobj["sobj"].encode("utf8"))))
                         obj_list.append(obj)
@@ -244,8 +354,20 @@ class Orchestrator(AbstractApiClient):
             except Exception as e:
                 raise e
         
-        raise RuntimeError("you must provide a valid execution_id")
-    
+        raise RuntimeError("you must provide a valid pipeline name")
+
+    def iterExecutionList(self, name, page_size=500, **kw_args):
+        # all the executions of a pipeline, fetched page by page
+        after_id = None
+        while True:
+            page = self.getExecutionList(name, after_id=after_id, limit=page_size, **kw_args)
+            for execution in page:
+                yield execution
+            if len(page) < page_size:
+                break
+            last = page[-1]
+            after_id = last["id"] if isinstance(last, dict) else last.id
+
     def getRunningExecutions(self):
         try:
             response = self.get("/execution/running")
@@ -320,15 +442,74 @@ class Orchestrator(AbstractApiClient):
         except Exception as e:
             raise e
                 
-    def scheduleAt(self, pipeline, label = None, trigger_time=datetime.now().strftime("%H:%M:%S"), recurrency=None, tags=[]):
+    def map(self, pipeline, iterable, chunksize=1, max_parallel=None, gather="list", kw_args={}, local=True, cores=1, timeout=None, wait=True):
+        # runs the pipeline for each item of iterable (called as
+        # pipeline(item, **kw_args)) as child executions of one execution,
+        # chunksize items per child and at most max_parallel children at the
+        # same time. Returns the results in the order of the items (gather
+        # "frame": as a DataFrame). When items fail, raises a PipelineMapError
+        # with the results (None for the failed items) and the errors.
+        # wait=False returns the execution id (see getMapResult)
         post_data = {
             "name"         : pipeline.name,
-            "label"        : label,
-            "trigger_time" : trigger_time,
-            "recurrency"   : recurrency,
-            "tags"         : tags,
-            "args"         : jsonpickle.encode( pipeline.getArguments() ),
-            "kwargs"       : jsonpickle.encode( pipeline.getKeywordArguments() )
+            "version"      : pipeline.version,
+            "items"        : jsonpickle.encode( list(iterable) ),
+            "kwargs"       : jsonpickle.encode( kw_args ),
+            "chunksize"    : chunksize,
+            "max_parallel" : max_parallel,
+            "gather"       : gather,
+            "asJob"        : local,
+            "cores"        : cores
+        }
+
+        json_response = self.post("/execute/map",json=post_data)
+        if json_response["code"] != 201:
+            raise PipelineExecutionError(json_response)
+
+        exec_id = json_response["execution_id"]
+        if not wait:
+            return exec_id
+
+        response = self.waitExecution(exec_id, timeout)
+        if response is None or response["code"] != 202 or not response["done"]:
+            raise PipelineExecutionError("map execution %s not finished: %s" % (exec_id, response))
+
+        return self.getMapResult(exec_id)
+
+    def getMapResult(self, exec_id):
+        # results of a finished map execution (see map)
+        status = self.getExecutionsStatus([exec_id], return_value=True)[exec_id]
+        if status is None:
+            raise RuntimeError("unknown execution %s" % exec_id)
+
+        value = None
+        if status["return_value"] is not None:
+            value = dill.loads(base64.b64decode(status["return_value"]))
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    def getExecutionNodes(self, exec_id):
+        # state and timing of the child executions of a DAG or map execution
+        if exec_id is not None:
+            json_response = self.get("/execution/%s/nodes" % exec_id)
+            if json_response["code"] == 204:
+                return json_response["nodes"]
+            raise APIResponseError("%d:%s" % (json_response["code"],json_response["status"]))
+
+        raise RuntimeError("you must provide a valid execution_id")
+
+    def scheduleAt(self, pipeline, label = None, trigger_time=datetime.now().strftime("%H:%M:%S"), recurrency=None, tags=[], misfire_policy="once", misfire_grace=None):
+        post_data = {
+            "name"           : pipeline.name,
+            "label"          : label,
+            "trigger_time"   : trigger_time,
+            "recurrency"     : recurrency,
+            "tags"           : tags,
+            "misfire_policy" : misfire_policy,
+            "misfire_grace"  : misfire_grace,
+            "args"           : jsonpickle.encode( pipeline.getArguments() ),
+            "kwargs"         : jsonpickle.encode( pipeline.getKeywordArguments() )
         }
         
         print(post_data)
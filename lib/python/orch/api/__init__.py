@@ -4,3 +4,4 @@ from .Pipeline import *
 from .ScheduledEvent import *
 from .RemoteProcedureNotification import *
 from .Orchestrator import *
+from .AsyncOrchestrator import *
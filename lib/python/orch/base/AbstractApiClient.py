@@ -2,18 +2,41 @@ import json
 import jsonpickle
 import requests
 
+from requests.adapters import HTTPAdapter
 from requests.exceptions import *
 
 from ..exceptions import APIResponseError
 
+# pooled clients send their requests through a requests.Session, reusing
+# up to pool_size keep alive connections to the api (safe to be shared
+# among threads). Non pooled clients open a connection per request
+
 class AbstractApiClient(object):
-    def __init__(self, api_url = "http://127.0.0.1:8020"):
-        self.api_url = api_url
+    def __init__(self, api_url = "http://127.0.0.1:8020", pooled=True, pool_size=10):
+        self.api_url   = api_url
+        self.pooled    = pooled
+        self.pool_size = pool_size
+        self.session   = None
+
+        if pooled:
+            self.session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
+
+    def getHttp(self):
+        if self.session is not None:
+            return self.session
+        return requests
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
         
     def get(self,uri, timeout=180):
         url = "%s%s" % (self.api_url,uri)
         try:
-            response = requests.get(url, timeout=timeout)
+            response = self.getHttp().get(url, timeout=timeout)
             if response.status_code >= 200 and response.status_code <=499:
                 json_response = response.json()
                 return json_response
@@ -38,7 +61,7 @@ class AbstractApiClient(object):
     def post(self,uri,timeout=180, **kwargs):
         url = "%s%s" % (self.api_url,uri)
         try:
-            response = requests.post(url,timeout=timeout,**kwargs)
+            response = self.getHttp().post(url,timeout=timeout,**kwargs)
 
             if response.status_code >= 200 and response.status_code <=499:
                 json_response = response.json()
@@ -3,21 +3,40 @@ from flask import Flask, render_template, request, jsonify
 from threading import Thread, Condition
 from werkzeug.serving import make_server
 
+from .PooledWSGIServer import PooledWSGIServer
 from ..loggers import NullLogger
 
+# threads=None serves the api with the werkzeug development server (one
+# request at a time). With a number of threads, the requests are served by
+# a PooledWSGIServer with keep alive connections and request_timeout, and
+# stopService drains the requests in flight (up to drain_timeout seconds).
+# Long polls and streams call startWaiting to leave their thread slot while
+# they wait (at most max_waiters of them). At most max_connections
+# connections are open
+
 class AbstractApiService(Thread):
-    def __init__(self,api_name, bind_addr="127.0.0.1", bind_port=8010, templates=None):
+    def __init__(self,api_name, bind_addr="127.0.0.1", bind_port=8010, templates=None, threads=None, keep_alive=True, request_timeout=15, drain_timeout=30, max_waiters=256, max_connections=512):
         Thread.__init__(self)
         self.api_name  = api_name
         self.bind_addr = bind_addr
         self.bind_port = bind_port
 
+        self.threads         = threads
+        self.keep_alive      = keep_alive
+        self.request_timeout = request_timeout
+        self.drain_timeout   = drain_timeout
+        self.max_waiters     = max_waiters
+        self.max_connections = max_connections
+        self.draining        = False
+
         self.api       = Flask(api_name, template_folder=templates)
         self.srv       = None
         self.logger    = NullLogger()
         self.running   = False
 
         self.cv        = None
+
+        self.api.before_request(self.rejectWhileDraining)
         
     def __del__(self):
         self.stopService()
@@ -42,9 +61,36 @@ class AbstractApiService(Thread):
             with self.cv:
                 self.cv.notifyAll()
     
+    def rejectWhileDraining(self):
+        # new requests are refused once the service is stopping
+        if self.draining:
+            return jsonify({"code": 503, "status": "draining"}), 503
+
+    def startWaiting(self):
+        # the current request leaves its slot of the PooledWSGIServer for
+        # the rest of it. False when max_waiters requests are waiting
+        start = request.environ.get("orch.wait")
+        if start is None:
+            return True
+        return start()
+
+    def startDraining(self):
+        self.draining = True
+        if isinstance(self.srv, PooledWSGIServer):
+            self.srv.startDraining()
+
+    def getServerStatus(self):
+        if isinstance(self.srv, PooledWSGIServer):
+            return self.srv.getStatus()
+        return { "threads": None }
+
     def stopService(self):
         if self.srv is not None:
+            self.startDraining()
             self.srv.shutdown()
+            if isinstance(self.srv, PooledWSGIServer):
+                if not self.srv.drain(self.drain_timeout):
+                    self.logger.warning("%s : %d requests still running after %s seconds" % (self.api_name, self.srv.getInFlight(), self.drain_timeout))
 
         # wait for thread to finish
         self.join()
@@ -54,7 +100,11 @@ class AbstractApiService(Thread):
         
     def run(self):
         self.logger.info("%s : starting" % self.api_name)
-        self.srv  = make_server(self.bind_addr, self.bind_port, self.api)
+        if self.threads is None:
+            self.srv  = make_server(self.bind_addr, self.bind_port, self.api)
+        else:
+            self.logger.info("%s : serving with %d threads" % (self.api_name, self.threads))
+            self.srv  = PooledWSGIServer(self.bind_addr, self.bind_port, self.api, threads=self.threads, request_timeout=self.request_timeout, keep_alive=self.keep_alive, max_waiters=self.max_waiters, max_connections=self.max_connections)
         self.ctx  = self.api.app_context()
         self.running = True
         self.srv.serve_forever()
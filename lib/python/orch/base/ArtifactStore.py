@@ -0,0 +1,74 @@
+# ArtifactStore
+#
+# content addressed store of blobs in a local directory. A blob is stored
+# compressed (zlib, fast level by default) under the sha256 of its
+# content, in a two levels hash layout (ab/cd/abcd...), so the same
+# content is stored once. Blobs are written to a temporary file and
+# renamed, so a reader never sees a partial blob.
+
+import hashlib
+import tempfile
+import zlib
+import os
+
+class ArtifactStore(object):
+
+    prefix = "sha256:"
+
+    def __init__(self, root="./artifacts", compress_level=1):
+        self.root           = root
+        self.compress_level = compress_level
+
+        if not os.path.exists(self.root):
+            os.makedirs(self.root, exist_ok=True)
+
+    def getPath(self, ref):
+        if not ref.startswith(self.prefix):
+            raise RuntimeError("invalid artifact reference: %s" % ref)
+        digest = ref[len(self.prefix):]
+        return os.path.join(self.root, digest[0:2], digest[2:4], digest)
+
+    def put(self, data):
+        # stores data (bytes) and returns its reference
+        if isinstance(data, str):
+            data = data.encode("utf8")
+
+        ref  = self.prefix + hashlib.sha256(data).hexdigest()
+        path = self.getPath(ref)
+
+        if os.path.exists(path):
+            return ref
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(zlib.compress(data, self.compress_level))
+            os.replace(tmp_path, path)
+        except Exception as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise e
+
+        return ref
+
+    def get(self, ref):
+        path = self.getPath(ref)
+        if not os.path.exists(path):
+            raise RuntimeError("artifact %s not found" % ref)
+
+        with open(path, "rb") as f:
+            return zlib.decompress(f.read())
+
+    def exists(self, ref):
+        return os.path.exists(self.getPath(ref))
+
+    def delete(self, ref):
+        path = self.getPath(ref)
+        if os.path.exists(path):
+            os.remove(path)
+            return True
+        return False
+
+    def __repr__(self):
+        return "<ArtifactStore[root=%s]>" % self.root
@@ -0,0 +1,294 @@
+# PooledWSGIServer
+#
+# werkzeug WSGI server running at most `threads` requests at the same time,
+# so a slow request (e.g. a long poll or a large execution list) does not
+# block the others, while the service is not overloaded by many clients.
+# Each connection is served by its own (daemon) thread, which takes one of
+# the worker slots only while running a request: idle keep alive
+# connections do not hold a worker. Connections idle or stalled for more
+# than request_timeout seconds are closed.
+#
+# A request blocked for long (a long poll or a stream of events) leaves
+# its worker slot by calling environ["orch.wait"]() and goes on as one of
+# at most max_waiters waiting requests (each one is still a thread of its
+# own). The call returns False when there are max_waiters already, the
+# request keeps its slot then and should be refused.
+#
+# At most max_connections connections are open (each one has its thread).
+# Beyond it, an idle keep alive connection is closed to make room, or the
+# new connection is answered with 503 and closed when there is none.
+#
+# The keep alive relies on werkzeug internals (run_wsgi, the rfile of the
+# handler and its Connection: close header), see the pinned version in
+# requirements.txt and tests/test_PooledWSGIServer.py.
+#
+# werkzeug closes the connection after every response, since the request
+# body left unread by the application would be taken as the next request
+# (and it discards whatever the client sent after the response). Here the
+# unread body is drained (up to max_drain bytes) and the connection is
+# kept, otherwise it is closed as werkzeug does.
+#
+# drain() waits for the connections in flight once the server was
+# shutdown, so a stop does not cut the responses being served. Keep alive
+# connections waiting for their next request are closed right away.
+
+from threading import Thread, Condition, BoundedSemaphore
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+from werkzeug.wsgi import LimitedStream
+import socket
+
+class RequestInput(object):
+    # input of the connection seen by werkzeug while serving a request.
+    # Nothing is read from it once the connection is kept alive, so the
+    # next request is left in the socket
+
+    def __init__(self, handler, rfile):
+        self.handler = handler
+        self.rfile   = rfile
+
+    def read(self, size=-1):
+        if self.handler.kept:
+            return b""
+        return self.rfile.read(size)
+
+    def readline(self, size=-1):
+        if self.handler.kept:
+            return b""
+        return self.rfile.readline(size)
+
+class PooledRequestHandler(WSGIRequestHandler):
+
+    max_drain = 1 << 16
+    # headers and body are sent in separate writes, on a kept connection
+    # nagle and the delayed acks would hold every response
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        # socket timeout for reading the requests (and idle keep alive)
+        self.timeout = self.server.request_timeout
+        self.handled = 0
+        super().setup()
+
+    def handle_one_request(self):
+        if self.handled > 0:
+            # waiting for the next request of a keep alive connection
+            if not self.server.setIdle(self.connection, True):
+                self.close_connection = True
+                return
+        self.in_wsgi = False
+        self.kept    = False
+        self.body    = None
+        super().handle_one_request()
+        self.handled += 1
+        # no more requests on this connection while draining
+        if self.server.draining:
+            self.close_connection = True
+
+    def run_wsgi(self):
+        rfile = self.rfile
+        self.rfile = RequestInput(self, rfile)
+        self.waiting = False
+        try:
+            self.server.workers.acquire()
+            self.server.requestStarted()
+            try:
+                super().run_wsgi()
+            finally:
+                if self.waiting:
+                    self.server.stopWaiting()
+                else:
+                    self.server.requestFinished()
+                    self.server.workers.release()
+        finally:
+            self.rfile = rfile
+
+    def startWaiting(self):
+        # the rest of the request runs without its worker slot
+        if not self.waiting:
+            self.waiting = self.server.startWaiting()
+        return self.waiting
+
+    def make_environ(self):
+        environ = super().make_environ()
+        self.in_wsgi = True
+        environ["orch.wait"] = self.startWaiting
+        # the body is read through a limited stream, so the remaining
+        # (unread) bytes are known
+        length = environ.get("CONTENT_LENGTH")
+        if not environ.get("wsgi.input_terminated") and length:
+            try:
+                self.body = LimitedStream(self.rfile, int(length))
+                environ["wsgi.input"] = self.body
+            except ValueError:
+                pass
+        return environ
+
+    def keepAlive(self):
+        if not self.server.keep_alive or self.server.draining or self.close_connection:
+            return False
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            return False
+        if self.body is not None and not self.body.is_exhausted:
+            try:
+                self.body.read(self.max_drain)
+            except Exception:
+                return False
+            return self.body.is_exhausted
+        return True
+
+    def send_header(self, key, value):
+        # werkzeug always sends Connection: close
+        if self.in_wsgi and key.lower() == "connection" and value.lower() == "close" and self.keepAlive():
+            self.kept = True
+            return
+        super().send_header(key, value)
+
+    def log_error(self, format, *args):
+        # an idle keep alive connection timing out is not an error
+        if self.handled > 0 and format.startswith("Request timed out"):
+            return
+        super().log_error(format, *args)
+
+    def parse_request(self):
+        # the request line has been read
+        self.server.setIdle(self.connection, False)
+        return super().parse_request()
+
+    def finish(self):
+        self.server.setIdle(self.connection, False)
+        super().finish()
+
+class PooledWSGIServer(BaseWSGIServer):
+
+    multithread = True
+
+    rejection = b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+
+    def __init__(self, host, port, app, threads=16, request_timeout=15, keep_alive=True, max_waiters=256, max_connections=512):
+        self.threads         = threads
+        self.max_waiters     = max_waiters
+        self.max_connections = max_connections
+        self.request_timeout = request_timeout
+        self.keep_alive      = keep_alive
+        self.draining        = False
+        self.in_flight       = 0
+        self.running         = 0
+        self.waiting         = 0
+        self.rejected        = 0
+        self.idle            = set()
+        self.cv              = Condition()
+        self.workers         = BoundedSemaphore(threads)
+
+        handler = type("PooledRequestHandler", (PooledRequestHandler,), {
+            "protocol_version" : "HTTP/1.1" if keep_alive else "HTTP/1.0"
+        })
+        super().__init__(host, port, app, handler=handler)
+
+    def process_request(self, request, client_address):
+        with self.cv:
+            if self.in_flight >= self.max_connections and not self.closeIdle():
+                self.rejected += 1
+                self.reject(request)
+                return
+            self.in_flight += 1
+        t = Thread(target=self.process_request_thread, args=(request, client_address), name="orch-http", daemon=True)
+        t.start()
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self.cv:
+                self.in_flight -= 1
+                self.cv.notify_all()
+
+    def closeIdle(self):
+        # closes one idle keep alive connection (cv held). Its thread ends
+        # right away, the connection replacing it is counted meanwhile
+        if len(self.idle) == 0:
+            return False
+        conn = self.idle.pop()
+        try:
+            conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        return True
+
+    def reject(self, request):
+        try:
+            request.settimeout(1)
+            request.sendall(self.rejection)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def requestStarted(self):
+        with self.cv:
+            self.running += 1
+
+    def requestFinished(self):
+        with self.cv:
+            self.running -= 1
+
+    def startWaiting(self):
+        # a running request leaves its worker slot. False when there are
+        # max_waiters waiting requests already
+        with self.cv:
+            if self.waiting >= self.max_waiters:
+                return False
+            self.waiting += 1
+            self.running -= 1
+        self.workers.release()
+        return True
+
+    def stopWaiting(self):
+        with self.cv:
+            self.waiting -= 1
+
+    def setIdle(self, conn, idle):
+        # returns False when an idle connection must be closed (draining)
+        with self.cv:
+            if not idle:
+                self.idle.discard(conn)
+                return True
+            if self.draining:
+                return False
+            self.idle.add(conn)
+            return True
+
+    def getInFlight(self):
+        with self.cv:
+            return self.in_flight
+
+    def startDraining(self):
+        with self.cv:
+            self.draining = True
+            for conn in self.idle:
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            self.idle = set()
+
+    def drain(self, timeout=None):
+        # waits for the connections being served. Returns True when drained
+        self.startDraining()
+        with self.cv:
+            return self.cv.wait_for(lambda: self.in_flight == 0, timeout)
+
+    def getStatus(self):
+        with self.cv:
+            return {
+                "threads"         : self.threads,
+                "running"         : self.running,
+                "waiting"         : self.waiting,
+                "max_waiters"     : self.max_waiters,
+                "connections"     : self.in_flight,
+                "max_connections" : self.max_connections,
+                "rejected"        : self.rejected,
+                "idle"            : len(self.idle),
+                "draining"        : self.draining
+            }
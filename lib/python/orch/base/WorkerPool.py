@@ -0,0 +1,306 @@
+# WorkerPool
+#
+# pool of pre-forked worker processes for running functions locally
+# without paying the process (and imports) startup on every call. Each
+# worker receives dill serialized (fn, args, kwargs) over a pipe, runs
+# the call and sends the result back through the same pipe.
+#
+# the workers are forked by a fork server (a single threaded process
+# started with the preload modules imported), not by the orchestrator,
+# whose threads and locks would be copied in a broken state. So nothing
+# of the orchestrator process is inherited: the calls and their
+# arguments are sent in full (mapped objects with their columns only).
+# As with the spawn start method, each worker imports the main script, which
+# must start the orchestrator under if __name__ == "__main__".
+#
+# a worker is recycled (it exits and a new one is forked when needed)
+# after max_tasks calls or when its memory (rss) goes beyond max_memory
+# bytes.
+
+import multiprocessing as mp
+import multiprocessing.util
+from threading import Condition
+import importlib
+import types
+import sys
+import signal
+import psutil
+import dill
+import io
+import os
+
+from ._async import TimeoutError
+
+def isImportable(obj):
+    # True when obj can be found by module and qualified name
+    module = sys.modules.get(getattr(obj, "__module__", None))
+    if module is None or module.__name__ in ("__main__", "builtins"):
+        return False
+    try:
+        target = module
+        for name in obj.__qualname__.split("."):
+            target = getattr(target, name)
+        return target is obj
+    except Exception:
+        return False
+
+def rebuildMappedObject(cls, attrs):
+    # transient copy of a sqlalchemy mapped object
+    from sqlalchemy.orm import configure_mappers
+    from sqlalchemy.orm.instrumentation import manager_of_class
+    configure_mappers()
+    obj = manager_of_class(cls).new_instance()
+    obj.__dict__.update(attrs)
+    return obj
+
+class WorkerPickler(dill.Pickler):
+
+    def reducer_override(self, obj):
+        if isinstance(obj, (type, types.FunctionType)):
+            # classes and functions are sent by reference when they can be
+            # imported. dill does not find the nested ones, nor the ones
+            # whose module is shadowed by the package re-exports (e.g.
+            # orch.base.WorkerPool) and sends them by value
+            if isImportable(obj):
+                return obj.__qualname__
+            return NotImplemented
+
+        # mapped objects (e.g. the pipeline) are sent with their columns,
+        # without the sqlalchemy state and the objects attached to them
+        # (e.g. the catalog of a pipeline)
+        if hasattr(obj, "_sa_instance_state"):
+            from sqlalchemy import inspect
+            columns = [ a.key for a in inspect(type(obj)).column_attrs ]
+            attrs = { k: v for k, v in obj.__dict__.items() if k in columns }
+            return (rebuildMappedObject, (type(obj), attrs))
+        return NotImplemented
+
+def dumps(obj):
+    buf = io.BytesIO()
+    WorkerPickler(buf).dump(obj)
+    return buf.getvalue()
+
+STOP = b"stop"
+
+def worker_main(conn, preload, max_tasks, max_memory):
+    # worker process loop. runs in the forked child
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    for module in preload:
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            print("worker: unable to preload %s: %s" % (module, e))
+
+    process = psutil.Process(os.getpid())
+    parent_pid = os.getppid()
+    tasks = 0
+    while True:
+        try:
+            # exit on the stop message or when the parent is gone
+            if not conn.poll(1):
+                if os.getppid() != parent_pid:
+                    break
+                continue
+            payload = conn.recv_bytes()
+        except (EOFError, OSError):
+            break
+
+        if payload == STOP:
+            break
+
+        try:
+            fn, args, kwargs = dill.loads(payload)
+            result = ("ok", fn(*args, **kwargs))
+        except BaseException as e:
+            result = ("error", e)
+
+        tasks += 1
+        recycle = max_tasks is not None and tasks >= max_tasks
+        if max_memory is not None and process.memory_info().rss > max_memory:
+            recycle = True
+
+        try:
+            data = dumps((result, recycle))
+        except Exception as e:
+            data = dumps((("error", RuntimeError("unable to serialize the result: %s" % e)), recycle))
+
+        try:
+            conn.send_bytes(data)
+        except (EOFError, OSError):
+            break
+
+        if recycle:
+            break
+
+    conn.close()
+
+class WorkerPool(object):
+
+    # a forked worker process and its end of the pipe
+    class Worker(object):
+        def __init__(self, process, conn):
+            self.process    = process
+            self.conn       = conn
+
+        def isAlive(self):
+            return self.process.is_alive()
+
+        def close(self):
+            try:
+                self.conn.send_bytes(STOP)
+                self.conn.close()
+            except Exception:
+                pass
+            self.process.join(1)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+
+    def __init__(self, size=None, max_tasks=100, max_memory=None, preload=["numpy","pandas"]):
+        if size is None:
+            size = os.cpu_count()
+
+        self.size        = size
+        self.max_tasks   = max_tasks
+        self.max_memory  = max_memory
+        self.preload     = preload
+
+        # the fork server imports the preload modules once, the workers
+        # forked by it have them already
+        self.ctx         = mp.get_context("forkserver")
+        self.ctx.set_forkserver_preload(["orch.pipelinemanager"] + list(preload))
+        self.cv          = Condition()
+        self.idle        = []
+        self.total       = 0
+        self.running     = True
+
+        # the workers must be stopped before multiprocessing joins them at exit
+        mp.util.Finalize(None, self.stop, exitpriority=10)
+
+    def __spawn(self):
+        parent_conn, child_conn = self.ctx.Pipe()
+        process = self.ctx.Process(
+            target = worker_main,
+            name   = "orch-worker",
+            args   = (child_conn, self.preload, self.max_tasks, self.max_memory)
+        )
+        # not daemonic, so pipelines can start their own processes
+        process.start()
+        child_conn.close()
+        return WorkerPool.Worker(process, parent_conn)
+
+    def prefork(self, n=None):
+        # fork the workers in advance
+        if n is None:
+            n = self.size
+        with self.cv:
+            while self.total < min(n, self.size):
+                self.idle.append(self.__spawn())
+                self.total += 1
+
+    def acquire(self):
+        with self.cv:
+            while self.running:
+                while len(self.idle) > 0:
+                    worker = self.idle.pop()
+                    if worker.isAlive():
+                        return worker
+                    # dead worker
+                    worker.close()
+                    self.total -= 1
+
+                if self.total < self.size:
+                    self.total += 1
+                    return self.__spawn()
+
+                self.cv.wait()
+
+        raise RuntimeError("WorkerPool: pool is stopped")
+
+    def release(self, worker, recycle=False):
+        with self.cv:
+            if recycle or not self.running or not worker.isAlive():
+                worker.close()
+                self.total -= 1
+            else:
+                self.idle.append(worker)
+            self.cv.notify()
+
+    def submit(self, fn, *args, **kwargs):
+        # sends the call to a worker. the returned WorkerCall gets the result
+        payload = dumps((fn, args, kwargs))
+
+        worker = self.acquire()
+        try:
+            worker.conn.send_bytes(payload)
+        except Exception as e:
+            self.release(worker, recycle=True)
+            raise e
+
+        return WorkerCall(self, worker)
+
+    def getStatus(self):
+        with self.cv:
+            return {
+                "size"  : self.size,
+                "total" : self.total,
+                "idle"  : len(self.idle)
+            }
+
+    def stop(self):
+        with self.cv:
+            self.running = False
+            for worker in self.idle:
+                worker.close()
+                self.total -= 1
+            self.idle = []
+            self.cv.notify_all()
+
+class WorkerCall(object):
+    # handler of a call running in a pool worker (same interface as the
+    # ProcessAsyncCall one: wait, get and cancel)
+
+    def __init__(self, pool, worker):
+        self.pool      = pool
+        self.worker    = worker
+        self.done      = False
+        self.cancelled = False
+        self.Result    = None
+
+    def wait(self, timeout=None):
+        if not self.done and not self.worker.conn.poll(timeout):
+            raise TimeoutError()
+        return True
+
+    def get(self, default=None):
+        if self.done:
+            return self.Result
+
+        recycle = True
+        self.Result = default
+        try:
+            (status, value), recycle = dill.loads(self.worker.conn.recv_bytes())
+            if status == "ok":
+                self.Result = value
+            else:
+                print("error calling function in worker:", value)
+        except (EOFError, OSError) as e:
+            if not self.cancelled:
+                print("worker process finished unexpectedly:", e)
+        finally:
+            self.done = True
+            self.pool.release(self.worker, recycle=recycle)
+
+        return self.Result
+
+    def cancel(self, sig=signal.SIGTERM):
+        # kill the worker (and its children). the pool forks a new one
+        self.cancelled = True
+        try:
+            parent = psutil.Process(self.worker.process.pid)
+            for process in parent.children(recursive=True):
+                process.send_signal(sig)
+            parent.send_signal(sig)
+        except psutil.NoSuchProcess:
+            pass
@@ -10,13 +10,17 @@ from ._async import *
 from .worker import Worker
 from .AbstractJob import AbstractJob
 from .argument import Argument
+from .sharedresult import SharedResult
+from .PooledWSGIServer import PooledWSGIServer
 from .AbstractApiService import AbstractApiService
 from .AbstractApiClient import AbstractApiClient
 from .PersistentDict import PersistentDict
+from .ArtifactStore import ArtifactStore
 
 from .slurm import SlurmController
 from .slurm import *
 from .LocalJob import *
+from .WorkerPool import WorkerPool, WorkerCall
 
 # Decorators
 
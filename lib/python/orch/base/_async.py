@@ -2,6 +2,7 @@
 # with threads and processes
 #
 import multiprocessing as mp
+import multiprocessing.connection
 import jsonpickle
 import ctypes
 import random 
@@ -10,6 +11,7 @@ from .argument import Argument
 import psutil
 import signal
 import threading
+import dill
 import os
 
 import sys, traceback
@@ -207,6 +209,132 @@ class ProcessAsyncCall(object):
 
         return
     
+class PipeProcessAsyncCall(object):
+    # lightweight backend of ProcessAsync. The result is sent back with
+    # dill through a pipe and the pool of each function is bounded with a
+    # semaphore local to this process, so no Manager (server process) and
+    # no proxied objects are needed per call.
+
+    semaphores = {}
+    sem_lock   = threading.Lock()
+
+    def __init__(self, fnc, pool_size, callback = None):
+        self.single    = False
+
+        if pool_size is None:
+            self.single    = True
+            self.pool_size = 1
+        else:
+            self.pool_size = pool_size
+
+        self.Callable  = fnc
+        self.Callback  = callback
+        self.Result    = None
+        self.proc      = None
+        self.conn      = None
+        self.done      = threading.Event()
+        self.semaphore = None
+
+    def getSemaphore(self):
+        with self.sem_lock:
+            if self.Callable.__name__ not in self.semaphores:
+                self.semaphores[self.Callable.__name__] = threading.BoundedSemaphore(self.pool_size)
+            return self.semaphores[self.Callable.__name__]
+
+    def __call__(self, *args, **kwargs):
+        if not self.single:
+            # blocks until the pool of this function has a free slot
+            self.semaphore = self.getSemaphore()
+            self.semaphore.acquire()
+
+        try:
+            self.conn, child_conn = mp.Pipe(duplex=False)
+            self.proc = mp.Process(target = self.run, name = self.Callable.__name__, args = (child_conn,) + args, kwargs = kwargs)
+            self.proc.start()
+            child_conn.close()
+        except Exception as e:
+            if self.semaphore is not None:
+                self.semaphore.release()
+            raise e
+
+        threading.Thread(target = self.collect, name = "collect-%s" % self.Callable.__name__, daemon = True).start()
+        return self
+
+    def collect(self):
+        # reads the result (before joining, a large result would block the
+        # child on the pipe) and frees the pool slot when the process ends
+        data = None
+        try:
+            # the process sentinel is also checked, since other forked
+            # processes may hold the pipe open and EOF would never come
+            ready = mp.connection.wait([self.conn, self.proc.sentinel])
+            if self.conn in ready or self.conn.poll(0):
+                data = self.conn.recv_bytes()
+        except (EOFError, OSError):
+            pass
+        finally:
+            self.conn.close()
+            self.proc.join()
+            if self.semaphore is not None:
+                self.semaphore.release()
+            self.Result = data
+            self.done.set()
+
+    def cancel(self, sig=signal.SIGTERM):
+        # signal the process of this call (and its children)
+        try:
+            parent = psutil.Process(self.proc.pid)
+        except (psutil.NoSuchProcess, AttributeError, ValueError):
+            return
+        for process in parent.children(recursive=True):
+            process.send_signal(sig)
+        parent.send_signal(sig)
+
+    def then(self, fn):
+        response = self.get()
+        return fn(*response)
+
+    def wait(self, timeout = None):
+        if not self.done.wait(timeout):
+            raise TimeoutError()
+        return True
+
+    def get(self, default = None):
+        self.wait()
+
+        try:
+            self.proc.close()
+        except:
+            pass
+
+        ret = default
+        if self.Result is not None:
+            try:
+                ret = dill.loads(self.Result)
+            except Exception as e:
+                print("error decoding result value",e)
+
+        self.Result = None
+        return ret
+
+    def run(self, conn, *args, **kwargs):
+        try:
+            result = self.Callable(*args, **kwargs)
+            try:
+                packed_result = dill.dumps(result)
+            except Exception as e:
+                print("error calling function:",e)
+                raise e
+
+            conn.send_bytes(packed_result)
+            conn.close()
+
+            if self.Callback:
+                self.Callback(result)
+        except Exception as e:
+            print(e, args, kwargs)
+            raise e
+
 class ThreadAsyncCall(object):
     def __init__(self, fnc, callback = None):
         self.Callable = fnc
@@ -234,7 +362,7 @@ class ThreadAsyncCall(object):
         self.Thread.join()
         del self.Thread
 
-        while isinstance(self.Result, (ThreadAsyncCall, ProcessAsyncCall, Argument)):
+        while isinstance(self.Result, (ThreadAsyncCall, ProcessAsyncCall, PipeProcessAsyncCall, Argument)):
             self.Result = self.Result.get()
            
         if isinstance(self.Result, RuntimeError):
@@ -259,27 +387,49 @@ class ThreadAsyncMethod(object):
     def __call__(self, *args, **kwargs):
         return ThreadAsyncCall(self.Callable, self.Callback)(*args, **kwargs)
 
+# ProcessAsync backends. "pipe" (default) is the lightweight one, "manager"
+# the original one based on a multiprocessing Manager
+process_async_backends = {
+    "pipe"    : PipeProcessAsyncCall,
+    "manager" : ProcessAsyncCall
+}
+
+process_async_backend = "pipe"
+
+def setProcessAsyncBackend(backend):
+    global process_async_backend
+    if backend not in process_async_backends:
+        raise RuntimeError("unknown ProcessAsync backend: %s" % backend)
+    process_async_backend = backend
+
 class ProcessAsyncMethod(object):
-    def __init__(self, fnc, callback=None, pool_size = 1):
+    def __init__(self, fnc, callback=None, pool_size = 1, backend = None):
         self.pool_size = pool_size
         self.Callable  = fnc 
         self.Callback  = callback
+        self.backend   = backend
 
     def __call__(self, *args, **kwargs):
-        return ProcessAsyncCall(self.Callable, self.pool_size, self.Callback)(*args, **kwargs)
+        backend = self.backend if self.backend is not None else process_async_backend
+        return process_async_backends[backend](self.Callable, self.pool_size, self.Callback)(*args, **kwargs)
 
-def ProcessAsync(arg = None, callback = None):
+def ProcessAsync(arg = None, callback = None, backend = None):
     if isinstance(arg, int):
         def ProcessAsyncWrapper(fnc = None,  callback = None):
             if fnc == None:
                 def AddAsyncCallback(fnc):
-                    return ProcessAsyncMethod(fnc, callback, arg)
+                    return ProcessAsyncMethod(fnc, callback, arg, backend)
                 return AddAsyncCallback
             else:
-                return ProcessAsyncMethod(fnc, callback, arg)
+                return ProcessAsyncMethod(fnc, callback, arg, backend)
         return ProcessAsyncWrapper
+    elif arg is None:
+        # @ProcessAsync(backend=...)
+        def AddAsyncBackend(fnc):
+            return ProcessAsyncMethod(fnc, callback, None, backend)
+        return AddAsyncBackend
     else:
-        return ProcessAsyncMethod(arg, callback, None)
+        return ProcessAsyncMethod(arg, callback, None, backend)
 
 def Async(fnc = None, callback = None):
     if fnc == None:
@@ -1,6 +1,8 @@
 # DataBaseBackend 
 
-import time
+import os
+import weakref
+import threading
 import sqlalchemy as sal
 from sqlalchemy import create_engine, and_
 from sqlalchemy.sql import func
@@ -9,18 +11,110 @@ from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm import defer
 from sqlalchemy.orm import undefer
+from sqlalchemy.orm import load_only
+from sqlalchemy.orm import object_session
+from sqlalchemy.exc import IntegrityError
+from .DataBaseWriter import DataBaseWriter
+from .EngineRegistry import EngineRegistry
 
+# schema versions
+#
+# the models declare the version of their schema (__schema_version__,
+# 1 when not given) and the migrations to reach it (__migrations__, a dict
+# version -> sql statement or function(connection)). The version of each
+# table is kept in the schema_versions table; tables created before it
+# existed are at version 1. On initialize, an existing table gets the
+# missing columns, the pending migrations (in order) and the missing
+# indexes declared by the model. When the rows break a unique index, the
+# initialization fails; the models remove their duplicated rows in a
+# migration (see deduplicate) before the index is created.
+
+schema_metadata = sal.MetaData()
+schema_versions = sal.Table("schema_versions", schema_metadata,
+    sal.Column("table_name", sal.String, primary_key=True),
+    sal.Column("version", sal.Integer, nullable=False),
+    sal.Column("changed", sal.DateTime(timezone=True), server_default=func.now())
+)
+
+def deduplicate(table_name, *columns):
+    # migration keeping the first row (lowest id) of the ones with the same
+    # values in columns. Rows with nulls in them are not duplicates
+    not_null = " AND ".join([ "%s IS NOT NULL" % c for c in columns ])
+    statement = text("DELETE FROM %s WHERE %s AND id NOT IN (SELECT MIN(id) FROM %s WHERE %s GROUP BY %s)" % (
+        table_name, not_null, table_name, not_null, ", ".join(columns)
+    ))
+    def migration(conn):
+        removed = conn.execute(statement).rowcount
+        if removed > 0:
+            print("removed %d duplicated rows of table %s" % (removed, table_name))
+    return migration
 
 class DataBaseBackend(object):
+
+    # all the backends, for releasing the sessions of a thread
+    backends = weakref.WeakSet()
+
+    # the backends of the same connection string share one engine (see
+    # EngineRegistry) and, for sqlite files, one writer thread committing
+    # the saved objects in batches (see DataBaseWriter)
+    batch_writes = True
+    max_batch    = 200
+
+    writers      = {}   # connection string -> writer
+    writers_lock = threading.Lock()
         
     def __init__(self, conn_str):
+        self.conn_str = conn_str
         try:
-            self.engine = sal.create_engine(conn_str)
+            self.engine, self.writer = DataBaseBackend.getSharedEngine(conn_str)
         except Exception as e:
             raise e
             
         session_factory = sessionmaker(self.engine,expire_on_commit=False)
         self.session = scoped_session(session_factory)
+        DataBaseBackend.backends.add(self)
+
+    @classmethod
+    def getSharedEngine(cls, conn_str):
+        engine = EngineRegistry.getEngine(conn_str)
+        if not cls.batch_writes or not EngineRegistry.isSqliteFile(conn_str):
+            return engine, None
+
+        with cls.writers_lock:
+            writer = cls.writers.get(conn_str)
+            # a forked process (or a disposed engine) needs a new writer. The
+            # backends using the previous one keep it
+            if writer is None or writer.pid != os.getpid() or writer.engine is not engine:
+                writer = DataBaseWriter(engine, max_batch=cls.max_batch)
+                writer.start()
+                cls.writers[conn_str] = writer
+            return engine, writer
+
+    @classmethod
+    def afterFork(cls):
+        # the writer threads (and a lock held by one of them) are not
+        # in the forked process
+        cls.writers      = {}
+        cls.writers_lock = threading.Lock()
+
+    def getWriter(self):
+        # a backend created before a fork takes the writer of this process
+        if self.writer is not None and self.writer.pid != os.getpid():
+            _, self.writer = DataBaseBackend.getSharedEngine(self.conn_str)
+        return self.writer
+
+    def getWriterStatus(self):
+        if self.getWriter() is None:
+            return None
+        return self.writer.getStatus()
+
+    @classmethod
+    def releaseSessions(cls):
+        # removes the sessions of the current thread in all the backends.
+        # the ones kept for loading deferred columns would otherwise be
+        # released by another thread when the current one ends
+        for backend in list(cls.backends):
+            backend.session.remove()
             
     def getEngine(self):
         return self.engine
@@ -47,11 +141,98 @@ class DataBaseBackend(object):
             try:
                 # Implement the creation
                 p_object.metadata.create_all(engine)
+                self.setSchemaVersion(p_object, getattr(p_object, "__schema_version__", 1))
             except Exception as e:
                 print(e)
                 return False
             return True
         
+        # table already exists. bring it to the current schema
+        try:
+            self.migrate(p_object)
+        except Exception as e:
+            print(e)
+            return False
+
+        return True
+
+    def getSchemaVersion(self, p_object):
+        schema_metadata.create_all(self.getEngine(), tables=[schema_versions])
+        with self.getEngine().connect() as conn:
+            version = conn.execute(
+                sal.select(schema_versions.c.version).where(schema_versions.c.table_name == p_object.__tablename__)
+            ).scalar()
+        if version is None:
+            return 1
+        return version
+
+    def setSchemaVersion(self, p_object, version):
+        schema_metadata.create_all(self.getEngine(), tables=[schema_versions])
+        table_name = p_object.__tablename__
+        with self.getEngine().begin() as conn:
+            updated = conn.execute(
+                schema_versions.update().where(schema_versions.c.table_name == table_name).values(version=version, changed=func.now())
+            ).rowcount
+            if updated == 0:
+                conn.execute(schema_versions.insert().values(table_name=table_name, version=version))
+
+    def migrate(self, p_object):
+        self.addMissingColumns(p_object)
+
+        current = self.getSchemaVersion(p_object)
+        target  = getattr(p_object, "__schema_version__", 1)
+        migrations = getattr(p_object, "__migrations__", {})
+        for version in range(current + 1, target + 1):
+            if version in migrations:
+                print("migrating table %s to version %d" % (p_object.__tablename__, version))
+                with self.getEngine().begin() as conn:
+                    migration = migrations[version]
+                    if callable(migration):
+                        migration(conn)
+                    else:
+                        conn.execute(text(migration))
+            self.setSchemaVersion(p_object, version)
+
+        self.addMissingIndexes(p_object)
+        return True
+
+    def addMissingColumns(self, p_object):
+        engine = self.getEngine()
+        ins = sal.inspect(engine)
+        table_name = p_object.__tablename__
+        current_cols = [ c["name"] for c in ins.get_columns(table_name) ]
+
+        for col in p_object.__table__.columns:
+            if col.name not in current_cols:
+                col_type = col.type.compile(dialect=engine.dialect)
+                print("adding column %s to table %s" % (col.name, table_name))
+                with engine.begin() as conn:
+                    conn.execute(text("ALTER TABLE %s ADD COLUMN %s %s" % (table_name, col.name, col_type)))
+
+        return True
+
+    def addMissingIndexes(self, p_object):
+        # unique constraints are declared as unique indexes, which (unlike
+        # constraints) can be added to an existing sqlite table. A plain
+        # index left in place of a unique one is created again
+        engine = self.getEngine()
+        ins = sal.inspect(engine)
+        table_name = p_object.__tablename__
+        current_idx = { i["name"] : bool(i["unique"]) for i in ins.get_indexes(table_name) }
+
+        for index in p_object.__table__.indexes:
+            if index.name in current_idx:
+                if current_idx[index.name] == bool(index.unique):
+                    continue
+                print("replacing index %s of table %s" % (index.name, table_name))
+                index.drop(bind=engine)
+            else:
+                print("adding index %s to table %s" % (index.name, table_name))
+            try:
+                index.create(bind=engine)
+            except IntegrityError as e:
+                raise RuntimeError("duplicated values in table %s, unique index %s can not be created: %s" % (table_name, index.name, e.orig))
+
         return True
     
     def query(self, query):
@@ -95,6 +276,31 @@ class DataBaseBackend(object):
         
         return rs
         
+    def getObjectsPage(self, p_obj, *args, order_by=None, limit=None, only_cols=None, defer_cols=[], **kwargs):
+        # objects matching the filters, sorted by order_by and up to limit
+        # of them. only_cols loads just those columns (the others, as the
+        # defer_cols, are loaded when accessed)
+        sess = self.session()
+        rs = None
+        try:
+            q = sess.query(p_obj).filter(*args).filter_by(**kwargs)
+            if only_cols is not None:
+                q = q.options(load_only(*only_cols))
+            elif len(defer_cols)>0:
+                q = q.options(*[defer(x) for x in defer_cols])
+            if order_by is not None:
+                q = q.order_by(order_by)
+            if limit is not None:
+                q = q.limit(limit)
+            rs = q.all()
+        except Exception as e:
+            raise e
+        finally:
+            if only_cols is None and len(defer_cols)==0:
+                self.session.remove()
+
+        return rs
+
     def refreshObject(self, p_obj):
         sess = self.session()
         try:
@@ -129,31 +335,38 @@ class DataBaseBackend(object):
             
         return rs
     
+    def detach(self, p_obj):
+        # objects handed to the writer are taken out of the session of this
+        # thread (e.g. kept for loading deferred columns), as committing
+        # them here would do
+        sess = object_session(p_obj)
+        if sess is not None and not sess.info.get("writer", False):
+            sess.expunge(p_obj)
+
     def saveObject(self, p_obj):
+        writer = self.getWriter()
+        if writer is not None:
+            self.detach(p_obj)
+            return writer.save(p_obj)
+
+        # the lock is waited for by the busy timeout
         sess = self.session()
         try:
             sess.add(p_obj)
-            e = None
-            done=False
-            for r in range(0,10):
-                try:
-                    sess.commit()
-                    done=True
-                    break
-                except Exception as e:
-                    print("retry commit")
-                    time.sleep(5)
-            if not done:
-                raise RuntimeError("could not save object to database:",e)
-                
+            sess.commit()
         except Exception as e:
-            raise e
+            raise RuntimeError("could not save object to database:",e)
         finally:    
             self.session.remove()
     
         return True
 
     def destroyObject(self, p_obj):
+        writer = self.getWriter()
+        if writer is not None:
+            self.detach(p_obj)
+            return writer.destroy(p_obj)
+
         sess = self.session()
         try:
             sess.delete(p_obj)
@@ -164,3 +377,5 @@ class DataBaseBackend(object):
             self.session.remove()
 
         return True
+
+os.register_at_fork(after_in_child=DataBaseBackend.afterFork)
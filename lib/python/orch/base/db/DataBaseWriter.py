@@ -0,0 +1,149 @@
+# DataBaseWriter
+#
+# single writer of a database. The objects saved (or destroyed) by the
+# backends sharing an engine are handed to this thread, which commits all
+# the ones waiting in one transaction (group commit), so concurrent
+# executions do not fight for the sqlite lock and the database is synced
+# once per batch instead of once per object. The callers wait for the
+# commit of their object, so saving keeps its meaning.
+#
+# When the batch fails, it is rolled back and its objects are committed
+# one by one, so only the failing ones get the error. A caller waiting
+# more than write_timeout seconds for its commit gets an error.
+
+from threading import Thread, Event
+from sqlalchemy.orm import Session
+import sqlalchemy as sal
+import queue
+import os
+
+class WriteRequest(object):
+
+    def __init__(self, action, obj):
+        self.action = action      # "save" or "destroy"
+        self.obj    = obj
+        self.error  = None
+        self.done   = Event()
+        self.snapshot = None
+
+    def takeSnapshot(self):
+        # values of the columns, as a rollback expires the persistent
+        # objects and would discard the changes not committed yet
+        state = sal.inspect(self.obj)
+        self.snapshot = { a.key : state.dict[a.key] for a in state.mapper.column_attrs if a.key in state.dict }
+
+    def restoreSnapshot(self):
+        state = sal.inspect(self.obj)
+        for attr in state.mapper.column_attrs:
+            if attr.key in self.snapshot:
+                setattr(self.obj, attr.key, self.snapshot[attr.key])
+            else:
+                # e.g. the id given by the insert rolled back
+                state.dict.pop(attr.key, None)
+
+    def apply(self, sess):
+        if self.action == "save":
+            sess.add(self.obj)
+        else:
+            sess.delete(self.obj)
+
+    def finish(self, error=None):
+        self.error = error
+        self.done.set()
+
+class DataBaseWriter(Thread):
+
+    write_timeout = 120
+
+    def __init__(self, engine, max_batch=200):
+        super().__init__(name="orch-db-writer", daemon=True)
+        self.engine    = engine
+        self.max_batch = max_batch
+        self.pid       = os.getpid()
+        self.requests  = queue.Queue()
+        self.batches   = 0
+        self.written   = 0
+
+    def submit(self, action, obj):
+        # blocks until the object is committed. Raises the error of the commit
+        request = WriteRequest(action, obj)
+        self.requests.put(request)
+        if not request.done.wait(self.write_timeout):
+            raise RuntimeError("could not save object to database:", "no commit after %s seconds (writer of pid %d)" % (self.write_timeout, self.pid))
+        if request.error is not None:
+            raise RuntimeError("could not save object to database:", request.error)
+        return True
+
+    def save(self, obj):
+        return self.submit("save", obj)
+
+    def destroy(self, obj):
+        return self.submit("destroy", obj)
+
+    def nextBatch(self):
+        batch = [ self.requests.get() ]
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self.requests.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.nextBatch()
+            sess = Session(self.engine, expire_on_commit=False, info={ "writer" : True })
+            try:
+                self.write(sess, batch)
+            except Exception as e:
+                # never leave a caller waiting
+                for request in batch:
+                    if not request.done.is_set():
+                        request.finish(e)
+            finally:
+                # detach the objects, they are used by other threads
+                sess.close()
+
+    def write(self, sess, batch):
+        for request in batch:
+            request.takeSnapshot()
+        try:
+            for request in batch:
+                request.apply(sess)
+            sess.commit()
+        except Exception as e:
+            sess.rollback()
+            for request in batch:
+                request.restoreSnapshot()
+            sess.expunge_all()
+            if len(batch) == 1:
+                batch[0].finish(e)
+                return
+            print("error writing %d objects (%s). writing them one by one" % (len(batch), e))
+            for request in batch:
+                self.writeOne(sess, request)
+            return
+
+        self.batches += 1
+        self.written += len(batch)
+        for request in batch:
+            request.finish()
+
+    def writeOne(self, sess, request):
+        try:
+            request.apply(sess)
+            sess.commit()
+            self.written += 1
+            request.finish()
+        except Exception as e:
+            sess.rollback()
+            request.restoreSnapshot()
+            sess.expunge_all()
+            request.finish(e)
+
+    def getStatus(self):
+        return {
+            "pending" : self.requests.qsize(),
+            "batches" : self.batches,
+            "written" : self.written
+        }
@@ -0,0 +1,126 @@
+# EngineRegistry
+#
+# process wide registry of the database engines, one per connection
+# string, so the managers (and the credential vaults) using the same
+# database share its connection pool instead of opening one each.
+#
+# The pool options (pool_size, max_overflow, pool_pre_ping, pool_recycle)
+# are the defaults given by configure(), or the ones given for a
+# connection string. They apply to the engines created afterwards, of
+# database servers: sqlite keeps the default pool of sqlalchemy (opening a
+# connection is cheap, and the sessions kept for loading deferred columns
+# would hold pooled connections).
+#
+# sqlite files are tuned on connect: WAL journal (readers and the writer
+# do not block each other), synchronous NORMAL (synced at checkpoints, safe
+# with WAL) and a busy timeout (seconds) to wait for the lock instead of
+# failing with "database is locked".
+
+from threading import Lock
+from sqlalchemy import event
+from sqlalchemy.engine.url import make_url
+import sqlalchemy as sal
+import os
+
+class EngineRegistry(object):
+
+    pool_options = {
+        "pool_size"     : 10,
+        "max_overflow"  : 20,
+        "pool_pre_ping" : True,
+        "pool_recycle"  : -1
+    }
+
+    sqlite_journal_mode = "WAL"
+    sqlite_synchronous  = "NORMAL"
+    busy_timeout        = 30
+
+    engines        = {}   # connection string -> (pid, engine)
+    engine_options = {}   # connection string -> pool options
+    lock           = Lock()
+
+    @classmethod
+    def configure(cls, conn_str=None, **options):
+        # pool options of the engines (of conn_str, or all of them)
+        for key in options:
+            if key not in cls.pool_options:
+                raise RuntimeError("unknown pool option %s" % key)
+        with cls.lock:
+            if conn_str is None:
+                cls.pool_options = dict(cls.pool_options, **options)
+            else:
+                cls.engine_options[conn_str] = dict(cls.engine_options.get(conn_str, {}), **options)
+                if conn_str in cls.engines:
+                    print("engine of %s already created, pool options apply on dispose" % cls.maskUrl(conn_str))
+
+    @classmethod
+    def getEngine(cls, conn_str):
+        with cls.lock:
+            entry = cls.engines.get(conn_str)
+            if entry is not None:
+                if entry[0] == os.getpid():
+                    return entry[1]
+                # forked process: the connections belong to the parent
+                entry[1].dispose(close=False)
+
+            engine = cls.createEngine(conn_str)
+            cls.engines[conn_str] = (os.getpid(), engine)
+            return engine
+
+    @classmethod
+    def dispose(cls, conn_str=None):
+        # closes the pooled connections (of conn_str, or all of them). The
+        # engines are created again when used
+        with cls.lock:
+            for key in list(cls.engines.keys()):
+                if conn_str is None or key == conn_str:
+                    pid, engine = cls.engines.pop(key)
+                    if pid == os.getpid():
+                        engine.dispose()
+
+    @classmethod
+    def getOptions(cls, conn_str):
+        return dict(cls.pool_options, **cls.engine_options.get(conn_str, {}))
+
+    @classmethod
+    def createEngine(cls, conn_str):
+        url = make_url(conn_str)
+        if url.get_backend_name() != "sqlite":
+            return sal.create_engine(conn_str, **cls.getOptions(conn_str))
+
+        engine = sal.create_engine(conn_str)
+        if not cls.isSqliteFile(url):
+            # in memory databases are one per connection
+            return engine
+
+        @event.listens_for(engine, "connect")
+        def setPragmas(dbapi_conn, conn_record):
+            cursor = dbapi_conn.cursor()
+            # first, changing the journal mode waits for the lock
+            cursor.execute("PRAGMA busy_timeout=%d" % int(cls.busy_timeout * 1000))
+            if cls.sqlite_journal_mode is not None:
+                cursor.execute("PRAGMA journal_mode=%s" % cls.sqlite_journal_mode)
+            if cls.sqlite_synchronous is not None:
+                cursor.execute("PRAGMA synchronous=%s" % cls.sqlite_synchronous)
+            cursor.close()
+
+        return engine
+
+    @classmethod
+    def isSqliteFile(cls, url):
+        url = make_url(url)
+        database = url.database
+        if url.get_backend_name() != "sqlite" or database in (None, "", ":memory:"):
+            return False
+        return not database.startswith("file::memory:")
+
+    @classmethod
+    def maskUrl(cls, conn_str):
+        return repr(make_url(conn_str))
+
+    @classmethod
+    def getStatus(cls):
+        with cls.lock:
+            return {
+                cls.maskUrl(conn_str) : engine.pool.status() for conn_str, (pid, engine) in cls.engines.items() if pid == os.getpid()
+            }
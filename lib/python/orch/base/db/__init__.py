@@ -1,2 +1,4 @@
 
+from .EngineRegistry import *
+from .DataBaseWriter import *
 from .DataBaseBackend import *
@@ -0,0 +1,161 @@
+# SharedResult
+#
+# transport for large results between processes. The value is pickled
+# with protocol 5 and its large out-of-band buffers (numpy arrays, the
+# blocks of a pandas DataFrame, arrow buffers) are written once into a
+# memory mapped file (in /dev/shm when available). Only the small pickle
+# and the file layout cross the process boundary; the receiving process
+# maps the file and the buffers are used in place, without copying nor
+# re-encoding them.
+#
+# the file is unlinked when the value is got (the mapping lives as long
+# as the objects using it). Call destroy() to discard a result that will
+# not be got. Results created with a tag (the pid of the orchestrator and
+# the execution id) are discarded by tag when the receiving process never
+# gets them (e.g. a cancelled execution or a dead worker), and swept when
+# the process with that pid is gone.
+#
+# Arrow IPC (pyarrow) is not used: it only carries tables, while the
+# results are any python value, and converting a DataFrame to arrow
+# copies its blocks (and does not round trip every dtype and index).
+
+import tempfile
+import psutil
+import glob
+import mmap
+import dill
+import sys
+import io
+import os
+
+class BufferPickler(dill.Pickler):
+    # dill pickles numpy arrays with their in-band reduce. The protocol 5
+    # one is used instead, which gives their data as out-of-band buffers
+    def reducer_override(self, obj):
+        np = sys.modules.get("numpy")
+        if np is not None and type(obj) is np.ndarray:
+            return obj.__reduce_ex__(5)
+        return NotImplemented
+
+class SharedResult(object):
+
+    # offsets are aligned to cache lines
+    alignment = 64
+    prefix    = "orch-result-"
+
+    def __init__(self, value, threshold=1<<20, path=None, tag=None):
+        self.threshold = threshold
+        self.tag       = tag
+        self.layout    = []
+        self.size      = 0
+        self.path      = None
+        self.got       = False
+        self.value     = None
+
+        buffers = []
+        def out_of_band(buf):
+            # returning False keeps the buffer out of the pickle
+            if buf.raw().nbytes >= self.threshold:
+                buffers.append(buf)
+                return False
+            return True
+
+        f = io.BytesIO()
+        BufferPickler(f, protocol=5, buffer_callback=out_of_band).dump(value)
+        self.payload = f.getvalue()
+
+        if len(buffers) > 0:
+            self.write(buffers, path)
+
+    def write(self, buffers, path=None):
+        offset = 0
+        for buf in buffers:
+            nbytes = buf.raw().nbytes
+            self.layout.append((offset, nbytes))
+            offset += (nbytes + self.alignment - 1) // self.alignment * self.alignment
+        self.size = offset
+
+        if path is None:
+            prefix = self.prefix if self.tag is None else "%s%s-" % (self.prefix, self.tag)
+            fd, path = tempfile.mkstemp(prefix=prefix, dir=SharedResult.getDirectory())
+        else:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_RDWR, 0o600)
+
+        self.path = path
+        try:
+            os.ftruncate(fd, self.size)
+            with mmap.mmap(fd, self.size) as mm:
+                for buf, (offset, nbytes) in zip(buffers, self.layout):
+                    mm[offset:offset + nbytes] = buf.raw()
+        except Exception as e:
+            os.close(fd)
+            self.destroy()
+            raise e
+        os.close(fd)
+
+    def isShared(self):
+        return self.path is not None
+
+    def get(self):
+        if self.got:
+            return self.value
+
+        buffers = []
+        if self.path is not None:
+            fd = os.open(self.path, os.O_RDONLY)
+            try:
+                # private copy on write mapping: the buffers are writable
+                # and the file can be unlinked right away
+                mm = mmap.mmap(fd, self.size, access=mmap.ACCESS_COPY)
+            finally:
+                os.close(fd)
+                self.destroy()
+
+            view = memoryview(mm)
+            buffers = [ view[offset:offset + nbytes] for offset, nbytes in self.layout ]
+
+        self.value   = dill.loads(self.payload, buffers=buffers)
+        self.payload = None
+        self.got     = True
+        return self.value
+
+    def destroy(self):
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+    @classmethod
+    def getDirectory(cls):
+        if os.path.isdir("/dev/shm"):
+            return "/dev/shm"
+        return tempfile.gettempdir()
+
+    @classmethod
+    def discard(cls, tag):
+        # removes the files of the results created with tag, not got
+        removed = 0
+        for path in glob.glob(os.path.join(cls.getDirectory(), "%s%s-*" % (cls.prefix, glob.escape(tag)))):
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    @classmethod
+    def sweep(cls):
+        # removes the files of the results tagged with the pid of a process
+        # no longer running (left by an orchestrator stopped meanwhile)
+        removed = 0
+        for path in glob.glob(os.path.join(cls.getDirectory(), cls.prefix + "*")):
+            pid = os.path.basename(path)[len(cls.prefix):].split("-")[0]
+            if not pid.isdigit() or psutil.pid_exists(int(pid)):
+                continue
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def __repr__(self):
+        return "<SharedResult[size=%d, buffers=%d, path=%s]>" % (self.size, len(self.layout), self.path)
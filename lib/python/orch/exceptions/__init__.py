@@ -53,6 +53,17 @@ class PipelineExecutionError(Exception):
     def __init__(self,e):
         super(PipelineExecutionError, self).__init__(e)
 
+class PipelineMapError(Exception):
+    # some items of a map failed. results has the ones of all the items
+    # (None for the failed ones) and errors the message of each failed item
+    def __init__(self,results,errors):
+        super(PipelineMapError, self).__init__(results, errors)
+        self.results = results
+        self.errors  = errors
+
+    def __str__(self):
+        return "%d of %d items failed: %s" % (len(self.errors), len(self.results), "; ".join([ "item %s: %s" % (i, e) for i, e in sorted(self.errors.items()) ]))
+
 class PipelineSchedulingError(Exception):
     def __init__(self,e):
         super(PipelineSchedulingError, self).__init__(e)
@@ -9,19 +9,25 @@ from ..base import ActionListener
 from ..scheduler import SchedulerManager, ScheduledEvent
 from ..scheduler.Events import *
 from ..pipelinemanager.Events import *
-from ..pipelinemanager import PipelineManager
+from ..pipelinemanager import PipelineManager, FunctionCache
 from ..exceptions import MultipleActivePipelineRegistered, NoActivePipelineRegistered
 from ..exceptions import NoSuchKeyInDictionary, NoSuchDictionary
 from .OrchCredentialManager import OrchCredentialManager
 from .RemoteProcedureNotificationManager import RemoteProcedureNotificationManager
 from ..base import PersistentDict
+from ..base.db import EngineRegistry
 
 class OrchestratorManager(ActionListener):
-    def __init__(self,db_conn_str="sqlite:///orchestrator.sqlite", smtp_crd=None):
+    def __init__(self,db_conn_str="sqlite:///orchestrator.sqlite", smtp_crd=None, max_workers=None, max_per_pipeline=None, max_per_owner=None, max_dispatch_rate=None, warm_workers=False, worker_max_tasks=100, worker_max_memory=None, artifact_dir=None, inline_threshold=65536, log_dir=None, db_pool=None):
+        # pool options of the database engines, shared by all the managers
+        # (e.g. { "pool_size" : 10, "max_overflow" : 20, "pool_pre_ping" : True })
+        if db_pool is not None:
+            EngineRegistry.configure(**db_pool)
+
         self.owner_id = getpass.getuser()
         self.smtp_crd = smtp_crd
         self.schm = SchedulerManager(self,db_conn_str=db_conn_str)
-        self.pm   = PipelineManager(self,db_conn_str=db_conn_str)
+        self.pm   = PipelineManager(self,db_conn_str=db_conn_str, max_workers=max_workers, max_per_pipeline=max_per_pipeline, max_per_owner=max_per_owner, max_dispatch_rate=max_dispatch_rate, warm_workers=warm_workers, worker_max_tasks=worker_max_tasks, worker_max_memory=worker_max_memory, artifact_dir=artifact_dir, inline_threshold=inline_threshold, log_dir=log_dir)
 
         #self.ocm  = OrchCredentialManager(db_conn_str=db_conn_str)
         # use the default vaults for credential manager
@@ -35,6 +41,10 @@ class OrchestratorManager(ActionListener):
         self.db_conn_str = db_conn_str
 
         self.persistent_dict_list = {}
+
+        # now that the listeners are in place, fire the scheduled executions
+        # missed while the orchestrator was not running
+        self.schm.fireMissedEvents()
         
     def actionPerformed(self, evt):
         
@@ -49,7 +59,7 @@ class OrchestratorManager(ActionListener):
                 # in order ot allow executor to assocaite the execution to the 
                 # scheduled event who triggered the execution
                 pipeline.scheduled_event_uuid = evt.sch_evt_uuid
-                self.execute(pipeline, *evt.args, **evt.kw_args)
+                self.enqueue(pipeline, evt.args, evt.kw_args)
                 
             except Exception as e:
                 print("Error:",e)
@@ -119,6 +129,24 @@ class OrchestratorManager(ActionListener):
             raise Exception('Credentials or tokens for pipeline has been expired')
         return self.pm.execute(pipeline, *args, **kw_args)
 
+    def enqueue(self, pipeline, args=(), kw_args={}, priority=0, local=True, cores=1, partition=None, memory=None):
+        # same as execute, but through the persistent run queue
+        status = self.ocm.checkProcessExpiration(pipeline.name)
+        if status is False:
+            raise Exception('Credentials or tokens for pipeline has been expired')
+        return self.pm.enqueue(pipeline, args, kw_args, priority=priority, local=local, cores=cores, partition=partition, memory=memory)
+
+    def map(self, pipeline, items, kw_args={}, chunksize=1, max_parallel=None, gather="list", local=True, cores=1, partition=None, memory=None):
+        # runs the pipeline for each item, as child executions of one
+        # execution whose result is the list of their results
+        status = self.ocm.checkProcessExpiration(pipeline.name)
+        if status is False:
+            raise Exception('Credentials or tokens for pipeline has been expired')
+        return self.pm.map(pipeline, items, kw_args, chunksize=chunksize, max_parallel=max_parallel, gather=gather, local=local, cores=cores, partition=partition, memory=memory)
+
+    def getQueuedExecutions(self):
+        return self.pm.get_queued_executions()
+
     def createExecutor(self, pipeline, *args, **kw_args):
         return self.pm.createExecutor(pipeline, *args, **kw_args)   
  
@@ -131,21 +159,60 @@ class OrchestratorManager(ActionListener):
     def getRunningExecutions(self):
         return self.pm.get_running_executions()
         
+    def getExecutionPoolStatus(self):
+        return self.pm.executor_manager.getPoolStatus()
+
+    def getDataBaseStatus(self):
+        return {
+            "pools"   : EngineRegistry.getStatus(),
+            "writer"  : self.pm.executor_manager.getWriterStatus(),
+            "journal" : self.pm.executor_manager.getJournalStatus()
+        }
+
+    def setPipelineConcurrency(self, name, limit):
+        self.pm.executor_manager.setPipelineLimit(name, limit)
+
+    def setPipelineMemoization(self, name, enabled=True, ttl=None):
+        # executions of a deterministic pipeline with the arguments of a
+        # previous successful one finish with its result (kept ttl seconds)
+        self.pm.executor_manager.setPipelineMemoization(name, enabled, ttl)
+
+    def getMemoizationStats(self, name=None):
+        return self.pm.executor_manager.getMemoizationStats(name)
+
+    def getFunctionCacheStats(self):
+        return FunctionCache.getStats()
+
+    def getCatalogStatus(self):
+        return self.pm.catalog.getIndexStatus()
+
     def getExecution(self, exec_id):
         return self.pm.get_execution(exec_id)
+
+    def getExecutionNodes(self, exec_id):
+        # executions of the nodes of a DAG execution
+        return self.pm.executor_manager.getChildExecutions(exec_id)
     
+    def getExecutions(self, exec_ids, defer_cols=[]):
+        # executions of a list of ids in one query (uuid -> execution)
+        return self.pm.get_executions(exec_ids, defer_cols=defer_cols)
+
+    def waitExecution(self, exec_id, timeout=None):
+        # blocks until the execution finishes or the timeout expires and
+        # returns the execution state
+        return self.pm.wait_execution(exec_id, timeout)
+
     def cancelExecution(self, exec_id):
         return self.pm.cancel_execution(exec_id)
     
     def getLastExecution(self, name):
-        exec_list = self.getExecutionList(name)
+        exec_list = self.getExecutionList(name, order="desc", limit=1, fields=["uuid"])
         if len(exec_list)>0:
-            last_exec_id = exec_list[-1].getExecutionId()            
-            return self.getExecution(last_exec_id)
+            return self.getExecution(exec_list[0].uuid)
         return None
     
-    def scheduleAt(self, pipeline, label = None, trigger_time=datetime.now().strftime("%H:%M:%S"), recurrency=None, tags=[]):
-        return self.schm.scheduleAt(pipeline, label, trigger_time, recurrency, tags)
+    def scheduleAt(self, pipeline, label = None, trigger_time=datetime.now().strftime("%H:%M:%S"), recurrency=None, tags=[], misfire_policy="once", misfire_grace=None):
+        return self.schm.scheduleAt(pipeline, label, trigger_time, recurrency, tags, misfire_policy=misfire_policy, misfire_grace=misfire_grace)
     
     def cancelScheduledExecution(self, scheduled_event):
         if isinstance(scheduled_event, ScheduledEvent):
@@ -158,6 +225,9 @@ class OrchestratorManager(ActionListener):
     def getScheduledExecutionById(self, scheduled_event_id):
         return self.schm.getScheduledEventById(scheduled_event_id)
 
+    def getScheduledLoadForecast(self, hours=24, bucket="1h"):
+        return self.schm.getLoadForecast(hours=hours, bucket=bucket)
+
     def createNotification(self,label, data={}):
         return self.rpnm.createNotification(label,data=data)
         
@@ -196,6 +266,7 @@ class OrchestratorManager(ActionListener):
     def stop(self):
         print("stopping OrchestratorManager")
         self.schm.stop()
+        self.pm.stop()
         
     def putKey(self, key, passphrase=None):
         self.ocm.putKey(key, passphrase)
@@ -1,4 +1,4 @@
-from flask import request, jsonify
+from flask import request, jsonify, Response
 from multiprocessing import Process, Queue, Manager
 from datetime import date, datetime, timezone
 from tzlocal import get_localzone
@@ -9,9 +9,11 @@ import dill
 import base64
 import ast
 import json
+import math
 from datetime import datetime
 
 from ..base import AbstractApiService
+from ..base.db import DataBaseBackend
 from ..loggers import BasicLogger
 from ..scheduler import ScheduledEvent
 from ..exceptions import MultipleActivePipelineRegistered, NoActivePipelineRegistered,PipelineExecutionError
@@ -22,9 +24,16 @@ from .OrchestratorAccess import OrchestratorAccess
 from credentialmanager.exceptions import *
 
 class OrchestratorService(AbstractApiService):
-    def __init__(self,address="127.0.0.1", port=8020, db_conn_str="sqlite:///orchestrator.sqlite", smtp_crd=None):
-        super().__init__("OrchestratorService", bind_addr=address, bind_port=port)
+    def __init__(self,address="127.0.0.1", port=8020, db_conn_str="sqlite:///orchestrator.sqlite", smtp_crd=None, max_workers=None, max_per_pipeline=None, max_per_owner=None, max_dispatch_rate=None, warm_workers=False, worker_max_tasks=100, worker_max_memory=None, artifact_dir=None, inline_threshold=65536, log_dir=None, threads=None, keep_alive=True, request_timeout=15, drain_timeout=30, max_waiters=256, max_connections=512, db_pool=None):
+        super().__init__("OrchestratorService", bind_addr=address, bind_port=port, threads=threads, keep_alive=keep_alive, request_timeout=request_timeout, drain_timeout=drain_timeout, max_waiters=max_waiters, max_connections=max_connections)
         self.smtp_crd = smtp_crd
+        # below the usual 60s read timeout of proxies and clients
+        self.max_wait_timeout = 50
+        self.max_batch_size   = 5000
+        self.max_page_size    = 1000
+        self.list_args        = ("after_id", "limit", "since", "until", "fields", "order")
+        self.max_map_items    = 10000
+        self.manager_stopped  = False
         self.addRule("/","status",self.status)
         self.addRule("/stop","stop",self.stop)
         self.addRule("/register","register",self.register, methods=["POST"])
@@ -34,12 +43,18 @@ class OrchestratorService(AbstractApiService):
 
         # execution
         self.addRule("/execute","execute",self.execute, methods=["POST"])
+        self.addRule("/execute/map","execute_map",self.execute_map, methods=["POST"])
         self.addRule("/execution/running","running_executions",self.get_running_executions, methods=["GET"])
         self.addRule("/execution/getby","get_executions_by",self.get_executions_by, methods=["POST"])
+        self.addRule("/execution/status","executions_status",self.executions_status, methods=["POST"])
+        self.addRule("/execution/get","get_executions",self.get_executions, methods=["POST"])
         self.addRule("/execution/<exec_id>/status","execution_status",self.execution_status, methods=["GET"])
         self.addRule("/execution/<exec_id>/output","execution_output",self.get_execution_output, methods=["GET"])
+        self.addRule("/execution/<exec_id>/output/stream","stream_execution_output",self.stream_execution_output, methods=["GET"])
         self.addRule("/execution/<exec_id>/get","get_execution",self.get_execution, methods=["GET"])
+        self.addRule("/execution/<exec_id>/wait","wait_execution",self.wait_execution, methods=["GET"])
         self.addRule("/execution/<exec_id>/cancel","cancel_execution",self.cancel_execution, methods=["GET"])
+        self.addRule("/execution/<exec_id>/nodes","execution_nodes",self.execution_nodes, methods=["GET"])
         self.addRule("/execution/<pipeline_name>/list","get_execution_list",self.get_execution_list, methods=["GET"])
         self.addRule("/execution/<pipeline_name>/last","get_last_execution",self.get_last_execution, methods=["GET"])
         self.addRule("/execution/<pipeline_name>/scheduled","get_scheduled_executions",self.get_scheduled_executions, methods=["GET"])
@@ -90,16 +105,28 @@ class OrchestratorService(AbstractApiService):
         self.addRule("/pd/<dict_name>/get/<key>","pd_get",self.get_persistent_dict, methods=["GET"])
         self.addRule("/pd/<dict_name>/get/<key>/asJson","pd_get_as_json",self.get_persistent_dict_as_json, methods=["GET"])
 
-        self.manager = OrchestratorManager(db_conn_str=db_conn_str, smtp_crd=self.smtp_crd)
+        self.manager = OrchestratorManager(db_conn_str=db_conn_str, smtp_crd=self.smtp_crd, max_workers=max_workers, max_per_pipeline=max_per_pipeline, max_per_owner=max_per_owner, max_dispatch_rate=max_dispatch_rate, warm_workers=warm_workers, worker_max_tasks=worker_max_tasks, worker_max_memory=worker_max_memory, artifact_dir=artifact_dir, inline_threshold=inline_threshold, log_dir=log_dir, db_pool=db_pool)
         
         self.setLogger(BasicLogger("OrchestratorService"))
+
+        # requests are served by many threads, each one leaves its sessions
+        self.api.teardown_request(self.releaseSessions)
         
+    def releaseSessions(self, exc=None):
+        DataBaseBackend.releaseSessions()
+
     def status(self):
         now = datetime.now(timezone.utc).astimezone(get_localzone())
         return {
-            "code"   : 200,
-            "status" : "running",
-            "ts"     : now.isoformat()
+            "code"      : 200,
+            "status"    : "running",
+            "pool"      : self.manager.getExecutionPoolStatus(),
+            "server"    : self.getServerStatus(),
+            "db"        : self.manager.getDataBaseStatus(),
+            "memo"      : self.manager.getMemoizationStats(),
+            "functions" : self.manager.getFunctionCacheStats(),
+            "catalog"   : self.manager.getCatalogStatus(),
+            "ts"        : now.isoformat()
         }
     
     def register(self):
@@ -326,6 +353,32 @@ class OrchestratorService(AbstractApiService):
             "ts"     : now.isoformat()
         }
     
+    def executionStatus(self, executor, return_value=True):
+        status = {
+            "state"        : executor.state,
+            "start_ts"     : executor.start_ts,
+            "end_ts"       : executor.end_ts,
+            "exec_time"    : executor.exec_time.total_seconds() if executor.exec_time is not None else None,
+            "version"      : executor.version,
+            "creation"     : executor.creation,
+            "execution_id" : executor.uuid
+        }
+        if return_value:
+            value = executor.getEncoded("pipeline_ret")
+            if isinstance(value, bytes):
+                value = value.decode("utf8")
+            status["return_value"] = value
+        return status
+
+    def tooManyWaiters(self, exec_id, now):
+        # max_waiters long polls and streams are waiting, the client retries
+        return {
+            "code"         : 503,
+            "status"       : "too many waiting requests",
+            "execution_id" : exec_id,
+            "ts"           : now.isoformat()
+        }, 503
+
     def execution_status(self, exec_id):
         now = datetime.now(timezone.utc).astimezone(get_localzone())
         print("%s : getting status for execution id %s" % (now, exec_id))
@@ -333,20 +386,14 @@ class OrchestratorService(AbstractApiService):
         executor = self.manager.getExecution(exec_id)
         
         if executor is not None:
-            return {
+            status = {
                 "code"         : 202,
-                "status"       : "executor active",
-                "state"        : executor.state,
-                "start_ts"     : executor.start_ts,
-                "end_ts"       : executor.end_ts,
-                "exec_time"    : executor.exec_time,
-                "state"        : executor.state,
-                "return_value" : executor.pipeline_ret,
-                "version"      : executor.version,
-                "creation"     : executor.creation,
-                "execution_id" : exec_id,
-                "ts"           : now.isoformat()
+                "status"       : "executor active"
             }
+            status.update(self.executionStatus(executor))
+            status["execution_id"] = exec_id
+            status["ts"] = now.isoformat()
+            return status
         else:
             return {
                 "code"         : 310,
@@ -355,7 +402,118 @@ class OrchestratorService(AbstractApiService):
                 "execution_id" : exec_id,
                 "ts"           : now.isoformat()
             }
-    
+
+    def getExecutionIds(self):
+        # list of execution ids of a batch request, or the error response
+        now = datetime.now(timezone.utc).astimezone(get_localzone())
+        args = request.json
+        if args is None or not isinstance(args.get("ids"), list):
+            return None, {
+                "code"       : 501,
+                "status"     : "no execution ids given",
+                "executions" : [],
+                "ts"         : now.isoformat()
+            }
+        if len(args["ids"]) > self.max_batch_size:
+            return None, {
+                "code"       : 501,
+                "status"     : "too many execution ids (max %d)" % self.max_batch_size,
+                "executions" : [],
+                "ts"         : now.isoformat()
+            }
+        return args["ids"], None
+
+    def executions_status(self):
+        now = datetime.now(timezone.utc).astimezone(get_localzone())
+        exec_ids, error = self.getExecutionIds()
+        if error is not None:
+            return error
+
+        return_value = request.json.get("return_value", False)
+        self.logger.info("getting status for %d executions" % len(exec_ids))
+
+        # the status does not need the heavy columns
+        defer_cols = ["pipeline_fn", "pipeline_args", "output", "error"]
+        if not return_value:
+            defer_cols.append("pipeline_ret")
+        executors = self.manager.getExecutions(exec_ids, defer_cols=defer_cols)
+
+        return {
+            "code"       : 204,
+            "status"     : "ok",
+            "executions" : { exec_id: self.executionStatus(executor, return_value) for exec_id, executor in executors.items() },
+            "missing"    : [ exec_id for exec_id in exec_ids if exec_id not in executors ],
+            "ts"         : now.isoformat()
+        }
+
+    def wait_execution(self, exec_id):
+        # long poll: answers when the execution finishes or after timeout
+        # seconds (?timeout=N, between 0 and max_wait_timeout) with its
+        # state. It waits without a thread slot of the server, at most
+        # max_waiters long polls and streams at the same time (503 otherwise)
+        now = datetime.now(timezone.utc).astimezone(get_localzone())
+        print("%s : waiting for execution id %s" % (now, exec_id))
+
+        try:
+            timeout = float(request.args.get("timeout", self.max_wait_timeout))
+        except ValueError:
+            timeout = math.nan
+
+        if not math.isfinite(timeout):
+            return {
+                "code"         : 400,
+                "status"       : "invalid timeout %s" % request.args.get("timeout"),
+                "execution_id" : exec_id,
+                "ts"           : now.isoformat()
+            }, 400
+
+        timeout = max(0, min(timeout, self.max_wait_timeout))
+
+        if not self.startWaiting():
+            return self.tooManyWaiters(exec_id, now)
+
+        try:
+            state = self.manager.waitExecution(exec_id, timeout)
+        except Exception:
+            return {
+                "code"         : 310,
+                "status"       : "Executor does not exists",
+                "execution_id" : exec_id,
+                "ts"           : now.isoformat()
+            }
+
+        done = state in (4, 5, 6)
+        return {
+            "code"         : 202,
+            "status"       : "done" if done else "waiting",
+            "state"        : state,
+            "done"         : done,
+            "execution_id" : exec_id,
+            "ts"           : datetime.now(timezone.utc).astimezone(get_localzone()).isoformat()
+        }
+
+    def execution_nodes(self, exec_id):
+        # child executions of a DAG or map execution, with their state
+        now = datetime.now(timezone.utc).astimezone(get_localzone())
+
+        try:
+            nodes = self.manager.getExecutionNodes(exec_id)
+        except Exception as e:
+            return {
+                "code"         : 310,
+                "status"       : "%s : %s" % (type(e).__name__, e),
+                "execution_id" : exec_id,
+                "ts"           : now.isoformat()
+            }
+
+        return {
+            "code"         : 204,
+            "status"       : "ok",
+            "nodes"        : [ dict(self.executionStatus(node, return_value=False), node=node.node) for node in nodes ],
+            "execution_id" : exec_id,
+            "ts"           : now.isoformat()
+        }
+
     def get_execution(self, exec_id):
         now = datetime.now(timezone.utc).astimezone(get_localzone())
         print("%s : getting execution id %s" % (now, exec_id))
@@ -378,6 +536,29 @@ class OrchestratorService(AbstractApiService):
                 "execution_id" : exec_id,
                 "ts"           : now.isoformat()
             }
+
+    def get_executions(self):
+        now = datetime.now(timezone.utc).astimezone(get_localzone())
+        exec_ids, error = self.getExecutionIds()
+        if error is not None:
+            return error
+
+        self.logger.info("getting %d executions" % len(exec_ids))
+
+        if "asJson" in request.args:
+            executors = self.manager.getExecutions(exec_ids, defer_cols=["pipeline_fn", "pipeline_args", "pipeline_ret", "output", "error"])
+            executors_list_json = [ executors[exec_id].asJson() for exec_id in exec_ids if exec_id in executors ]
+        else:
+            executors = self.manager.getExecutions(exec_ids, defer_cols=["pipeline_ret"])
+            executors_list_json = [ executors[exec_id].serialize() for exec_id in exec_ids if exec_id in executors ]
+
+        return {
+            "code"       : 204,
+            "status"     : "ok",
+            "executions" : executors_list_json,
+            "missing"    : [ exec_id for exec_id in exec_ids if exec_id not in executors ],
+            "ts"         : now.isoformat()
+        }
  
     def get_execution_output(self, exec_id):
         now = datetime.now(timezone.utc).astimezone(get_localzone())
@@ -386,6 +567,23 @@ class OrchestratorService(AbstractApiService):
         executor = self.manager.getExecution(exec_id)
         
         if executor is not None:
+            if "offset" in request.args or "error_offset" in request.args or getattr(executor, "log_paths", None) is not None:
+                # incremental output: ?offset=N&error_offset=M (bytes). The
+                # offsets to continue from are returned with the output
+                tail = executor.tailOutput(int(request.args.get("offset", 0)), int(request.args.get("error_offset", 0)))
+                return {
+                    "code"         : 202,
+                    "status"       : "ok",
+                    "output"       : tail["output"],
+                    "error"        : tail["error"],
+                    "offset"       : tail["offset"],
+                    "error_offset" : tail["error_offset"],
+                    "running"      : tail["running"],
+                    "state"        : tail["state"],
+                    "execution_id" : exec_id,
+                    "ts"           : now.isoformat()
+                }
+
             return {
                 "code"         : 202,
                 "status"       : "ok",
@@ -402,6 +600,61 @@ class OrchestratorService(AbstractApiService):
                 "execution_id" : exec_id,
                 "ts"           : now.isoformat()
             }
+
+    def stream_execution_output(self, exec_id):
+        # server sent events with the output lines of an execution (events
+        # "output" and "error") until it finishes (event "end"). The event
+        # id holds both offsets, so a client reconnecting with Last-Event-ID
+        # (or ?offset=N&error_offset=M) continues where it was
+        now = datetime.now(timezone.utc).astimezone(get_localzone())
+        print("%s : streaming output for execution id %s" % (now, exec_id))
+
+        executor = self.manager.getExecution(exec_id)
+        if executor is None:
+            return {
+                "code"         : 310,
+                "status"       : "Executor does not exists",
+                "execution_id" : exec_id,
+                "ts"           : now.isoformat()
+            }
+
+        offset       = int(request.args.get("offset", 0))
+        error_offset = int(request.args.get("error_offset", 0))
+        last_id = request.headers.get("Last-Event-ID")
+        if last_id is not None:
+            offset, error_offset = [ int(x) for x in last_id.split(",") ]
+
+        # the stream runs without a thread slot of the server
+        if not self.startWaiting():
+            return self.tooManyWaiters(exec_id, now)
+
+        def events(executor, offset, error_offset, poll_interval=0.5):
+            # the output of the running execution is read from its log
+            # files between waits on the execution monitor, and from the
+            # stored execution once it is done
+            done = False
+            while True:
+                if done:
+                    executor = self.manager.getExecution(exec_id)
+                tail = executor.tailOutput(offset, error_offset)
+
+                for line in tail["output"].splitlines(keepends=True):
+                    offset += len(line.encode("utf8"))
+                    yield "id: %d,%d\nevent: output\ndata: %s\n\n" % (offset, error_offset, line.rstrip("\n"))
+
+                for line in tail["error"].splitlines(keepends=True):
+                    error_offset += len(line.encode("utf8"))
+                    yield "id: %d,%d\nevent: error\ndata: %s\n\n" % (offset, error_offset, line.rstrip("\n"))
+
+                offset, error_offset = tail["offset"], tail["error_offset"]
+
+                if done or not tail["running"]:
+                    yield "event: end\ndata: %d\n\n" % tail["state"]
+                    return
+
+                done = self.manager.waitExecution(exec_id, poll_interval) in (4, 5, 6)
+
+        return Response(events(executor, offset, error_offset), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
    
     def cancel_execution(self, exec_id):
         now = datetime.now(timezone.utc).astimezone(get_localzone())
@@ -450,6 +703,7 @@ class OrchestratorService(AbstractApiService):
         cores           = 1
         partition       = None
         memory          = None
+        priority        = 0
 
         if "asJob" in json_input:
             local_job = json_input["asJob"]
@@ -463,6 +717,9 @@ class OrchestratorService(AbstractApiService):
         if "memory" in json_input:
             memory = int(json_input["memory"])
 
+        if "priority" in json_input:
+            priority = int(json_input["priority"])
+
         if "args" in json_input:
             pipeline_args   = jsonpickle.loads(json_input["args"])
         
@@ -485,8 +742,10 @@ class OrchestratorService(AbstractApiService):
             try:
                 executor = None
                 if local_job:
-                    executor = self.manager.execute(pipeline, *pipeline_args,**pipeline_kwargs)
+                    # the execution goes through the persistent run queue
+                    executor = self.manager.enqueue(pipeline, pipeline_args, pipeline_kwargs, priority=priority, local=local_job, cores=cores, partition=partition, memory=memory)
                 else:
+                    # the jobs are submitted right away, the cluster queues them
                     executor = self.manager.createExecutor(pipeline, local = local_job, cores=cores, partition=partition, memory=memory)
                     executor.run(*pipeline_args,**pipeline_kwargs)
 
@@ -518,6 +777,72 @@ class OrchestratorService(AbstractApiService):
                 "ts"     : now.isoformat()
             }
 
+    def execute_map(self):
+        # runs a pipeline for each one of the given items (see MapRunner)
+        now = datetime.now(timezone.utc).astimezone(get_localzone())
+        json_input = request.json
+
+        name         = json_input["name"]
+        version      = json_input["version"]
+        items        = jsonpickle.loads(json_input["items"])
+        kw_args      = {}
+        chunksize    = int(json_input.get("chunksize", 1))
+        max_parallel = json_input.get("max_parallel", None)
+        gather       = json_input.get("gather", "list")
+
+        local_job    = json_input.get("asJob", True)
+        cores        = int(json_input.get("cores", 1))
+        partition    = json_input.get("partition", None)
+        memory       = json_input.get("memory", None)
+
+        if "kwargs" in json_input:
+            kw_args = jsonpickle.loads(json_input["kwargs"])
+
+        if max_parallel is not None:
+            max_parallel = int(max_parallel)
+
+        if len(items) > self.max_map_items:
+            return {
+                "code"   : 501,
+                "status" : "too many items (max %d)" % self.max_map_items,
+                "ts"     : now.isoformat()
+            }
+
+        try:
+            pipelines = self.manager.getPipelines(name = name, version = version)
+        except Exception as e:
+            return {
+                "code"        : 305,
+                "status"      : "%s : %s" % (type(e).__name__, e),
+                "ts"          : now.isoformat()
+            }
+
+        if len(pipelines)!=1:
+            e = NoActivePipelineRegistered(name)
+            return {
+                "code"   : 306,
+                "status" : "%s:%s" % (type(e).__name__,e),
+                "ts"     : now.isoformat()
+            }
+
+        try:
+            executor = self.manager.map(pipelines[0], items, kw_args, chunksize=chunksize, max_parallel=max_parallel, gather=gather, local=local_job, cores=cores, partition=partition, memory=memory)
+
+            return {
+                "code"         : 201,
+                "status"       : executor.state,
+                "execution_id" : executor.getExecutionId(),
+                "items"        : len(items),
+                "ts"           : now.isoformat()
+            }
+        except Exception as e:
+            self.logger.info("map execution failed: %s" % e)
+            return {
+                "code"        : 303,
+                "status"      : "Execution failed. %s" % e,
+                "ts"          : now.isoformat()
+            }
+
     def scheduleAt(self):
         now = datetime.now(timezone.utc).astimezone(get_localzone())
         json_input = request.json
@@ -530,6 +855,15 @@ class OrchestratorService(AbstractApiService):
         pipeline_args   = jsonpickle.loads(json_input["args"])
         pipeline_kwargs = jsonpickle.loads(json_input["kwargs"])
 
+        misfire_policy  = "once"
+        misfire_grace   = None
+
+        if "misfire_policy" in json_input:
+            misfire_policy = json_input["misfire_policy"]
+
+        if "misfire_grace" in json_input:
+            misfire_grace = json_input["misfire_grace"]
+
         pipelines = []
         try:        
             pipelines = self.manager.getPipelines(name = name, active = True)
@@ -547,7 +881,7 @@ class OrchestratorService(AbstractApiService):
             pipeline.setKeywordArguments(pipeline_kwargs)
             try:
                 
-                if self.manager.scheduleAt(pipeline, trigger_time=trigger_time, label=label, recurrency=recurrency,tags=tags):
+                if self.manager.scheduleAt(pipeline, trigger_time=trigger_time, label=label, recurrency=recurrency,tags=tags, misfire_policy=misfire_policy, misfire_grace=misfire_grace):
                     return {
                         "code"         : 201,
                         "status"       : True,
@@ -613,22 +947,68 @@ class OrchestratorService(AbstractApiService):
                 "ts"           : now.isoformat()
             }
 
+    def getListArgs(self):
+        # pagination, filters and projection of an execution list. Without
+        # any of them the whole list is answered, as before the paging
+        list_args = {}
+        if not any([ arg in request.args for arg in self.list_args ]):
+            return list_args
+
+        if "after_id" in request.args:
+            list_args["after_id"] = int(request.args["after_id"])
+        limit = int(request.args.get("limit", self.max_page_size))
+        list_args["limit"] = max(1, min(limit, self.max_page_size))
+        if "since" in request.args:
+            list_args["since"] = datetime.fromisoformat(request.args["since"])
+        if "until" in request.args:
+            list_args["until"] = datetime.fromisoformat(request.args["until"])
+        if "order" in request.args:
+            if request.args["order"] not in ("asc", "desc"):
+                raise RuntimeError("invalid order %s" % request.args["order"])
+            list_args["order"] = request.args["order"]
+        if "fields" in request.args:
+            list_args["fields"] = [ f.strip() for f in request.args["fields"].split(",") if f.strip() != "" ]
+        return list_args
+
     def get_execution_list(self,pipeline_name):
         now = datetime.now(timezone.utc).astimezone(get_localzone())
         
         if self.manager.isPipelineRegistered(pipeline_name):
             self.logger.info("getting execution list for %s" % pipeline_name)
-            
-            executions = self.manager.getExecutionList(pipeline_name)
-            
+
+            try:
+                list_args = self.getListArgs()
+                if len(list_args) > 0 and "fields" not in list_args:
+                    # serialize() loads all the columns but the return value
+                    list_args["defer_cols"] = ["pipeline_ret"]
+                executions = self.manager.getExecutionList(pipeline_name, **list_args)
+            except Exception as e:
+                return {
+                    "code"         : 501,
+                    "status"       : "invalid execution list request",
+                    "exception"    : str(e),
+                    "pipeline_name": pipeline_name,
+                    "ts"           : now.isoformat()
+                }
+
+            # cursor of the next page
+            next_after_id = None
+            if "limit" in list_args and len(executions) == list_args["limit"]:
+                next_after_id = executions[-1].id
+
             if len(executions)>0:
-                executors_list_json = [ ex.serialize() for ex in executions ]
+                if "fields" in list_args:
+                    fields = ["id", "uuid"] + [ f for f in list_args["fields"] if f not in ("id", "uuid") ]
+                    executors_list_json = [ ex.asFields(fields) for ex in executions ]
+                else:
+                    executors_list_json = [ ex.serialize() for ex in executions ]
                 
                 return {
                     "code"         : 204,
                     "status"       : "ok",
                     "pipeline_name": pipeline_name,
                     "executions"   : executors_list_json,
+                    "next_after_id": next_after_id,
                     "ts"           : now.isoformat()
                 }
             else:
@@ -637,10 +1017,11 @@ class OrchestratorService(AbstractApiService):
                     "status"       : "No executions found",
                     "pipeline_name": pipeline_name,
                     "executions"   : [],
+                    "next_after_id": None,
                     "ts"           : now.isoformat()
                 }
 
-        self.logger.info("pipeline not registered %s" % label)
+        self.logger.info("pipeline not registered %s" % pipeline_name)
         return {
             "code"         : 301,
             "status"       : "Pipeline Not Registered",
@@ -956,7 +1337,12 @@ class OrchestratorService(AbstractApiService):
         
     def stop(self):
         now = datetime.now(timezone.utc).astimezone(get_localzone())
-        self.manager.stop()
+        if self.threads is None:
+            self.manager.stop()
+        else:
+            # new requests are refused, the manager is stopped by
+            # stopService once the requests in flight are drained
+            self.startDraining()
         super().release()
         return {
             "code"   : 210,
@@ -964,6 +1350,12 @@ class OrchestratorService(AbstractApiService):
             "ts"     : now.isoformat()
         }
     
+    def stopService(self):
+        super().stopService()
+        if self.threads is not None and not self.manager_stopped:
+            self.manager_stopped = True
+            self.manager.stop()
+
     def put_key(self):
         json_input = request.json
         label = json_input["label"]
@@ -8,10 +8,21 @@ import dill
 # Remote Procedure Notification
 from sqlalchemy.ext.declarative import declarative_base
 from .AbstractRemoteProcedureNotification import *
+from ..base.db import deduplicate
 Base = declarative_base()
 
 class RemoteProcedureNotification(AbstractRemoteProcedureNotification,Base):
     __tablename__ = 'remoteprocedurenotification'
+    __table_args__ = (
+        sal.Index('ix_remoteprocedurenotification_uuid', 'uuid', unique=True),
+        sal.Index('ix_remoteprocedurenotification_label_id', 'label', 'id'),
+    )
+    # 2: indexes
+    # 3: duplicated uuids removed before the unique index
+    __schema_version__ = 3
+    __migrations__ = {
+        3 : deduplicate("remoteprocedurenotification", "uuid")
+    }
     
     id         = sal.Column('id', sal.Integer, primary_key=True, nullable=False)
     label      = sal.Column('label', sal.String)
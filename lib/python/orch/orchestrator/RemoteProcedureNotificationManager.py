@@ -130,25 +130,25 @@ class RemoteProcedureNotificationManager(DataBaseBackend,Observable):
                                 print("chained trigger for finished execution")
                                 result = dill.loads(base64.b64decode(data["result"]))
                                 if isinstance(result,list) or isinstance(result,tuple):
-                                    executor = self.manager.execute(pipeline, result, **kw_args)
+                                    executor = self.manager.enqueue(pipeline, [result], kw_args)
                                 elif isinstance(result,dict):
                                     kw_args.update(result)
-                                    executor = self.manager.execute(pipeline, **kw_args)
+                                    executor = self.manager.enqueue(pipeline, kw_args=kw_args)
                                 else:
-                                    executor = self.manager.execute(pipeline, result, **kw_args)
+                                    executor = self.manager.enqueue(pipeline, [result], kw_args)
 
                             elif data["event"]=="failed":
                                 print("chained trigger for failed execution")
                                 ex = dill.loads(base64.b64decode(data["result"]))
-                                executor = self.manager.execute(pipeline, ex, **kw_args)
+                                executor = self.manager.enqueue(pipeline, [ex], kw_args)
 
                             else:
                                 # different event
-                                executor = self.manager.execute(pipeline, result, **kw_args)
+                                executor = self.manager.enqueue(pipeline, [result], kw_args)
                         else:
                             # normal rpn. rpn_data comes into the kw_args
 
-                            executor = self.manager.execute(pipeline, **kw_args)
+                            executor = self.manager.enqueue(pipeline, kw_args=kw_args)
 
                         print("rpn triggering %s" % pipeline)
                         print("execution_id: %s" % executor.getExecutionId())
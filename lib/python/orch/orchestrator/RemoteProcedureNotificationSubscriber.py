@@ -8,10 +8,22 @@ import dill
 # Remote Procedure Notification Subscriber
 from sqlalchemy.ext.declarative import declarative_base
 from .AbstractRemoteProcedureNotificationSubscriber import *
+from ..base.db import deduplicate
 Base = declarative_base()
 
 class RemoteProcedureNotificationSubscriber(AbstractRemoteProcedureNotificationSubscriber, Base):
     __tablename__ = 'rpn_subscriber'
+    __table_args__ = (
+        sal.Index('ix_rpn_subscriber_uuid', 'uuid', unique=True),
+        sal.Index('ix_rpn_subscriber_label', 'label'),
+        sal.Index('ix_rpn_subscriber_pipeline_name', 'pipeline_name'),
+    )
+    # 2: indexes
+    # 3: duplicated uuids removed before the unique index
+    __schema_version__ = 3
+    __migrations__ = {
+        3 : deduplicate("rpn_subscriber", "uuid")
+    }
     
     id            = sal.Column('id', sal.Integer, primary_key=True, nullable=False)
     label         = sal.Column('label', sal.String)
@@ -1,3 +1,4 @@
+from datetime import datetime, timedelta
 import base64
 import dill
 import inspect
@@ -43,19 +44,47 @@ class AbstractExecutor(object):
         }
         return json_obj
 
+    def asFields(self, fields):
+        # json friendly values of the given columns
+        json_obj = {}
+        for field in fields:
+            value = self.getEncoded(field)
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            elif isinstance(value, timedelta):
+                value = value.total_seconds()
+            elif isinstance(value, bytes):
+                value = value.decode("utf8")
+            json_obj[field] = value
+        return json_obj
+
+    def getEncoded(self, name):
+        # base64 value of pipeline_ret, output or error. Large values are
+        # in the artifact store and the column only has their reference
+        ref = getattr(self, name + "_ref", None)
+        if ref is not None:
+            artifacts = getattr(getattr(self, "em", None), "artifacts", None)
+            if artifacts is None:
+                raise RuntimeError("%s of execution %s is in the artifact store (%s), which is not available" % (name, self.uuid, ref))
+            return base64.b64encode(artifacts.get(ref))
+        return getattr(self, name)
+
     def getOutput(self):
-        if self.output is not None:
-            return base64.b64decode(self.output).decode("utf8")
+        output = self.getEncoded("output")
+        if output is not None:
+            return base64.b64decode(output).decode("utf8")
         return None
 
     def getReturnValue(self):
-        if self.pipeline_ret is not None:
-            return dill.loads(base64.b64decode(self.pipeline_ret))
+        pipeline_ret = self.getEncoded("pipeline_ret")
+        if pipeline_ret is not None:
+            return dill.loads(base64.b64decode(pipeline_ret))
         return None
     
     def getErrors(self):
-        if self.error is not None:
-            return base64.b64decode(self.error).decode("utf8")
+        error = self.getEncoded("error")
+        if error is not None:
+            return base64.b64decode(error).decode("utf8")
         return None
     
     def getArguments(self):
@@ -68,6 +97,9 @@ class AbstractExecutor(object):
     def isPreparing(self):
         return self.state == 1 or self.state==2
     
+    def isQueued(self):
+        return self.state == 7
+
     def isRunning(self):
         return self.state ==3
         
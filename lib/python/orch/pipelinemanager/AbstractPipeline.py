@@ -1,5 +1,5 @@
 import base64
-import dill
+from .FunctionCache import FunctionCache
 
 # AbstractPipeline
 
@@ -11,7 +11,8 @@ class AbstractPipeline:
                 
     def getFunction(self):
         # include decryption
-        return dill.loads(base64.b64decode(self.impl_fn))
+        # decoded once per version (see FunctionCache)
+        return FunctionCache.get(self.name, self.version, self.impl_fn)
         
     def setActive(self, state):
         self.active = state
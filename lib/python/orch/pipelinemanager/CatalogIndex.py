@@ -0,0 +1,180 @@
+# CatalogIndex
+#
+# in memory index of the pipeline catalog (name -> versions, name -> active
+# version), so looking up the pipeline of a scheduled fire or of a
+# notification does not query the pipelines table. It is loaded when the
+# catalog starts and updated by the catalog on every write (register,
+# setActive, deactivateAll).
+#
+# Other processes using the same database are detected by a generation
+# counter, increased on every write to the catalog. The index reads it
+# (one row by primary key) before answering, at most once every
+# check_interval seconds, and loads the catalog again when it changed. The
+# writes of this process are seen right away.
+#
+# The lookups answered by the index are the ones filtering by name and
+# other columns (keyword arguments). They get new detached Pipeline
+# objects, as the ones loaded from the database.
+
+from threading import RLock
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.exc import IntegrityError
+import sqlalchemy as sal
+import time
+
+from .Pipeline import Pipeline
+
+generation_metadata = sal.MetaData()
+catalog_generation = sal.Table("pipeline_catalog_generation", generation_metadata,
+    sal.Column("id", sal.Integer, primary_key=True),
+    sal.Column("generation", sal.Integer, nullable=False)
+)
+
+class CatalogIndex(object):
+
+    check_interval = 1.0
+
+    def __init__(self, catalog):
+        self.catalog    = catalog
+        self.lock       = RLock()
+        self.pipelines  = {}      # name -> { version : columns }
+        self.active     = {}      # name -> active version
+        self.generation = None
+        self.checked    = 0
+        self.hits       = 0
+        self.loads      = 0
+        self.columns    = [ a.key for a in sal.inspect(Pipeline).column_attrs ]
+
+    def initialize(self):
+        engine = self.catalog.getEngine()
+        generation_metadata.create_all(engine, tables=[catalog_generation])
+        try:
+            with engine.begin() as conn:
+                if self.readGeneration(conn) is None:
+                    conn.execute(catalog_generation.insert().values(id=1, generation=0))
+        except IntegrityError:
+            # inserted by another process meanwhile
+            pass
+        self.load()
+        return True
+
+    def readGeneration(self, conn):
+        return conn.execute(
+            sal.select(catalog_generation.c.generation).where(catalog_generation.c.id == 1)
+        ).scalar()
+
+    def getColumns(self, pipeline):
+        return { key : getattr(pipeline, key) for key in self.columns }
+
+    def setRows(self, name, pipelines):
+        versions = { p.version : self.getColumns(p) for p in pipelines }
+        if len(versions) == 0:
+            self.pipelines.pop(name, None)
+        else:
+            self.pipelines[name] = versions
+
+        self.active.pop(name, None)
+        for version, columns in versions.items():
+            if columns["active"]:
+                self.active[name] = version
+
+    def load(self):
+        # the generation is read first: a write meanwhile loads again
+        with self.lock:
+            with self.catalog.getEngine().connect() as conn:
+                generation = self.readGeneration(conn)
+
+            by_name = {}
+            for pipeline in self.catalog.getObjects(Pipeline):
+                by_name.setdefault(pipeline.name, []).append(pipeline)
+
+            self.pipelines = {}
+            self.active = {}
+            for name, pipelines in by_name.items():
+                self.setRows(name, pipelines)
+
+            self.generation = generation
+            self.checked = time.time()
+            self.loads += 1
+
+    def refresh(self):
+        # loads the catalog again if another process changed it
+        with self.lock:
+            if time.time() - self.checked < self.check_interval:
+                return False
+            with self.catalog.getEngine().connect() as conn:
+                generation = self.readGeneration(conn)
+            self.checked = time.time()
+            if generation == self.generation:
+                return False
+            self.load()
+            return True
+
+    def changed(self, name):
+        # called by the catalog after writing the pipelines of name
+        with self.catalog.getEngine().begin() as conn:
+            conn.execute(catalog_generation.update().where(catalog_generation.c.id == 1).values(
+                generation = catalog_generation.c.generation + 1
+            ))
+            generation = self.readGeneration(conn)
+
+        with self.lock:
+            if self.generation is None or generation != self.generation + 1:
+                # also changed by another process
+                self.load()
+                return
+            self.setRows(name, self.catalog.getObjects(Pipeline, name=name))
+            self.generation = generation
+
+    def canAnswer(self, args, kwargs):
+        if len(args) > 0 or "name" not in kwargs:
+            return False
+        return all([ key in self.columns for key in kwargs ])
+
+    def matches(self, columns, kwargs):
+        for key, value in kwargs.items():
+            current = columns.get(key)
+            if current == value:
+                continue
+            # e.g. a version given as string by the service
+            if isinstance(value, str) and not isinstance(current, bool) and str(current) == value:
+                continue
+            return False
+        return True
+
+    def find(self, **kwargs):
+        self.refresh()
+        with self.lock:
+            self.hits += 1
+            versions = self.pipelines.get(kwargs["name"], {})
+            rows = [ versions[v] for v in sorted(versions.keys()) if self.matches(versions[v], kwargs) ]
+
+        pipelines = []
+        for columns in rows:
+            pipeline = Pipeline(**columns)
+            # persistent row, not loaded in a session
+            make_transient_to_detached(pipeline)
+            pipelines.append(pipeline)
+        return pipelines
+
+    def isRegistered(self, **kwargs):
+        self.refresh()
+        with self.lock:
+            self.hits += 1
+            versions = self.pipelines.get(kwargs["name"], {})
+            return any([ self.matches(columns, kwargs) for columns in versions.values() ])
+
+    def getActiveVersion(self, name):
+        self.refresh()
+        with self.lock:
+            return self.active.get(name)
+
+    def getStatus(self):
+        with self.lock:
+            return {
+                "pipelines"  : len(self.pipelines),
+                "versions"   : sum([ len(v) for v in self.pipelines.values() ]),
+                "generation" : self.generation,
+                "hits"       : self.hits,
+                "loads"      : self.loads
+            }
@@ -0,0 +1,170 @@
+# DAGRunner
+#
+# runs the nodes of a PipelineDAG for its execution. Each node is an
+# execution of its own (its parent_uuid is the DAG execution and its node
+# column the node name), started when its dependencies are finished, so
+# the independent branches are in the pool at the same time. The results
+# are handed to the next nodes in memory; the nodes store theirs as any
+# execution (large ones in the artifact store).
+#
+# When a node fails, the nodes depending on it are skipped and the other
+# branches go on.
+
+from threading import Thread, Lock
+import base64
+import queue
+import dill
+
+from ..exceptions import PipelineExecutionError
+from .Pipeline import Pipeline
+
+class DAGRunner(object):
+
+    def __init__(self, executor, dag):
+        self.executor  = executor   # execution of the DAG
+        self.dag       = dag
+        self.finished  = queue.Queue()
+        self.lock      = Lock()
+        self.children  = {}         # node -> executor
+        self.nodes     = {}         # node -> state, uuid and timing
+        self.results   = {}
+        self.errors    = {}
+        self.skipped   = []
+        self.cancelled = False
+
+    def getPipeline(self, name):
+        # registered pipelines run their active version. Functions run as
+        # a pipeline named after the DAG and the node (not in the catalog)
+        parent = self.executor.pipeline
+        target = self.dag.getTarget(name)
+        if isinstance(target, str):
+            pipeline = self.executor.em.owner.catalog.get(name=target, active=True)[0]
+        else:
+            pipeline = Pipeline(
+                name     = "%s.%s" % (parent.name, name),
+                owner_id = parent.owner_id,
+                version  = parent.version,
+                tags     = "dag-node",
+                active   = False,
+                impl_fn  = base64.b64encode(dill.dumps(target))
+            )
+            pipeline.catalog = parent.catalog
+            pipeline.manager = parent.manager
+
+        pipeline.parent_uuid = self.executor.uuid
+        pipeline.node        = name
+        return pipeline
+
+    def start(self, name, args, kwargs):
+        self.nodes[name] = { "state" : 1, "uuid" : None }
+        try:
+            with self.lock:
+                if self.cancelled:
+                    raise RuntimeError("DAG execution cancelled")
+                parent = self.executor
+                child = parent.em.create(self.getPipeline(name), local=parent.local_job, cores=parent.cores, partition=parent.partition, memory=parent.memory)
+                self.children[name] = child
+            self.nodes[name]["uuid"] = child.uuid
+            child.run(*args, **kwargs)
+        except Exception as e:
+            self.finished.put((name, None, e))
+            return
+
+        Thread(target=self.wait, args=(name, child), name="dag-node-%s" % name, daemon=True).start()
+
+    def wait(self, name, child):
+        try:
+            value = child.handler.get()
+        except Exception as e:
+            value = e
+        self.finished.put((name, child, value))
+
+    def skip(self, name):
+        for dependent in self.dag.getDependents(name):
+            if dependent not in self.nodes:
+                self.nodes[dependent] = { "state" : None, "uuid" : None, "skipped" : True }
+                self.skipped.append(dependent)
+                self.skip(dependent)
+
+    def isReady(self, name):
+        if name in self.nodes:
+            return False
+        return all([ d in self.results for d in self.dag.getDependencies(name) ])
+
+    def run(self, args, kwargs):
+        running = 0
+        for name in self.dag.getRoots():
+            self.start(name, args, kwargs)
+            running += 1
+
+        while running > 0:
+            name, child, value = self.finished.get()
+            running -= 1
+
+            state = child.state if child is not None else 5
+            self.nodes[name]["state"] = state
+            if child is not None:
+                self.nodes[name].update({
+                    "start_ts"  : child.start_ts,
+                    "end_ts"    : child.end_ts,
+                    "exec_time" : child.exec_time
+                })
+
+            if state != 4:
+                self.errors[name] = value
+                self.skip(name)
+                continue
+
+            self.results[name] = value
+            for dependent in self.dag.getDependents(name):
+                if self.isReady(dependent) and not self.cancelled:
+                    self.start(dependent, [ self.results[d] for d in self.dag.getDependencies(dependent) ], {})
+                    running += 1
+
+        # nodes not started after a cancellation
+        for name in self.dag.order:
+            if name not in self.nodes:
+                self.nodes[name] = { "state" : None, "uuid" : None, "skipped" : True }
+                self.skipped.append(name)
+
+        return self.isSuccessful()
+
+    def isSuccessful(self):
+        return not self.cancelled and len(self.errors) == 0 and len(self.skipped) == 0
+
+    def getResult(self):
+        return self.dag.getResult(self.results)
+
+    def getError(self):
+        errors = [ "node %s: %s" % (n, e) for n, e in self.errors.items() ]
+        return PipelineExecutionError("DAG %s failed. %s" % (self.executor.name, "; ".join(errors) if len(errors) > 0 else "cancelled"))
+
+    def cancel(self):
+        # no more nodes are started, the running ones are cancelled
+        with self.lock:
+            self.cancelled = True
+            children = list(self.children.values())
+        for child in children:
+            if not child.isDone() and child.state != 6:
+                child.cancel()
+        return True
+
+    def getDescription(self, args, kwargs):
+        self.dag.validate()
+        return "DAG Execution\npipeline          : %s\npipeline version  : %d\narguments         : %s %s\n%s" % (
+            self.executor.name, self.executor.version, str(args), str(kwargs), self.dag
+        )
+
+    def getSummary(self):
+        lines = []
+        for name in self.dag.order:
+            node = self.nodes.get(name, {})
+            if node.get("skipped", False):
+                lines.append("node %-20s skipped" % name)
+                continue
+            lines.append("node %-20s state %s uuid %s start %s end %s exec_time %s" % (
+                name, node.get("state"), node.get("uuid"), node.get("start_ts"), node.get("end_ts"), node.get("exec_time")
+            ))
+        for name, error in self.errors.items():
+            lines.append("node %s failed: %s" % (name, error))
+        return "\n".join(lines)
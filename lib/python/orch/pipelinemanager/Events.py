@@ -1,13 +1,26 @@
 from ..base import ActionEvent
 
 class ExecutionStarted(ActionEvent):
-    def __init__(self,pipeline, *args,**kw_args):
+    def __init__(self,pipeline, execution_id=None, state=None, *args,**kw_args):
         super().__init__()
         self.pipeline_name = pipeline.name
         self.pipeline      = pipeline
-        
+        self.execution_id  = execution_id
+        self.state         = state
+
 class ExecutionFinished(ActionEvent):
-    def __init__(self,pipeline,*args,**kw_args):
+    def __init__(self,pipeline, execution_id=None, state=None, *args,**kw_args):
         super().__init__()
         self.pipeline_name = pipeline.name
         self.pipeline      = pipeline
+        self.execution_id  = execution_id
+        self.state         = state
+
+class ExecutionCancelled(ActionEvent):
+    def __init__(self,pipeline, execution_id=None, state=6, *args,**kw_args):
+        super().__init__()
+        # executions cancelled before running may not have their pipeline
+        self.pipeline_name = pipeline.name if pipeline is not None else None
+        self.pipeline      = pipeline
+        self.execution_id  = execution_id
+        self.state         = state
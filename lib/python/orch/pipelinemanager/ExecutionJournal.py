@@ -0,0 +1,129 @@
+# ExecutionJournal
+#
+# write behind of the state transitions of the running executions
+# (initialized, queued, running). The changed columns of an executor are
+# kept in memory, coalesced with its previous pending changes, and written
+# every window seconds (or once max_pending executors are waiting) in one
+# transaction, as updates by uuid. The executors are in the active list of
+# the ExecutorManager meanwhile, so their lookups do not see the lag.
+#
+# Terminal states are saved right away by the executor (saveObject), which
+# first settles its pending transitions: they are discarded (the object
+# being saved holds them) and an ongoing write of them is waited for, so it
+# never overwrites the terminal state.
+
+from threading import Thread, Condition
+import sqlalchemy as sal
+
+class ExecutionJournal(Thread):
+
+    def __init__(self, engine, table, window=0.2, max_pending=500):
+        super().__init__(name="orch-execution-journal", daemon=True)
+        self.engine      = engine
+        self.table       = table
+        self.window      = window
+        self.max_pending = max_pending
+        self.cv          = Condition()
+        self.pending     = {}       # uuid -> { column : value }
+        self.writing     = set()    # uuids being written
+        self.running     = True
+        self.flushes     = 0
+        self.written     = 0
+
+    @classmethod
+    def getChanges(cls, obj):
+        # columns changed since the object was last saved
+        state = sal.inspect(obj)
+        changes = {}
+        for attr in state.mapper.column_attrs:
+            if attr.key in state.dict and state.attrs[attr.key].history.has_changes():
+                changes[attr.columns[0].name] = state.dict[attr.key]
+        return changes
+
+    def record(self, executor):
+        changes = self.getChanges(executor)
+        with self.cv:
+            if executor.uuid in self.pending:
+                self.pending[executor.uuid].update(changes)
+            else:
+                self.pending[executor.uuid] = changes
+            if len(self.pending) >= self.max_pending:
+                self.cv.notify_all()
+        return True
+
+    def settle(self, uuid):
+        with self.cv:
+            self.pending.pop(uuid, None)
+            self.cv.wait_for(lambda: uuid not in self.writing)
+            # a failed write puts its transitions back
+            self.pending.pop(uuid, None)
+
+    def flush(self):
+        with self.cv:
+            if len(self.pending) == 0:
+                return 0
+            pending = self.pending
+            self.pending = {}
+            self.writing = set(pending.keys())
+
+        try:
+            self.write(pending)
+        except Exception as e:
+            print("error writing %d execution states: %s" % (len(pending), e))
+            # written again on the next flush, unless changed meanwhile
+            with self.cv:
+                for uuid, changes in pending.items():
+                    if uuid not in self.pending:
+                        self.pending[uuid] = changes
+            return 0
+        finally:
+            with self.cv:
+                self.writing = set()
+                self.cv.notify_all()
+
+        self.flushes += 1
+        self.written += len(pending)
+        return len(pending)
+
+    def write(self, pending):
+        # one executemany per set of changed columns
+        groups = {}
+        for uuid, changes in pending.items():
+            columns = tuple(sorted(changes.keys()))
+            params = { "v_%s" % c : changes[c] for c in columns }
+            params["k_uuid"] = uuid
+            groups.setdefault(columns, []).append(params)
+
+        with self.engine.begin() as conn:
+            for columns, params in groups.items():
+                stmt = self.table.update().where(self.table.c.uuid == sal.bindparam("k_uuid")).values(
+                    { c : sal.bindparam("v_%s" % c) for c in columns }
+                )
+                conn.execute(stmt, params)
+
+    def run(self):
+        while True:
+            with self.cv:
+                self.cv.wait_for(lambda: not self.running or len(self.pending) >= self.max_pending, self.window)
+                running = self.running
+            self.flush()
+            if not running:
+                break
+
+    def stop(self):
+        # writes the pending transitions before ending
+        with self.cv:
+            self.running = False
+            self.cv.notify_all()
+        if self.is_alive():
+            self.join()
+        else:
+            self.flush()
+
+    def getStatus(self):
+        with self.cv:
+            return {
+                "pending" : len(self.pending),
+                "flushes" : self.flushes,
+                "written" : self.written
+            }
@@ -0,0 +1,78 @@
+# ExecutionMonitor
+#
+# last known state of the executions, fed by the execution events
+# (ExecutionStarted, ExecutionFinished and ExecutionCancelled). Clients
+# waiting for an execution to finish block on a condition of their own
+# execution instead of querying the database. The states of the finished
+# executions are remembered (up to max_entries) so late waiters are
+# answered right away.
+
+from threading import Lock, Condition
+from collections import OrderedDict
+import time
+
+class ExecutionMonitor(object):
+
+    done_states = (4, 5, 6)
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self.lock        = Lock()
+        self.states      = OrderedDict()
+        self.waiters     = {}   # execution id -> [condition, waiting clients]
+
+    @classmethod
+    def isDone(cls, state):
+        return state in cls.done_states
+
+    def update(self, execution_id, state, only_if_unknown=False):
+        with self.lock:
+            if only_if_unknown and execution_id in self.states:
+                return self.states[execution_id]
+
+            self.states[execution_id] = state
+            self.states.move_to_end(execution_id)
+            while len(self.states) > self.max_entries:
+                self.states.popitem(last=False)
+
+            if execution_id in self.waiters:
+                self.waiters[execution_id][0].notify_all()
+            return state
+
+    def getState(self, execution_id):
+        with self.lock:
+            return self.states.get(execution_id)
+
+    def wait(self, execution_id, timeout=None):
+        # blocks until the execution is done or the timeout expires.
+        # returns the last known state of the execution
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        with self.lock:
+            if execution_id not in self.waiters:
+                self.waiters[execution_id] = [Condition(self.lock), 0]
+            entry = self.waiters[execution_id]
+            entry[1] += 1
+            try:
+                while not self.isDone(self.states.get(execution_id)):
+                    if deadline is None:
+                        entry[0].wait()
+                    else:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            break
+                        entry[0].wait(remaining)
+                return self.states.get(execution_id)
+            finally:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self.waiters[execution_id]
+
+    def getStatus(self):
+        with self.lock:
+            return {
+                "known"   : len(self.states),
+                "waiting" : sum([ e[1] for e in self.waiters.values() ])
+            }
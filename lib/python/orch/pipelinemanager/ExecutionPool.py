@@ -0,0 +1,171 @@
+# ExecutionPool
+#
+# admission control for pipeline executions. The pool has a fixed number
+# of slots shared by all the executions, plus optional concurrency limits
+# per pipeline name and per owner. Executions not admitted wait in FIFO
+# order (an execution waiting for a busy pipeline does not block the
+# executions of other pipelines behind it).
+
+import os
+from threading import Condition
+
+class ExecutionPool(object):
+
+    # a waiting (or running) execution
+    class Ticket(object):
+        def __init__(self, executor):
+            self.executor  = executor
+            self.pipeline  = executor.name
+            self.owner     = executor.owner_id
+            self.granted   = False
+            self.cancelled = False
+
+    def __init__(self, max_workers=None, max_per_pipeline=None, max_per_owner=None):
+        if max_workers is None:
+            max_workers = os.cpu_count()
+
+        self.max_workers      = max_workers
+        self.max_per_pipeline = max_per_pipeline
+        self.max_per_owner    = max_per_owner
+
+        self.pipeline_limits  = {}
+        self.owner_limits     = {}
+
+        self.running          = {}   # executor uuid -> ticket
+        self.by_pipeline      = {}
+        self.by_owner         = {}
+        self.waiting          = []
+
+        self.cv               = Condition()
+
+    def setPipelineLimit(self, pipeline_name, limit):
+        with self.cv:
+            self.pipeline_limits[pipeline_name] = limit
+            self.__dispatch()
+
+    def setOwnerLimit(self, owner_id, limit):
+        with self.cv:
+            self.owner_limits[owner_id] = limit
+            self.__dispatch()
+
+    def setMaxWorkers(self, max_workers):
+        with self.cv:
+            self.max_workers = max_workers
+            self.__dispatch()
+
+    def __admissible(self, ticket):
+        if self.max_workers is not None and len(self.running) >= self.max_workers:
+            return False
+
+        limit = self.pipeline_limits.get(ticket.pipeline, self.max_per_pipeline)
+        if limit is not None and self.by_pipeline.get(ticket.pipeline, 0) >= limit:
+            return False
+
+        limit = self.owner_limits.get(ticket.owner, self.max_per_owner)
+        if limit is not None and self.by_owner.get(ticket.owner, 0) >= limit:
+            return False
+
+        return True
+
+    def __grant(self, ticket):
+        ticket.granted = True
+        self.running[ticket.executor.uuid] = ticket
+        self.by_pipeline[ticket.pipeline] = self.by_pipeline.get(ticket.pipeline, 0) + 1
+        self.by_owner[ticket.owner] = self.by_owner.get(ticket.owner, 0) + 1
+
+    def __dispatch(self):
+        # must be called holding self.cv. grants the waiting tickets in
+        # arrival order while there are slots available
+        granted = False
+        for ticket in list(self.waiting):
+            if self.max_workers is not None and len(self.running) >= self.max_workers:
+                break
+            if self.__admissible(ticket):
+                self.waiting.remove(ticket)
+                self.__grant(ticket)
+                granted = True
+        if granted:
+            self.cv.notify_all()
+
+    def tryAcquire(self, executor):
+        # non blocking admission. True when the executor got a slot
+        with self.cv:
+            ticket = ExecutionPool.Ticket(executor)
+            if len(self.waiting) == 0 and self.__admissible(ticket):
+                self.__grant(ticket)
+                return True
+        return False
+
+    def acquire(self, executor, on_queued=None):
+        # blocks until the executor gets a slot. returns False when the
+        # execution was cancelled while waiting
+        with self.cv:
+            if executor.uuid in self.running:
+                # slot already reserved with tryAcquire
+                return True
+
+            ticket = ExecutionPool.Ticket(executor)
+            self.waiting.append(ticket)
+            self.__dispatch()
+            queued = not ticket.granted
+
+        # on_queued may save the executor. not holding the pool lock here
+        if queued and on_queued is not None:
+            on_queued()
+
+        with self.cv:
+            while not ticket.granted and not ticket.cancelled:
+                self.cv.wait()
+
+            return ticket.granted
+
+    def cancel(self, executor):
+        # removes a waiting executor from the queue
+        with self.cv:
+            for ticket in self.waiting:
+                if ticket.executor.uuid == executor.uuid:
+                    ticket.cancelled = True
+                    self.waiting.remove(ticket)
+                    self.cv.notify_all()
+                    return True
+        return False
+
+    def release(self, executor):
+        with self.cv:
+            ticket = self.running.pop(executor.uuid, None)
+            if ticket is None:
+                return False
+
+            self.by_pipeline[ticket.pipeline] -= 1
+            self.by_owner[ticket.owner] -= 1
+            self.__dispatch()
+        return True
+
+    def hasCapacity(self):
+        with self.cv:
+            if len(self.waiting) > 0:
+                return False
+            return self.max_workers is None or len(self.running) < self.max_workers
+
+    def getFreeSlots(self):
+        # slots available for new executions, None when unbounded
+        with self.cv:
+            if len(self.waiting) > 0:
+                return 0
+            if self.max_workers is None:
+                return None
+            return max(0, self.max_workers - len(self.running))
+
+    def isQueued(self, executor):
+        with self.cv:
+            return any([ t.executor.uuid == executor.uuid for t in self.waiting ])
+
+    def getStatus(self):
+        with self.cv:
+            return {
+                "max_workers" : self.max_workers,
+                "running"     : len(self.running),
+                "queued"      : len(self.waiting),
+                "by_pipeline" : dict(self.by_pipeline),
+                "by_owner"    : dict(self.by_owner)
+            }
@@ -0,0 +1,224 @@
+# ExecutionQueue
+#
+# persistent run queue for pending executions. Enqueued executions are
+# stored in the execution_queue table (next to the executions one) and a
+# dispatcher thread hands them over to the executors in priority order
+# (higher priority first, then arrival order) only while the executor
+# manager pool has free slots. Optionally the dispatch rate can be bounded
+# with max_rate (dispatches per second).
+#
+# since the queue lives in the database, the pending executions survive a
+# restart of the orchestrator: they are restored and dispatched when the
+# queue starts again. The entries leave the table once dispatched, cancelled
+# or failed (the executions table keeps the state of the executions).
+
+from threading import Thread, Condition
+from datetime import datetime, timezone
+from tzlocal import get_localzone
+import base64
+import dill
+import time
+
+from ..base.db import DataBaseBackend
+from ..exceptions import InitializeError
+from . import QueuedExecution
+
+class ExecutionQueue(DataBaseBackend, Thread):
+
+    # pending entries looked at in one drain when the pool is unbounded
+    max_batch = 100
+
+    def __init__(self, manager, db_conn_str="sqlite:///orchestrator.sqlite", max_rate=None, poll_interval=1):
+        DataBaseBackend.__init__(self, db_conn_str)
+        Thread.__init__(self)
+
+        self.manager       = manager
+        self.em            = manager.executor_manager
+        self.max_rate      = max_rate
+        self.poll_interval = poll_interval
+        self.cv            = Condition()
+
+        if not self.initialize(QueuedExecution):
+            raise InitializeError(QueuedExecution.__tablename__)
+
+        # set before starting the thread so an early stop() is not lost
+        self.running = True
+        self.start()
+
+    def enqueue(self, pipeline, args=(), kw_args={}, priority=0, local=True, cores=1, partition=None, memory=None):
+        # create the executor in queued state and persist the request.
+        # the executor is returned right away so the caller gets its id
+        executor = self.em.create(pipeline, local=local, cores=cores, partition=partition, memory=memory)
+        executor.state = 7  # queued
+        if not self.em.saveObject(executor):
+            print("error saving executor")
+
+        pipeline_args = { 'args': tuple(args), 'kwargs': dict(kw_args) }
+
+        entry = QueuedExecution(
+            uuid          = executor.uuid,
+            name          = pipeline.name,
+            version       = pipeline.version,
+            owner_id      = pipeline.owner_id,
+            sch_evt_uuid  = executor.sch_evt_uuid,
+            priority      = priority,
+            state         = 0,
+            enqueue_ts    = datetime.now(timezone.utc).astimezone(get_localzone()),
+            local_job     = local,
+            cores         = cores,
+            partition     = None if partition is None else str(partition),
+            memory        = memory,
+            pipeline_args = base64.b64encode(dill.dumps(pipeline_args)).decode("utf8")
+        )
+
+        if not self.saveObject(entry):
+            raise RuntimeError("could not enqueue execution of %s" % pipeline.name)
+
+        # queued executions are listed (and can be cancelled) as active ones
+        self.em.active[executor.uuid] = executor
+
+        with self.cv:
+            self.cv.notify()
+
+        return executor
+
+    def getPending(self):
+        sess = self.session()
+        try:
+            rs = sess.query(QueuedExecution).filter_by(state=0).order_by(
+                QueuedExecution.priority.desc(),
+                QueuedExecution.enqueue_ts,
+                QueuedExecution.id
+            ).all()
+        finally:
+            self.session.remove()
+        return rs
+
+    def getPendingIds(self, limit, offset=0):
+        # ids of the next pending entries in dispatch order. The arguments
+        # of the entries are loaded only for the ones being dispatched
+        sess = self.session()
+        try:
+            rs = sess.query(QueuedExecution.id).filter_by(state=0).order_by(
+                QueuedExecution.priority.desc(),
+                QueuedExecution.enqueue_ts,
+                QueuedExecution.id
+            ).offset(offset).limit(limit).all()
+        finally:
+            self.session.remove()
+        return [ r[0] for r in rs ]
+
+    def getEntry(self, entry_id):
+        rs = self.getObjects(QueuedExecution, id=entry_id)
+        if len(rs) == 0:
+            return None
+        return rs[0]
+
+    def restore(self, entry):
+        # rebuild the executor of an entry enqueued before a restart
+        try:
+            executor = self.em.getExecutorByID(entry.uuid)
+            pipeline = self.manager.catalog.get(name=entry.name, version=entry.version)[0]
+        except Exception as e:
+            print("unable to restore queued execution %s: %s" % (entry.uuid, e))
+            return None
+
+        if entry.sch_evt_uuid is not None:
+            pipeline.scheduled_event_uuid = entry.sch_evt_uuid
+
+        executor.pipeline  = pipeline
+        executor.local_job = entry.local_job
+        executor.cores     = entry.cores
+        executor.partition = entry.partition
+        executor.memory    = entry.memory
+
+        self.em.active[executor.uuid] = executor
+        return executor
+
+    def dispatch(self, entry):
+        # returns True when dispatched, False when the entry was discarded
+        # and None when there is no slot for it yet
+        executor = self.em.active.get(entry.uuid)
+        if executor is None:
+            executor = self.restore(entry)
+
+        if executor is None:
+            # dispatch failed
+            self.destroyObject(entry)
+            return False
+
+        if executor.state == 6:
+            # cancelled while queued
+            self.destroyObject(entry)
+            return False
+
+        # reserve the slot here. the executor finds it already granted
+        if not self.em.pool.tryAcquire(executor):
+            return None
+
+        # dispatched. the entry leaves the queue before the execution starts
+        self.destroyObject(entry)
+
+        try:
+            args, kw_args = entry.getArguments()
+            executor.run(*args, **kw_args)
+        except Exception as e:
+            print("error dispatching queued execution %s: %s" % (entry.uuid, e))
+            self.em.pool.release(executor)
+
+            executor.state = 5  # error
+            executor.error = base64.b64encode(("%s" % e).encode("utf8"))
+            if executor.uuid in self.em.active:
+                del self.em.active[executor.uuid]
+            self.em.saveObject(executor)
+            self.em.monitor.update(executor.uuid, executor.state)
+            return False
+
+        return True
+
+    def drain(self):
+        # dispatch the pending executions in priority order while the pool
+        # has free slots, looking at as many entries as free slots. Entries
+        # whose pipeline or owner is at its concurrency limit are skipped
+        # and stay pending (the next ones are looked at after them)
+        skipped = 0
+        while self.running:
+            free = self.em.pool.getFreeSlots()
+            if free is None:
+                free = self.max_batch
+            if free == 0:
+                return
+
+            entry_ids = self.getPendingIds(free, offset=skipped)
+            if len(entry_ids) == 0:
+                return
+
+            for entry_id in entry_ids:
+                if not self.running or not self.em.pool.hasCapacity():
+                    return
+
+                entry = self.getEntry(entry_id)
+                if entry is None or not entry.isPending():
+                    continue
+
+                dispatched = self.dispatch(entry)
+                if dispatched is None:
+                    skipped += 1
+                elif dispatched and self.max_rate is not None:
+                    time.sleep(1.0 / self.max_rate)
+
+    def stop(self):
+        with self.cv:
+            self.running = False
+            self.cv.notify()
+
+    def run(self):
+        while self.running:
+            try:
+                self.drain()
+            except Exception as e:
+                print("ExecutionQueue Exception:",e)
+
+            with self.cv:
+                if self.running:
+                    self.cv.wait(self.poll_interval)
@@ -11,26 +11,44 @@ import time
 from datetime import date, datetime, timezone
 from tzlocal import get_localzone 
 import traceback
-import re
+import os
 
 import sqlalchemy as sal
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 
 from ..exceptions import ImplementationIsNotAFunction, PipelineExecutionError
-from ..base import Argument, Async, asJob
+from ..base import Argument, Async, AsyncDummy, asJob, SharedResult
 from ..base import Observable
+from ..base.db import deduplicate
 from ..orchestrator import OrchestratorAccess
 
 from . import AbstractExecutor
 from .Events import *
 from .executePipelineAsJob import *
+from .ExecutionLog import ExecutionLog
+from .PipelineDAG import PipelineDAG
+from .DAGRunner import DAGRunner
+from .MapRunner import MapRunner
 
 Base = declarative_base()
 
 class Executor(AbstractExecutor, Base, Observable):
     
     __tablename__ = 'executions'
+    __table_args__ = (
+        sal.Index('ix_executions_uuid', 'uuid', unique=True),
+        sal.Index('ix_executions_name_id', 'name', 'id'),
+        sal.Index('ix_executions_name_creation', 'name', 'creation'),
+        sal.Index('ix_executions_parent_uuid', 'parent_uuid'),
+    )
+    # 2: indexes
+    # 3: parent executions (nodes of a DAG)
+    # 4: duplicated uuids removed before the unique index
+    __schema_version__ = 4
+    __migrations__ = {
+        4 : deduplicate("executions", "uuid")
+    }
     
     id             = sal.Column('id', sal.Integer, primary_key=True, nullable=False)
     name           = sal.Column('name', sal.String)
@@ -48,6 +66,24 @@ class Executor(AbstractExecutor, Base, Observable):
     pipeline_ret   = sal.Column('pipeline_ret', sal.TEXT)
     output         = sal.Column('output', sal.TEXT)
     error          = sal.Column('error', sal.TEXT)
+
+    # results beyond the inline threshold are kept in the artifact store.
+    # the columns above are then empty and these hold the reference and
+    # the size of the (decoded) value
+    pipeline_ret_ref  = sal.Column('pipeline_ret_ref', sal.String)
+    pipeline_ret_size = sal.Column('pipeline_ret_size', sal.Integer)
+    output_ref        = sal.Column('output_ref', sal.String)
+    output_size       = sal.Column('output_size', sal.Integer)
+    error_ref         = sal.Column('error_ref', sal.String)
+    error_size        = sal.Column('error_size', sal.Integer)
+
+    # executions started by another one (the nodes of a DAG pipeline)
+    parent_uuid       = sal.Column('parent_uuid', sal.String)
+    node              = sal.Column('node', sal.String)
+
+    # child executions of a running DAG pipeline or map (see DAGRunner
+    # and MapRunner)
+    runner         = None
     
     def __init__(self, em, pipeline, local=True, cores=1, partition=None, memory=None):
         
@@ -61,6 +97,7 @@ class Executor(AbstractExecutor, Base, Observable):
         self.local_job   = local
         self.partition   = partition
         self.memory      = memory
+        self.log_paths   = None
         
         # persistent attributes
         self.name        = pipeline.name
@@ -73,6 +110,10 @@ class Executor(AbstractExecutor, Base, Observable):
         
         if hasattr(pipeline,"scheduled_event_uuid"):
             self.sch_evt_uuid = pipeline.scheduled_event_uuid
+
+        if hasattr(pipeline,"parent_uuid"):
+            self.parent_uuid = pipeline.parent_uuid
+            self.node        = pipeline.node
         
         if not self.em.saveObject(self):
             print("error saving executor")
@@ -83,6 +124,7 @@ class Executor(AbstractExecutor, Base, Observable):
         self.em          = em
         self.handler     = None
         self.job_handler = None
+        self.log_paths   = None
             
     def setLocalJob(self, b):
         self.local_job = b
@@ -112,18 +154,43 @@ class Executor(AbstractExecutor, Base, Observable):
         self.pipeline_args = base64.b64encode(dill.dumps(pipeline_args))
         self.state         = 2  # initialized        
         
-        if not self.em.saveObject(self):
-            print("error saving executor")
-        
-        # add this executor to the executor manager active list
+        # add this executor to the executor manager active list (before
+        # its transitions are written behind)
         self.em.active[self.uuid] = self 
 
+        if not self.em.saveState(self):
+            print("error saving executor")
+
+        # memoized pipelines: a stored result for the same arguments
+        # finishes this execution without running it (see ResultCache)
+        cache_key = self.em.results.getKey(self.pipeline, self.pipeline_args)
+        if cache_key is not None:
+            cached = self.em.results.lookup(cache_key)
+            if cached is not None:
+                self.handler = AsyncDummy(self.finishFromCache)(cached)
+                return self
+
+        if isinstance(pipeline_fn, PipelineDAG):
+            self.runner  = DAGRunner(self, pipeline_fn)
+            self.handler = Async(self.runNodes)(args, kwargs, cache_key)
+            return self
+
         if inspect.isfunction(pipeline_fn):
             
             result = None
             
             output = StringIO()
             error  = StringIO()
+
+            # with a log directory, local executions stream their output to
+            # log files (the pipeline process writes into them as well)
+            streamed = False
+            if self.local_job:
+                self.log_paths = self.em.getLogPaths(self.uuid)
+                if self.log_paths is not None:
+                    output   = ExecutionLog(self.log_paths[0])
+                    error    = ExecutionLog(self.log_paths[1])
+                    streamed = True
             
             def oprint(*args):
                 print(*args, file=output)
@@ -131,9 +198,6 @@ class Executor(AbstractExecutor, Base, Observable):
             def eprint(*args):
                 print(*args, file=error)
 
-            # trigger execution start event
-            self.actionPerformed(ExecutionStarted(self.pipeline))
-            
             start_ts = datetime.now(timezone.utc).astimezone(get_localzone())
             oprint("Pipeline Execution")
             oprint("pipeline          : %s" % name)
@@ -146,6 +210,9 @@ class Executor(AbstractExecutor, Base, Observable):
             # or eventually cancel the execution
             
             exec_info = orch_access.exec_info
+
+            # tag of the shared memory of the result (see SharedResult)
+            result_tag = "%d-%s" % (os.getpid(), self.uuid)
             
             @Async
             def execute_pipeline():
@@ -154,17 +221,35 @@ class Executor(AbstractExecutor, Base, Observable):
                 # and wait for it to finish
  
                 exec_info = orch_access.exec_info
-               
+
+                # wait for a slot in the executor manager pool
+                def queued():
+                    oprint("execution queued. waiting for a free slot")
+                    self.state = 7  # queued
+                    if not self.em.saveState(self):
+                        eprint("error saving executor")
+
+                if not self.em.pool.acquire(self, on_queued=queued):
+                    print("execution %s cancelled while queued" % self.uuid)
+                    return None
+
                 try:
                     returned_arg = None
                     
                     orch_access_manager  = orch_access.manager
                     orch_access_pipeline = orch_access.pipeline
                     
-                    if self.local_job:
+                    if streamed:
+                        oprint("=================================================")
+                        oprint("execution output start")
+
+                    if self.local_job and self.em.workers is not None:
+                        oprint("executing pipeline in a worker process")
+                        self.job_handler = execute_pipeline_in_worker(self.em.workers, pipeline_fn, orch_access, args, kwargs, self.log_paths, result_tag )
+                    elif self.local_job:
                         oprint("executing pipeline as process")
                         #orch_access.pipeline = None
-                        self.job_handler = execute_pipeline_as_local(self.cores, pipeline_fn, orch_access, args, kwargs )
+                        self.job_handler = execute_pipeline_as_local(self.cores, pipeline_fn, orch_access, args, kwargs, self.log_paths, result_tag )
                     else:
                         oprint("executing pipeline as job")
                         # TODO: until providing a better orch_access to be used from compute nodes
@@ -178,17 +263,21 @@ class Executor(AbstractExecutor, Base, Observable):
                     self.start_ts = start_ts
                     self.state    = 3  # running
 
-                    if not self.em.saveObject(self):
+                    if not self.em.saveState(self):
                         eprint("error saving executor")
+
+                    # trigger execution start event, once admitted in the pool
+                    self.actionPerformed(ExecutionStarted(self.pipeline, self.uuid, self.state))
                     
                     try:
                         # wait for the result (the second get is to get the returned argument value)
                         if self.local_job:
                             h = self.job_handler.get()
-                            if h is not None:
+                            if isinstance(h, Argument):
                                 returned_arg = h.get()
                             else:
-                                returned_arg = None
+                                # worker processes return the value itself
+                                returned_arg = h
                         else:
                             returned_arg = self.job_handler.get()
 
@@ -203,6 +292,15 @@ class Executor(AbstractExecutor, Base, Observable):
 
                     if returned_arg is not None:
                         success, result, b64_output, b64_error, exec_info = returned_arg
+
+                    if isinstance(result, SharedResult):
+                        # large buffers of the result are mapped, not copied
+                        try:
+                            result = result.get()
+                        except Exception as e:
+                            eprint("error getting the shared result:",e)
+                            result = None
+                            success = False
                         
                     if success:
                         oprint("pipeline execution successfully finished")
@@ -222,22 +320,25 @@ class Executor(AbstractExecutor, Base, Observable):
                     self.pipeline_ret = base64.b64encode(dill.dumps(result))
                     self.pipeline.result = self.pipeline_ret
 
-                    self.actionPerformed(ExecutionFinished(self.pipeline))
-                    
                     end_ts = datetime.now(timezone.utc).astimezone(get_localzone())
                     self.end_ts = end_ts
                     self.exec_time = end_ts - start_ts
     
-                    exec_output = "No captured output"
-                    if b64_output is not None:
-                        exec_output = base64.b64decode(b64_output).decode('utf8')
+                    if streamed:
+                        # the output is already in the log files
+                        oprint("execution output end")
+                        oprint("=================================================")
+                    else:
+                        exec_output = "No captured output"
+                        if b64_output is not None:
+                            exec_output = base64.b64decode(b64_output).decode('utf8')
+                    
+                        exec_error = "No captured output"
+                        if b64_error is not None:
+                            exec_error  = base64.b64decode(b64_error).decode('utf8')
                 
-                    exec_error = "No captured output"
-                    if b64_error is not None:
-                        exec_error  = base64.b64decode(b64_error).decode('utf8')
-            
-                    exec_output = re.sub("(.*):\/\/(.*):(.*)@(.*)","\\1://*****:******@\\4",exec_output)
-                    exec_error = re.sub("(.*):\/\/(.*):(.*)@(.*)","\\1://*****:******@\\4",exec_error)
+                        exec_output = ExecutionLog.mask(exec_output)
+                        exec_error = ExecutionLog.mask(exec_error)
    
                     if self.pipeline.report is not None:
                         oprint("=================================================")
@@ -246,27 +347,38 @@ class Executor(AbstractExecutor, Base, Observable):
                         oprint("execution report end")
                         oprint("=================================================")
     
-                    oprint("=================================================")
-                    oprint("execution output start")
-                    oprint(exec_output)
-                    eprint(exec_error)
-                    oprint("execution output end")
-                    oprint("=================================================")
+                    if not streamed:
+                        oprint("=================================================")
+                        oprint("execution output start")
+                        oprint(exec_output)
+                        eprint(exec_error)
+                        oprint("execution output end")
+                        oprint("=================================================")
 
                     oprint("pipeline return value")
                     oprint(result)
 
                     oprint("pipeline execution complete")
 
-                    output.seek(0)
-                    error.seek(0)
+                    self.output   = base64.b64encode(output.getvalue().encode('utf8'))
+                    self.error    = base64.b64encode(error.getvalue().encode('utf8'))
 
-                    self.output   = base64.b64encode(output.read().encode('utf8'))
-                    self.error    = base64.b64encode(error.read().encode('utf8'))
+                    self.spillResults()
 
                     if not self.em.saveObject(self):
                         eprint("error saving executor")
 
+                    if cache_key is not None and self.state == 4:
+                        self.em.results.store(cache_key, self)
+
+                    if streamed:
+                        # the stored output replaces the log files
+                        output.remove()
+                        error.remove()
+
+                    # listeners get the execution already stored
+                    self.actionPerformed(ExecutionFinished(self.pipeline, self.uuid, self.state))
+
                     # check for execution notification
                     if exec_info.notify_execution:
                         self.em.sendExecutionNotification(self.pipeline, self.uuid, exec_info.notification_target, show=exec_info.notification_show)
@@ -293,26 +405,49 @@ class Executor(AbstractExecutor, Base, Observable):
                     eprint(e)
                     eprint(st_str)
                     
-                    output.seek(0)
-                    error.seek(0)
-
-                    if self.uuid in self.em.active:
-                        del self.em.active[self.uuid]
-                    
                     if exec_info is None:
                         exec_info = orch_access.exec_info
                                             
-                    self.output   = base64.b64encode(output.read().encode('utf8'))
-                    self.error    = base64.b64encode(error.read().encode('utf8'))
+                    self.output   = base64.b64encode(output.getvalue().encode('utf8'))
+                    self.error    = base64.b64encode(error.getvalue().encode('utf8'))
+
+                    # the return value of a failed execution is the exception
+                    if self.pipeline_ret is None:
+                        try:
+                            self.pipeline_ret = base64.b64encode(dill.dumps(e))
+                        except Exception:
+                            self.pipeline_ret = base64.b64encode(dill.dumps(RuntimeError("%s" % e)))
+                    self.pipeline.state  = self.state
+                    self.pipeline.result = self.pipeline_ret
+
+                    self.spillResults()
 
                     if not self.em.saveObject(self):
                         print("error saving executor")
 
+                    # removed once stored, lookups do not see a stale state
+                    if self.uuid in self.em.active:
+                        del self.em.active[self.uuid]
+
+                    if streamed:
+                        output.remove()
+                        error.remove()
+
+                    self.actionPerformed(ExecutionFinished(self.pipeline, self.uuid, self.state))
+
                     # check for execution notification
                     if exec_info.notify_execution:
                         self.em.sendExecutionNotification(self.pipeline, self.uuid, exec_info.notification_target, show=exec_info.notification_show)
                     
                     return e
+
+                finally:
+                    # the shared memory of a result not got (cancelled,
+                    # failed or dead process) is removed
+                    SharedResult.discard(result_tag)
+
+                    # give the slot back to the pool
+                    self.em.pool.release(self)
                 
             try:
                 # execute pipeline as job
@@ -327,7 +462,121 @@ class Executor(AbstractExecutor, Base, Observable):
         else:
             raise ImplementationIsNotAFunction(name)
 
+    def finishFromCache(self, cached):
+        # finishes the execution with the result of a previous one with the
+        # same arguments. The slot reserved by the run queue is given back
+        self.em.pool.release(self)
+        self.actionPerformed(ExecutionStarted(self.pipeline, self.uuid, self.state))
+
+        now = datetime.now(timezone.utc).astimezone(get_localzone())
+        self.start_ts  = now
+        self.end_ts    = now
+        self.exec_time = now - now
+        self.state     = 4  # finished
+
+        self.pipeline_ret      = cached["pipeline_ret"]
+        self.pipeline_ret_ref  = cached["pipeline_ret_ref"]
+        self.pipeline_ret_size = cached["pipeline_ret_size"]
+        self.output = base64.b64encode(("pipeline result memoized from execution %s\n" % cached["uuid"]).encode("utf8"))
+        self.error  = base64.b64encode(b"")
+
+        self.pipeline.state  = self.state
+        self.pipeline.result = self.getEncoded("pipeline_ret")
+
+        if not self.em.saveObject(self):
+            print("error saving executor")
+
+        if self.uuid in self.em.active:
+            del self.em.active[self.uuid]
+
+        self.actionPerformed(ExecutionFinished(self.pipeline, self.uuid, self.state))
+
+        return self.getReturnValue()
+
+    def runMap(self, items, kwargs={}, chunksize=1, max_parallel=None, gather="list"):
+        # runs the pipeline for each one of the items, in child executions
+        # (see MapRunner). The result is the list of their results
+        items = list(items)
+        self.runner = MapRunner(self, chunksize=chunksize, max_parallel=max_parallel, gather=gather)
+
+        self.pipeline.setArguments((items,))
+        self.pipeline.setKeywordArguments(kwargs)
+        self.pipeline.report = None
+
+        self.pipeline_args = base64.b64encode(dill.dumps({ 'args' : (items,), 'kwargs' : kwargs }))
+        self.state         = 2  # initialized
+        self.em.active[self.uuid] = self
+
+        if not self.em.saveState(self):
+            print("error saving executor")
+
+        self.handler = Async(self.runNodes)(items, kwargs)
+        return self
+
+    def runNodes(self, args, kwargs, cache_key=None):
+        # coordinates the child executions of a DAG or a map, which take the
+        # slots of the pool. The one reserved by the run queue is given back
+        self.em.pool.release(self)
+
+        start_ts = datetime.now(timezone.utc).astimezone(get_localzone())
+        self.start_ts = start_ts
+        self.state    = 3  # running
+        if not self.em.saveState(self):
+            print("error saving executor")
+        self.actionPerformed(ExecutionStarted(self.pipeline, self.uuid, self.state))
+
+        output = ""
+        error  = ""
+        try:
+            output = self.runner.getDescription(args, kwargs)
+            if self.runner.run(args, kwargs):
+                result = self.runner.getResult()
+                self.state = 4  # finished
+            else:
+                result = self.runner.getError()
+                self.state = 6 if self.runner.cancelled else 5
+                error = "%s" % result
+        except Exception as e:
+            print("exception when running the nodes of %s: %s" % (self.name, e))
+            result = e
+            self.state = 5  # error
+            error = traceback.format_exc()
+
+        end_ts = datetime.now(timezone.utc).astimezone(get_localzone())
+        self.end_ts    = end_ts
+        self.exec_time = end_ts - start_ts
+
+        output = "%s\nstart time        : %s\n%s\n" % (output, start_ts, self.runner.getSummary())
+        self.output = base64.b64encode(output.encode("utf8"))
+        self.error  = base64.b64encode(error.encode("utf8"))
+
+        try:
+            self.pipeline_ret = base64.b64encode(dill.dumps(result))
+        except Exception as e:
+            self.pipeline_ret = base64.b64encode(dill.dumps(RuntimeError("%s" % e)))
+        self.pipeline.state  = self.state
+        self.pipeline.result = self.pipeline_ret
+
+        self.spillResults()
+
+        if not self.em.saveObject(self):
+            print("error saving executor")
+
+        if cache_key is not None and self.state == 4:
+            self.em.results.store(cache_key, self)
+
+        if self.uuid in self.em.active:
+            del self.em.active[self.uuid]
+
+        self.actionPerformed(ExecutionFinished(self.pipeline, self.uuid, self.state))
+
+        return result
+
     def cancel(self):
+        if self.runner is not None:
+            # the state is saved when its child executions are done
+            return self.runner.cancel()
+
         if self.handler is not None:
             if self.job_handler is not None:
                 self.job_handler.cancel()
@@ -339,6 +588,19 @@ class Executor(AbstractExecutor, Base, Observable):
                 if not self.em.saveObject(self):
                     print("error saving executor when cancelling executing")
                 else:
+                    self.actionPerformed(ExecutionCancelled(self.pipeline, self.uuid))
+                    return True
+            elif self.em.pool.cancel(self):
+                # execution still waiting for a slot
+                self.state = 6 # cancelled
+
+                if self.uuid in self.em.active:
+                    del self.em.active[self.uuid]
+
+                if not self.em.saveObject(self):
+                    print("error saving executor when cancelling executing")
+                else:
+                    self.actionPerformed(ExecutionCancelled(self.pipeline, self.uuid))
                     return True
         else:
             self.state = 6 # cancelled
@@ -348,18 +610,67 @@ class Executor(AbstractExecutor, Base, Observable):
             if not self.em.saveObject(self):
                 print("error saving executor when cancelling executing")
             else:
+                self.actionPerformed(ExecutionCancelled(getattr(self, "pipeline", None), self.uuid))
                 return True
         
         return False
             
+    def tailOutput(self, offset=0, error_offset=0):
+        # output and errors from the given offsets (in bytes). While the
+        # execution runs they come from its log files (whole lines only)
+        # and once finished from the stored output
+        if self.log_paths is not None and os.path.exists(self.log_paths[0]):
+            output, offset = ExecutionLog.tail(self.log_paths[0], offset)
+            error, error_offset = ExecutionLog.tail(self.log_paths[1], error_offset)
+            running = True
+        else:
+            output, offset = ExecutionLog.slice(self.getOutput(), offset)
+            error, error_offset = ExecutionLog.slice(self.getErrors(), error_offset)
+            running = not self.isDone() and self.state != 6
+
+        return {
+            "output"       : output,
+            "offset"       : offset,
+            "error"        : error,
+            "error_offset" : error_offset,
+            "running"      : running,
+            "state"        : self.state
+        }
+
+    def spillResults(self):
+        # move the results larger than the inline threshold to the artifact
+        # store. The value is stored decoded (not in base64)
+        if self.em.artifacts is None:
+            return
+
+        for name in ["pipeline_ret", "output", "error"]:
+            value = getattr(self, name)
+            if value is None:
+                continue
+            if isinstance(value, str):
+                value = value.encode("utf8")
+            if len(value) <= self.em.inline_threshold:
+                continue
+
+            try:
+                data = base64.b64decode(value, validate=True)
+                ref  = self.em.artifacts.put(data)
+            except Exception as e:
+                print("unable to store %s of execution %s as artifact: %s" % (name, self.uuid, e))
+                continue
+
+            setattr(self, name, None)
+            setattr(self, name + "_ref", ref)
+            setattr(self, name + "_size", len(data))
+
     def serialize(self):
-        s_output = None
-        if self.output is not None:
-            s_output = self.output.decode("utf8")
+        s_output = self.getEncoded("output")
+        if isinstance(s_output, bytes):
+            s_output = s_output.decode("utf8")
             
-        s_error = None
-        if self.error is not None:
-            s_error = self.error.decode("utf8")
+        s_error = self.getEncoded("error")
+        if isinstance(s_error, bytes):
+            s_error = s_error.decode("utf8")
             
         s_args = None
         if self.pipeline_args is not None:
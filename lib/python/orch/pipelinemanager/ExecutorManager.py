@@ -3,6 +3,13 @@
 from ..base import ActionListener, Observable
 from ..base.db import DataBaseBackend
 from . import Executor
+from .ExecutionPool import ExecutionPool
+from .ExecutionMonitor import ExecutionMonitor
+from .ExecutionJournal import ExecutionJournal
+from .ResultCache import ResultCache
+from ..base import WorkerPool
+from ..base import ArtifactStore
+from ..base import SharedResult
 from ..exceptions import InitializeError,MultipleExecutionIDFound,ExecutionIdNotFound
 
 from email.message import EmailMessage
@@ -13,11 +20,16 @@ import traceback
 import re
 import time
 import ssl
+import os
 
 class ExecutorManager(DataBaseBackend,ActionListener, Observable):
     
     active = {}
 
+    # state transitions of the running executions are written behind, in
+    # batches every journal_window seconds (None: saved right away)
+    journal_window = 0.2
+
     def sendMail(self,mail_dst,subject=None, mail_cc=[],bounce_dest=None, mail_content=None, mail_content_html=None, attachments=None):
         # compose the email
 
@@ -71,13 +83,89 @@ class ExecutorManager(DataBaseBackend,ActionListener, Observable):
 
             s.quit()
 
-    def __init__(self,owner,db_conn_str="sqlite:///orchestrator.sqlite"):
+    def __init__(self,owner,db_conn_str="sqlite:///orchestrator.sqlite", max_workers=None, max_per_pipeline=None, max_per_owner=None, warm_workers=False, worker_max_tasks=100, worker_max_memory=None, artifact_dir=None, inline_threshold=65536, log_dir=None):
         super().__init__(db_conn_str)
         self.owner = owner
         self.smtp_crd = owner.smtp_crd
+        # admission control: executions beyond the limits wait queued
+        # (max_workers defaults to the number of cpus)
+        self.pool = ExecutionPool(max_workers, max_per_pipeline, max_per_owner)
+
+        # pre-forked processes running the local executions, forked by a
+        # fork server (see WorkerPool). Without them each local execution
+        # starts its own process (asLocalJob)
+        self.workers = None
+        if warm_workers:
+            self.workers = WorkerPool(size=self.pool.max_workers, max_tasks=worker_max_tasks, max_memory=worker_max_memory)
+            self.workers.prefork()
+
+        # results and logs larger than inline_threshold bytes are kept in
+        # the artifact store (when artifact_dir is given) instead of the
+        # executions table
+        self.inline_threshold = inline_threshold
+        self.artifacts = None
+        if artifact_dir is not None:
+            self.artifacts = ArtifactStore(artifact_dir)
+
+        # shared memory of results left by an orchestrator not running
+        removed = SharedResult.sweep()
+        if removed > 0:
+            print("removed %d stale shared results" % removed)
+
+        # local executions stream their output to log files in log_dir
+        # (when given). Otherwise it is captured until they finish
+        self.log_dir = log_dir
+
+        # states of the executions as reported by their events, for the
+        # clients waiting for them
+        self.monitor = ExecutionMonitor()
+
+        # results of the memoized pipelines (see ResultCache)
+        self.results = ResultCache()
+
         if not self.initialize(Executor):
             raise InitializeError(Executor.__tablename__)
 
+        self.journal = None
+        if self.journal_window is not None:
+            self.journal = ExecutionJournal(self.getEngine(), Executor.__table__, window=self.journal_window)
+            self.journal.start()
+
+    def saveState(self, executor):
+        # saves a state transition of a running executor (see ExecutionJournal).
+        # Executors not stored yet are saved right away
+        if self.journal is None or not self.journal.running or executor.id is None:
+            return self.saveObject(executor)
+        return self.journal.record(executor)
+
+    def saveObject(self, p_obj):
+        # the pending transitions of an executor are written with it
+        if self.journal is not None and isinstance(p_obj, Executor):
+            self.journal.settle(p_obj.uuid)
+        return super().saveObject(p_obj)
+
+    def stopJournal(self):
+        if self.journal is not None:
+            self.journal.stop()
+
+    def getJournalStatus(self):
+        if self.journal is None:
+            return None
+        return self.journal.getStatus()
+
+    def getObjects(self, p_obj, *args, **kwargs):
+        # the executors loaded get their results through this manager
+        return self.attach(super().getObjects(p_obj, *args, **kwargs))
+
+    def getObjectsPage(self, p_obj, *args, **kwargs):
+        return self.attach(super().getObjectsPage(p_obj, *args, **kwargs))
+
+    def attach(self, objects):
+        for obj in objects:
+            if isinstance(obj, Executor) and getattr(obj, "em", None) is None:
+                obj.em = self
+        return objects
+
     def create(self,pipeline, *args, **kw_args):
         executor = Executor(self, pipeline, *args, **kw_args)
         executor.addActionListener(self)
@@ -106,7 +194,65 @@ class ExecutorManager(DataBaseBackend,ActionListener, Observable):
             
         return None
     
-    def getExecutionList(self, pipeline_name, **kw_args):
+    def getExecutorsByID(self, executor_ids, defer_cols=[], chunk_size=500):
+        # executors of a list of ids (uuid -> executor). The active ones
+        # are taken from the active list and the rest are fetched with one
+        # query per chunk_size ids. Unknown ids are not in the result
+        executors = {}
+        missing   = []
+        for executor_id in executor_ids:
+            if executor_id in executors:
+                continue
+            if executor_id in self.active:
+                executors[executor_id] = self.active[executor_id]
+            else:
+                missing.append(executor_id)
+
+        missing = list(dict.fromkeys(missing))
+        for i in range(0, len(missing), chunk_size):
+            chunk = missing[i:i + chunk_size]
+            for executor in self.getObjects(Executor, Executor.uuid.in_(chunk), defer_cols=defer_cols):
+                executors[executor.uuid] = executor
+
+        return executors
+
+    def getExecutionFields(self, fields):
+        # columns to load for a projection of the executions. The columns
+        # kept in the artifact store need their reference too
+        columns = [ c.name for c in Executor.__table__.columns ]
+        only_cols = ["id", "uuid"]
+        for field in fields:
+            if field not in columns:
+                raise RuntimeError("unknown execution field %s" % field)
+            only_cols.append(field)
+            if field + "_ref" in columns:
+                only_cols.append(field + "_ref")
+        return list(dict.fromkeys(only_cols))
+
+    def getExecutionList(self, pipeline_name, after_id=None, limit=None, since=None, until=None, fields=None, order="asc", defer_cols=["output","error"], **kw_args):
+        if after_id is not None or limit is not None or since is not None or until is not None or fields is not None or order != "asc":
+            # page of executions sorted by id: the ones after after_id (before
+            # it when descending), created between since and until
+            filters = [ Executor.name == pipeline_name ]
+            if order == "desc":
+                order_by = Executor.id.desc()
+                if after_id is not None:
+                    filters.append(Executor.id < after_id)
+            else:
+                order_by = Executor.id.asc()
+                if after_id is not None:
+                    filters.append(Executor.id > after_id)
+            if since is not None:
+                filters.append(Executor.creation >= since)
+            if until is not None:
+                filters.append(Executor.creation < until)
+
+            only_cols = None
+            if fields is not None:
+                only_cols = self.getExecutionFields(fields)
+
+            return self.getObjectsPage(Executor, *filters, order_by=order_by, limit=limit, only_cols=only_cols, defer_cols=defer_cols, **kw_args)
+
         exec_list = []
         # get the active executions first
         for uuid, ex in self.active.items():
@@ -122,6 +268,14 @@ class ExecutorManager(DataBaseBackend,ActionListener, Observable):
 
         return executors
     
+    def getChildExecutions(self, parent_uuid, defer_cols=["output","error"]):
+        # executions started by another one (the nodes of a DAG), in order
+        children = { ex.uuid : ex for ex in self.active.values() if ex.parent_uuid == parent_uuid }
+        for ex in self.getObjectsPage(Executor, Executor.parent_uuid == parent_uuid, order_by=Executor.id.asc(), defer_cols=defer_cols):
+            if ex.uuid not in children:
+                children[ex.uuid] = ex
+        return sorted(children.values(), key=lambda ex: ex.id)
+
     def getExecutionsBy(self, where, **kw_args):
         exec_list = []
         
@@ -139,9 +293,62 @@ class ExecutorManager(DataBaseBackend,ActionListener, Observable):
 
         return exec_list
     
+    def getLogPaths(self, executor_id):
+        # stdout and stderr log files of an execution
+        if self.log_dir is None:
+            return None
+        return (
+            os.path.join(self.log_dir, "%s.out" % executor_id),
+            os.path.join(self.log_dir, "%s.err" % executor_id)
+        )
+
+    def waitExecution(self, executor_id, timeout=None):
+        # waits for the execution to finish (or the timeout to expire) and
+        # returns its state. Only the first wait for an execution that is
+        # neither active nor known by the monitor queries the database
+        state = self.monitor.getState(executor_id)
+        if state is None:
+            executor = self.getExecutorByID(executor_id)
+            # an event may have arrived meanwhile. it is more recent
+            state = self.monitor.update(executor_id, executor.state, only_if_unknown=True)
+
+        if ExecutionMonitor.isDone(state):
+            return state
+
+        return self.monitor.wait(executor_id, timeout)
+
     def getRunningExecutions(self):
         exec_list = list(self.active.values())
         return exec_list
+
+    def getQueuedExecutions(self):
+        exec_list = [ ex for ex in self.active.values() if ex.isQueued() ]
+        return exec_list
+
+    def setPipelineLimit(self, pipeline_name, limit):
+        self.pool.setPipelineLimit(pipeline_name, limit)
+
+    def setPipelineMemoization(self, pipeline_name, enabled=True, ttl=None):
+        if enabled:
+            self.results.enable(pipeline_name, ttl)
+        else:
+            self.results.disable(pipeline_name)
+
+    def getMemoizationStats(self, pipeline_name=None):
+        return self.results.getStats(pipeline_name)
+
+    def setOwnerLimit(self, owner_id, limit):
+        self.pool.setOwnerLimit(owner_id, limit)
+
+    def getPoolStatus(self):
+        status = self.pool.getStatus()
+        if self.workers is not None:
+            status["workers"] = self.workers.getStatus()
+        return status
+
+    def stopWorkers(self):
+        if self.workers is not None:
+            self.workers.stop()
     
     def sendExecutionNotification(self, pipeline, exec_id, target, show="all"):
         
@@ -243,5 +450,9 @@ class ExecutorManager(DataBaseBackend,ActionListener, Observable):
         print("notification sent to %s" % target)
 
     def actionPerformed(self, evt):
-        # onyl forward the event to all listeners
+        # keep the state of the execution for the waiting clients
+        if getattr(evt, "execution_id", None) is not None and evt.state is not None:
+            self.monitor.update(evt.execution_id, evt.state)
+
+        # forward the event to all listeners
         Observable.actionPerformed(self,evt)
@@ -0,0 +1,62 @@
+# FunctionCache
+#
+# process wide LRU cache of the decoded pipeline functions, keyed by the
+# pipeline name, its version and the sha256 of its serialized function, so
+# a pipeline executed many times is decoded (dill.loads) once. The entries
+# of a pipeline are dropped when a new version of it is registered.
+
+from threading import Lock
+from collections import OrderedDict
+import hashlib
+import base64
+import dill
+
+class FunctionCache(object):
+
+    max_entries = 128
+    lock        = Lock()
+    entries     = OrderedDict()   # (name, version, sha256) -> function
+    hits        = 0
+    misses      = 0
+
+    @classmethod
+    def getKey(cls, name, version, impl_fn):
+        if isinstance(impl_fn, str):
+            impl_fn = impl_fn.encode("utf8")
+        return (name, version, hashlib.sha256(impl_fn).hexdigest())
+
+    @classmethod
+    def get(cls, name, version, impl_fn):
+        key = cls.getKey(name, version, impl_fn)
+        with cls.lock:
+            if key in cls.entries:
+                cls.entries.move_to_end(key)
+                cls.hits += 1
+                return cls.entries[key]
+            cls.misses += 1
+
+        # decoded out of the lock, a concurrent miss decodes it as well
+        function = dill.loads(base64.b64decode(impl_fn))
+
+        with cls.lock:
+            cls.entries[key] = function
+            cls.entries.move_to_end(key)
+            while len(cls.entries) > cls.max_entries:
+                cls.entries.popitem(last=False)
+        return function
+
+    @classmethod
+    def invalidate(cls, name=None):
+        # drops the functions of a pipeline (or all of them)
+        with cls.lock:
+            for key in [ k for k in cls.entries if name is None or k[0] == name ]:
+                del cls.entries[key]
+
+    @classmethod
+    def getStats(cls):
+        with cls.lock:
+            return {
+                "entries" : len(cls.entries),
+                "hits"    : cls.hits,
+                "misses"  : cls.misses
+            }
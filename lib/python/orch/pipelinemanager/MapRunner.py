@@ -0,0 +1,179 @@
+# MapRunner
+#
+# runs a pipeline over a list of items for a map execution. The items are
+# split in chunks of chunksize, each one run by an execution of its own
+# (a child of the map execution, its node column is the range of items)
+# with at most max_parallel of them at the same time. They take the slots
+# of the pool as any execution, run as local processes or as jobs, and
+# get the pipeline function called once per item, with the keyword
+# arguments of the map.
+#
+# The results are gathered in the order of the items, as a list or as a
+# DataFrame ("frame": the results concatenated when they are DataFrames,
+# otherwise one row per item). When items fail, the others go on and the
+# map fails with a PipelineMapError holding the results and the errors.
+
+from threading import Thread, Lock
+import base64
+import queue
+import dill
+import pandas as pd
+
+from ..exceptions import PipelineMapError
+from .Pipeline import Pipeline
+from .executePipelineAsJob import run_pipeline_chunk
+
+class MapRunner(object):
+
+    def __init__(self, executor, chunksize=1, max_parallel=None, gather="list"):
+        self.validate(chunksize, gather)
+
+        if max_parallel is None:
+            max_parallel = executor.em.pool.max_workers
+        self.executor     = executor   # execution of the map
+        self.chunksize    = chunksize
+        self.max_parallel = max(1, max_parallel or 1)
+        self.gather       = gather
+        self.finished     = queue.Queue()
+        self.lock         = Lock()
+        self.children     = {}         # first item of the chunk -> executor
+        self.nodes        = {}         # first item of the chunk -> state, uuid and timing
+        self.results      = []
+        self.errors       = {}         # item -> error
+        self.cancelled    = False
+
+    @classmethod
+    def validate(cls, chunksize, gather):
+        if chunksize is None or chunksize < 1:
+            raise RuntimeError("chunksize must be a positive integer")
+        if gather not in ("list", "frame"):
+            raise RuntimeError("gather must be list or frame")
+        return True
+
+    def getPipeline(self, first, last):
+        # the pipeline with the function running the chunk
+        parent = self.executor.pipeline
+        pipeline = Pipeline(
+            name     = parent.name,
+            owner_id = parent.owner_id,
+            version  = parent.version,
+            tags     = parent.tags,
+            active   = False,
+            impl_fn  = base64.b64encode(dill.dumps(run_pipeline_chunk))
+        )
+        pipeline.catalog     = parent.catalog
+        pipeline.manager     = parent.manager
+        pipeline.parent_uuid = self.executor.uuid
+        pipeline.node        = "%d:%d" % (first, last)
+        return pipeline
+
+    def start(self, first, chunk):
+        self.nodes[first] = { "state" : 1, "uuid" : None, "items" : len(chunk) }
+        try:
+            with self.lock:
+                if self.cancelled:
+                    raise RuntimeError("map execution cancelled")
+                parent = self.executor
+                child = parent.em.create(self.getPipeline(first, first + len(chunk)), local=parent.local_job, cores=parent.cores, partition=parent.partition, memory=parent.memory)
+                self.children[first] = child
+            self.nodes[first]["uuid"] = child.uuid
+            child.run(self.function, chunk, self.kwargs)
+        except Exception as e:
+            self.finished.put((first, None, e))
+            return
+
+        Thread(target=self.wait, args=(first, child), name="map-chunk-%d" % first, daemon=True).start()
+
+    def wait(self, first, child):
+        try:
+            value = child.handler.get()
+        except Exception as e:
+            value = e
+        self.finished.put((first, child, value))
+
+    def run(self, items, kwargs):
+        self.function = self.executor.pipeline.getFunction()
+        self.kwargs   = kwargs
+        self.results  = [ None ] * len(items)
+
+        chunks  = [ (i, items[i:i + self.chunksize]) for i in range(0, len(items), self.chunksize) ]
+        pending = list(reversed(chunks))
+        running = 0
+        while len(pending) > 0 or running > 0:
+            while len(pending) > 0 and running < self.max_parallel and not self.cancelled:
+                first, chunk = pending.pop()
+                self.start(first, chunk)
+                running += 1
+
+            if running == 0:
+                # cancelled, the chunks left are not started
+                break
+
+            first, child, value = self.finished.get()
+            running -= 1
+
+            size  = self.nodes[first]["items"]
+            state = child.state if child is not None else 5
+            self.nodes[first]["state"] = state
+            if child is not None:
+                self.nodes[first].update({
+                    "start_ts"  : child.start_ts,
+                    "end_ts"    : child.end_ts,
+                    "exec_time" : child.exec_time
+                })
+
+            if state == 4 and isinstance(value, list) and len(value) == size:
+                self.results[first:first + size] = value
+            elif isinstance(value, PipelineMapError):
+                # some items of the chunk failed
+                self.results[first:first + size] = value.results
+                for i, error in value.errors.items():
+                    self.errors[first + int(i)] = error
+            else:
+                for i in range(first, first + size):
+                    self.errors[i] = "%s" % value if value is not None else "execution state %s" % state
+
+        for first, chunk in pending:
+            for i in range(first, first + len(chunk)):
+                self.errors[i] = "not executed"
+
+        return self.isSuccessful()
+
+    def isSuccessful(self):
+        return not self.cancelled and len(self.errors) == 0
+
+    def getResult(self):
+        if self.gather == "list":
+            return self.results
+        if len(self.results) > 0 and all([ isinstance(r, pd.DataFrame) for r in self.results ]):
+            return pd.concat(self.results)
+        return pd.DataFrame({ "result" : self.results })
+
+    def getError(self):
+        return PipelineMapError(self.results, self.errors)
+
+    def cancel(self):
+        # no more chunks are started, the running ones are cancelled
+        with self.lock:
+            self.cancelled = True
+            children = list(self.children.values())
+        for child in children:
+            if not child.isDone() and child.state != 6:
+                child.cancel()
+        return True
+
+    def getDescription(self, items, kwargs):
+        return "Map Execution\npipeline          : %s\npipeline version  : %d\nitems             : %d\nchunksize         : %d\nmax parallel      : %d\nkeyword arguments : %s" % (
+            self.executor.name, self.executor.version, len(items), self.chunksize, self.max_parallel, str(kwargs)
+        )
+
+    def getSummary(self):
+        lines = []
+        for first in sorted(self.nodes.keys()):
+            node = self.nodes[first]
+            lines.append("items %d:%d state %s uuid %s start %s end %s exec_time %s" % (
+                first, first + node["items"], node.get("state"), node.get("uuid"), node.get("start_ts"), node.get("end_ts"), node.get("exec_time")
+            ))
+        for i, error in sorted(self.errors.items()):
+            lines.append("item %d failed: %s" % (i, error))
+        return "\n".join(lines)
@@ -5,12 +5,23 @@ import base64
 import dill
 
 # Pipeline
+from ..base.db import deduplicate
 from . import AbstractPipeline
 from sqlalchemy.ext.declarative import declarative_base
 Base = declarative_base()
 
 class Pipeline(AbstractPipeline,Base):
     __tablename__ = 'pipelines'
+    __table_args__ = (
+        sal.Index('ix_pipelines_name_version', 'name', 'version', unique=True),
+        sal.Index('ix_pipelines_name_active', 'name', 'active'),
+    )
+    # 2: indexes
+    # 3: duplicated versions removed before the unique index
+    __schema_version__ = 3
+    __migrations__ = {
+        3 : deduplicate("pipelines", "name", "version")
+    }
     
     id         = sal.Column('id', sal.Integer, primary_key=True, nullable=False)
     name       = sal.Column('name', sal.String)
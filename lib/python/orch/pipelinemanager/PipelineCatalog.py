@@ -2,13 +2,16 @@
 # PipelineCatalog    
 import base64
 import dill
-import pandas as pd
 
+import sqlalchemy as sal
 from sqlalchemy.sql import func
 
 from ..base.db import DataBaseBackend
 from ..exceptions import InitializeError, PipelineAlreadyRegistered, PipelineNotFound, PipelineNotSavedInCatalog
 from . import Pipeline
+from .FunctionCache import FunctionCache
+from .CatalogIndex import CatalogIndex
+from .PipelineDAG import PipelineDAG
 
 class PipelineCatalog(DataBaseBackend):
 
@@ -20,14 +23,27 @@ class PipelineCatalog(DataBaseBackend):
         
         if not self.initialize(Pipeline):
             raise InitializeError(Pipeline.__tablename__)
+
+        # lookups by name answered from memory (see CatalogIndex)
+        self.index = CatalogIndex(self)
+        self.index.initialize()
             
     def isRegistered(self,name,**kw_args):
+        if self.index.canAnswer((), dict(kw_args, name=name)):
+            return self.index.isRegistered(name=name, **kw_args)
+
         result = self.getObjects(Pipeline, name=name,**kw_args)
         if len(result)>0:
             return True
         return False
 
     def register(self, name, owner_id, pipeline_fn, tags=[], new_version = False ):
+        if isinstance(pipeline_fn, PipelineDAG):
+            # the nodes run as executions of their own (see DAGRunner)
+            pipeline_fn.validate()
+            if "dag" not in tags:
+                tags = tags + ["dag"]
+
         if not new_version:
             if not self.isRegistered(name):
             
@@ -59,10 +75,10 @@ class PipelineCatalog(DataBaseBackend):
             
         else:
             if self.isRegistered(name):
-                df = pd.read_sql("SELECT max(version) as version FROM pipelines where name=='%s'"% name, con=self.getEngine())
+                with self.getEngine().connect() as conn:
+                    cur_version = conn.execute(sal.select(func.max(Pipeline.version)).where(Pipeline.name == name)).scalar()
                 
-                cur_version = int(df.version.values[0])
-                new_version = cur_version+1
+                new_version = int(cur_version)+1
             
                 #TODO: encrypt serialization with owner_key
                 pipeline_serialized = base64.b64encode(dill.dumps(pipeline_fn))
@@ -79,6 +95,9 @@ class PipelineCatalog(DataBaseBackend):
                 )
 
                 if self.saveObject(new_pipeline):
+                    # the decoded functions of the previous versions
+                    FunctionCache.invalidate(name)
+
                     saved_pipeline = self.getObjects(Pipeline,
                         name      = name, 
                         owner_id  = owner_id,
@@ -94,7 +113,10 @@ class PipelineCatalog(DataBaseBackend):
             raise PipelineAlreadyRegistered(name)   
         
     def get(self, *args, **kwargs):
-        results = self.getObjects(Pipeline,*args,**kwargs)
+        if self.index.canAnswer(args, kwargs):
+            results = self.index.find(**kwargs)
+        else:
+            results = self.getObjects(Pipeline,*args,**kwargs)
 
         # assign for each object the manager where they come from
         for i in range(0,len(results)):
@@ -105,5 +127,27 @@ class PipelineCatalog(DataBaseBackend):
             raise PipelineNotFound("%s" % kwargs)    
         return results
     
+    def getActiveVersion(self, name):
+        return self.index.getActiveVersion(name)
+
+    def getIndexStatus(self):
+        return self.index.getStatus()
+
+    # the writes to the catalog update the index
+
+    def saveObject(self, p_obj):
+        result = super().saveObject(p_obj)
+        if isinstance(p_obj, Pipeline):
+            self.index.changed(p_obj.name)
+        return result
+
+    def destroyObject(self, p_obj):
+        result = super().destroyObject(p_obj)
+        if isinstance(p_obj, Pipeline):
+            self.index.changed(p_obj.name)
+        return result
+
     def deactivateAll(self, name):
-        return self.updateObjects(Pipeline, Pipeline.name == name, active = False )>0
+        result = self.updateObjects(Pipeline, Pipeline.name == name, active = False )>0
+        self.index.changed(name)
+        return result
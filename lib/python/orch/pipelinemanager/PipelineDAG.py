@@ -0,0 +1,72 @@
+# PipelineDAG
+#
+# a pipeline made of other pipelines. Each node is a registered pipeline
+# (given by name, its active version is executed) or a function, and
+# depends on nodes added before it, so the graph has no cycles.
+#
+# A DAG is registered in the catalog as any pipeline function. When it is
+# executed, its nodes run as executions of their own (children of the DAG
+# execution) as soon as their dependencies are finished, so independent
+# branches run at the same time. The first nodes get the arguments of the
+# execution, and the others the results of their dependencies, in the order
+# given. The result of the DAG is the one of its output node, or a dict
+# with the results of its last nodes.
+
+class PipelineDAG(object):
+
+    # the package exports the class in place of this module, dill finds it
+    # (and pickles the DAGs by reference) under the package name
+    __module__ = "orch.pipelinemanager"
+
+    def __init__(self, output=None):
+        self.nodes  = {}   # name -> (pipeline name or function, dependencies)
+        self.order  = []
+        self.output = output
+
+    def addNode(self, name, target, depends=[]):
+        if name in self.nodes:
+            raise RuntimeError("node %s already in the DAG" % name)
+        if not isinstance(target, str) and not callable(target):
+            raise RuntimeError("node %s must be a pipeline name or a function" % name)
+        for dependency in depends:
+            if dependency not in self.nodes:
+                raise RuntimeError("node %s depends on %s, which is not in the DAG" % (name, dependency))
+
+        self.nodes[name] = (target, list(depends))
+        self.order.append(name)
+        return self
+
+    def getTarget(self, name):
+        return self.nodes[name][0]
+
+    def getDependencies(self, name):
+        return self.nodes[name][1]
+
+    def getDependents(self, name):
+        return [ n for n in self.order if name in self.nodes[n][1] ]
+
+    def getRoots(self):
+        return [ n for n in self.order if len(self.nodes[n][1]) == 0 ]
+
+    def getSinks(self):
+        return [ n for n in self.order if len(self.getDependents(n)) == 0 ]
+
+    def validate(self):
+        if len(self.nodes) == 0:
+            raise RuntimeError("empty DAG")
+        if self.output is not None and self.output not in self.nodes:
+            raise RuntimeError("output node %s is not in the DAG" % self.output)
+        return True
+
+    def getResult(self, results):
+        if self.output is not None:
+            return results[self.output]
+        sinks = self.getSinks()
+        if len(sinks) == 1:
+            return results[sinks[0]]
+        return { n : results[n] for n in sinks }
+
+    def __repr__(self):
+        return "<PipelineDAG(nodes=%s)>" % ", ".join([
+            "%s%s" % (n, "<-" + "+".join(self.nodes[n][1]) if len(self.nodes[n][1]) > 0 else "") for n in self.order
+        ])
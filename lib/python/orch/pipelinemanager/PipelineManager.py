@@ -12,21 +12,27 @@ from ..base import Observable, ActionListener
 from ..orchestrator import OrchestratorManager
 from . import PipelineCatalog
 from . import ExecutorManager
+from . import ExecutionQueue
+from . import MapRunner
 from ..exceptions import MultipleActivePipelineRegistered, NoActivePipelineRegistered, PipelineExecutionError, PipelineNotRegistered
 from .Events import *
 
 class PipelineManager(ActionListener, Observable):
-    def __init__(self, owner,db_conn_str = "sqlite:///orchestrator.sqlite"):
+    def __init__(self, owner,db_conn_str = "sqlite:///orchestrator.sqlite", max_workers=None, max_per_pipeline=None, max_per_owner=None, max_dispatch_rate=None, warm_workers=False, worker_max_tasks=100, worker_max_memory=None, artifact_dir=None, inline_threshold=65536, log_dir=None):
         
         super().__init__()
         
         self.owner            = owner
         self.smtp_crd         = owner.smtp_crd
         self.catalog          = PipelineCatalog(self,db_conn_str=db_conn_str)
-        self.executor_manager = ExecutorManager(self, db_conn_str=db_conn_str)
+        self.executor_manager = ExecutorManager(self, db_conn_str=db_conn_str, max_workers=max_workers, max_per_pipeline=max_per_pipeline, max_per_owner=max_per_owner, warm_workers=warm_workers, worker_max_tasks=worker_max_tasks, worker_max_memory=worker_max_memory, artifact_dir=artifact_dir, inline_threshold=inline_threshold, log_dir=log_dir)
         self.db_conn_str = db_conn_str
         
         self.executor_manager.addActionListener(self)
+
+        # persistent run queue. dispatches the pending executions (also the
+        # ones left from a previous run) as slots get free in the pool
+        self.execution_queue  = ExecutionQueue(self, db_conn_str=db_conn_str, max_rate=max_dispatch_rate)
         
     def register(self, name, pipeline_fn, new_version = False):
         if not new_version:
@@ -110,6 +116,12 @@ class PipelineManager(ActionListener, Observable):
         else:
             return None
 
+    def get_executions(self, exec_ids, defer_cols=[]):
+        return self.executor_manager.getExecutorsByID(exec_ids, defer_cols=defer_cols)
+
+    def wait_execution(self, exec_id, timeout=None):
+        return self.executor_manager.waitExecution(exec_id, timeout)
+
     def cancel_execution(self, exec_id):
         executor = self.executor_manager.getExecutorByID(exec_id)
         
@@ -127,6 +139,32 @@ class PipelineManager(ActionListener, Observable):
         except Exception as e:
             raise e
 
+    def map(self, pipeline, items, kw_args={}, chunksize=1, max_parallel=None, gather="list", local=True, cores=1, partition=None, memory=None):
+        try:
+            MapRunner.validate(chunksize, gather)
+            executor = self.executor_manager.create(pipeline, local=local, cores=cores, partition=partition, memory=memory)
+            executor.runMap(items, kw_args, chunksize=chunksize, max_parallel=max_parallel, gather=gather)
+            return executor
+
+        except Exception as e:
+            raise e
+
+    def enqueue(self, pipeline, args=(), kw_args={}, priority=0, local=True, cores=1, partition=None, memory=None):
+        try:
+            executor = self.execution_queue.enqueue(pipeline, args, kw_args, priority=priority, local=local, cores=cores, partition=partition, memory=memory)
+            return executor
+
+        except Exception as e:
+            raise e
+
+    def get_queued_executions(self):
+        return self.execution_queue.getPending()
+
+    def stop(self):
+        self.execution_queue.stop()
+        self.executor_manager.stopWorkers()
+        self.executor_manager.stopJournal()
+
     def createExecutor(self, pipeline, *args, **kw_args):
         try:        
             executor = self.executor_manager.create(pipeline,*args, **kw_args)
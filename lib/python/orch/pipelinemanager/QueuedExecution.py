@@ -0,0 +1,65 @@
+import sqlalchemy as sal
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.sql import func
+import base64
+import dill
+
+# QueuedExecution
+#
+# an execution waiting in the persistent run queue (see ExecutionQueue).
+# The entries are removed when dispatched, cancelled or failed, the state
+# of the execution is kept in the executions table.
+# state: 0 pending (1 dispatched, 2 cancelled, 3 dispatch failed in the
+# entries kept by the previous versions)
+
+Base = declarative_base()
+
+class QueuedExecution(Base):
+    __tablename__ = 'execution_queue'
+    __table_args__ = (
+        sal.Index('ix_execution_queue_dispatch', 'state', 'priority', 'enqueue_ts'),
+        sal.Index('ix_execution_queue_uuid', 'uuid'),
+    )
+    # 2: entries removed once they leave the queue
+    __schema_version__ = 2
+    __migrations__ = {
+        2: "DELETE FROM execution_queue WHERE state != 0"
+    }
+
+    id             = sal.Column('id', sal.Integer, primary_key=True, nullable=False)
+    uuid           = sal.Column('uuid', sal.String)      # executor uuid
+    name           = sal.Column('name', sal.String)
+    version        = sal.Column('version', sal.Integer)
+    owner_id       = sal.Column('owner_id', sal.String)
+    sch_evt_uuid   = sal.Column('sch_evt_uuid', sal.String)
+    priority       = sal.Column('priority', sal.Integer, default=0)
+    state          = sal.Column('state', sal.Integer, default=0)
+    enqueue_ts     = sal.Column('enqueue_ts', sal.DateTime(timezone=True), server_default=func.now())
+    dispatch_ts    = sal.Column('dispatch_ts', sal.DateTime(timezone=True))
+    local_job      = sal.Column('local_job', sal.Boolean, default=True)
+    cores          = sal.Column('cores', sal.Integer, default=1)
+    partition      = sal.Column('partition', sal.String)
+    memory         = sal.Column('memory', sal.Integer)
+    pipeline_args  = sal.Column('pipeline_args', sal.TEXT)
+
+    def getArguments(self):
+        pipeline_args = dill.loads(base64.b64decode(self.pipeline_args.encode("utf8")))
+        return pipeline_args["args"], pipeline_args["kwargs"]
+
+    def isPending(self):
+        return self.state == 0
+
+    def asJson(self):
+        return {
+            "id"         : self.id,
+            "uuid"       : self.uuid,
+            "name"       : self.name,
+            "version"    : self.version,
+            "owner_id"   : self.owner_id,
+            "priority"   : self.priority,
+            "state"      : self.state,
+            "enqueue_ts" : self.enqueue_ts.strftime("%m/%d/%Y %H:%M:%S") if self.enqueue_ts is not None else None
+        }
+
+    def __repr__(self):
+        return "<QueuedExecution[uuid=%s, pipeline=%s, version=%s, priority=%s, state=%s]>" % (self.uuid, self.name, self.version, self.priority, self.state)
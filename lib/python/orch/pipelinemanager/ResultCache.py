@@ -0,0 +1,113 @@
+# ResultCache
+#
+# memoization of the results of deterministic pipelines. Once enabled for a
+# pipeline, the result of a successful execution is kept under the
+# pipeline name, its version and the sha256 of its (dill serialized)
+# arguments. A new execution with the same key finishes with that result,
+# without running the pipeline.
+#
+# The entries hold the encoded result as stored in the executions table
+# (or its reference in the content addressed artifact store), and expire
+# after the ttl (seconds) of their pipeline. The least recently used ones
+# are evicted beyond max_entries, or beyond max_bytes of inline results.
+
+from threading import Lock
+from collections import OrderedDict
+import hashlib
+import time
+
+class ResultCache(object):
+
+    def __init__(self, max_entries=10000, max_bytes=256*1024*1024, default_ttl=3600):
+        self.max_entries = max_entries
+        self.max_bytes   = max_bytes
+        self.default_ttl = default_ttl
+        self.lock        = Lock()
+        self.entries     = OrderedDict()   # key -> (expiration, entry, size)
+        self.size        = 0
+        self.pipelines   = {}              # pipeline name -> ttl
+        self.stats       = {}              # pipeline name -> counters
+
+    def enable(self, name, ttl=None):
+        with self.lock:
+            self.pipelines[name] = ttl if ttl is not None else self.default_ttl
+            self.getCounters(name)
+
+    def disable(self, name):
+        with self.lock:
+            self.pipelines.pop(name, None)
+            for key in [ k for k in self.entries if k[0] == name ]:
+                self.remove(key)
+
+    def isEnabled(self, name):
+        with self.lock:
+            return name in self.pipelines
+
+    def getKey(self, pipeline, encoded_args):
+        # None when the pipeline is not memoized
+        if not self.isEnabled(pipeline.name):
+            return None
+        if isinstance(encoded_args, str):
+            encoded_args = encoded_args.encode("utf8")
+        return (pipeline.name, pipeline.version, hashlib.sha256(encoded_args).hexdigest())
+
+    def getCounters(self, name):
+        if name not in self.stats:
+            self.stats[name] = { "hits" : 0, "misses" : 0, "stored" : 0, "evicted" : 0, "expired" : 0 }
+        return self.stats[name]
+
+    def lookup(self, key):
+        with self.lock:
+            counters = self.getCounters(key[0])
+            item = self.entries.get(key)
+            if item is not None and item[0] < time.time():
+                self.remove(key)
+                counters["expired"] += 1
+                item = None
+
+            if item is None:
+                counters["misses"] += 1
+                return None
+
+            self.entries.move_to_end(key)
+            counters["hits"] += 1
+            return item[1]
+
+    def store(self, key, executor):
+        entry = {
+            "uuid"              : executor.uuid,
+            "pipeline_ret"      : executor.pipeline_ret,
+            "pipeline_ret_ref"  : executor.pipeline_ret_ref,
+            "pipeline_ret_size" : executor.pipeline_ret_size
+        }
+        size = len(executor.pipeline_ret) if executor.pipeline_ret is not None else 0
+
+        with self.lock:
+            if key[0] not in self.pipelines:
+                return False
+            if key in self.entries:
+                self.remove(key)
+            self.entries[key] = (time.time() + self.pipelines[key[0]], entry, size)
+            self.size += size
+            self.getCounters(key[0])["stored"] += 1
+
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                evicted = next(iter(self.entries))
+                self.remove(evicted)
+                self.getCounters(evicted[0])["evicted"] += 1
+        return True
+
+    def remove(self, key):
+        item = self.entries.pop(key, None)
+        if item is not None:
+            self.size -= item[2]
+
+    def getStats(self, name=None):
+        with self.lock:
+            if name is not None:
+                return dict(self.getCounters(name), enabled=name in self.pipelines)
+            return {
+                "entries"   : len(self.entries),
+                "bytes"     : self.size,
+                "pipelines" : { n : dict(c, enabled=n in self.pipelines) for n, c in self.stats.items() }
+            }
@@ -2,9 +2,21 @@
 from ..base.db import *
 from .Events import *
 from .AbstractExecutor import *
+from .FunctionCache import *
 from .AbstractPipeline import *
 from .Pipeline import *
+from .CatalogIndex import *
 from .PipelineCatalog import *
+from .ExecutionLog import *
+from .PipelineDAG import *
+from .DAGRunner import *
+from .MapRunner import *
 from .Executor import *
+from .ExecutionPool import *
+from .ExecutionMonitor import *
+from .ExecutionJournal import *
+from .ResultCache import *
+from .QueuedExecution import *
+from .ExecutionQueue import *
 from .ExecutorManager import *
 from .PipelineManager import *
@@ -1,61 +1,83 @@
-def execute_pipeline_as_local(cores, pipeline_fn, orch_access, args, kwargs):
-    from ..base import Argument, asLocalJob
-    @asLocalJob(cores=cores, verbose=True)
-    #def run_pipeline_as_local(args):
-    def run_pipeline_as_local(pipeline_fn, args, kwargs):
-
-        import base64
-        from io import StringIO
-        import sys
-        import traceback
-        import platform
-        from orch.base import Argument
-        from contextlib import redirect_stdout, redirect_stderr
-
-        import os, psutil
-
-        #pipeline_fn, args, kwargs = args.get()
-       
+def with_orch_access(pipeline_fn, orch_access):
+    # copy of the pipeline function with globals of its own holding the
+    # orch_access, the function given (e.g. the one of the FunctionCache)
+    # is not changed, so concurrent executions do not share it
+    import types
+    fn = types.FunctionType(pipeline_fn.__code__, dict(pipeline_fn.__globals__, orch_access=orch_access), pipeline_fn.__name__, pipeline_fn.__defaults__, pipeline_fn.__closure__)
+    fn.__kwdefaults__ = pipeline_fn.__kwdefaults__
+    fn.__qualname__   = pipeline_fn.__qualname__
+    fn.__dict__.update(pipeline_fn.__dict__)
+    return fn
+
+def run_pipeline_local(pipeline_fn, orch_access, args, kwargs, log_paths=None, result_tag=None):
+    # runs the pipeline capturing its output. Executed in the process
+    # created by asLocalJob or in a warm worker of the WorkerPool. With
+    # log_paths the output is streamed to the execution log files. The
+    # shared memory of the result is tagged with result_tag
+    import base64
+    from io import StringIO
+    import sys
+    import traceback
+    import platform
+    from contextlib import redirect_stdout, redirect_stderr
+
+    import os, psutil
+
+    if log_paths is not None:
+        from orch.pipelinemanager.ExecutionLog import ExecutionLog
+        p_output = ExecutionLog(log_paths[0])
+        p_error  = ExecutionLog(log_paths[1])
+    else:
         p_output = StringIO()
         p_error  = StringIO()
-        
-        result     = None 
-        success    = False
-        b64_output = ""
-        b64_error  = ""
-       
-        with redirect_stderr(p_error) as e:
-            with redirect_stdout(p_output) as o:
-                try:
-
-                    print("Execution at        : ", platform.node())
-                    print("executing function  :",pipeline_fn)
-                    print("Orchestrator Access :",orch_access)
-                    
+    
+    result     = None 
+    success    = False
+    b64_output = ""
+    b64_error  = ""
+   
+    with redirect_stderr(p_error) as e:
+        with redirect_stdout(p_output) as o:
+            try:
+
+                print("Execution at        : ", platform.node())
+                print("executing function  :",pipeline_fn)
+                print("Orchestrator Access :",orch_access)
+                
+                if getattr(pipeline_fn, "takes_orch_access", False):
+                    # functions of the orchestrator running pipelines (e.g.
+                    # the chunks of a map) get the orch_access as argument
+                    result = pipeline_fn(orch_access, *args, **kwargs)
+                else:
                     # make available the orch_access instance to the pipeline
-                    pipeline_fn.__globals__["orch_access"] = orch_access
-                    
-                    result = pipeline_fn(*args,**kwargs)
-                    
-                    # memory consumption of current process
-                    process = psutil.Process(os.getpid())
-                    orch_access.exec_info.memory = process.memory_full_info().rss
-                    print("Memory Consumption :",process.memory_info().rss, "bytes") 
-
-                    success = True
-                except Exception as ex:
-                    print("Exeption when running process as local job:",ex)
-                    exc_info = sys.exc_info()
-                    traceback.print_exception(*exc_info)
-
-                    result = ex
-
-                    # memory consumption of current process
-                    process = psutil.Process(os.getpid())
-                    print("Memory Consumption :",process.memory_info().rss, "bytes") 
-                    orch_access.exec_info.memory = process.memory_info().rss
-                    del exc_info
-
+                    result = with_orch_access(pipeline_fn, orch_access)(*args,**kwargs)
+                
+                # memory consumption of current process
+                process = psutil.Process(os.getpid())
+                orch_access.exec_info.memory = process.memory_full_info().rss
+                print("Memory Consumption :",process.memory_info().rss, "bytes") 
+
+                success = True
+            except Exception as ex:
+                print("Exeption when running process as local job:",ex)
+                exc_info = sys.exc_info()
+                traceback.print_exception(*exc_info)
+
+                result = ex
+
+                # memory consumption of current process
+                process = psutil.Process(os.getpid())
+                print("Memory Consumption :",process.memory_info().rss, "bytes") 
+                orch_access.exec_info.memory = process.memory_info().rss
+                del exc_info
+
+    if log_paths is not None:
+        # the output is already in the log files
+        p_output.close()
+        p_error.close()
+        b64_output = None
+        b64_error  = None
+    else:
         try:
 
             o.flush()
@@ -78,11 +100,63 @@ def execute_pipeline_as_local(cores, pipeline_fn, orch_access, args, kwargs):
 
             b64_error  = base64.b64encode(err_str.encode('utf8'))
             b64_output = base64.b64encode(error.encode('utf8'))
-        
-        return Argument((success, result, b64_output ,b64_error, orch_access.exec_info ))
+    
+    # large results (e.g. dataframes) are handed over in shared memory
+    if result is not None:
+        from orch.base import SharedResult
+        try:
+            result = SharedResult(result, tag=result_tag)
+        except Exception as ex:
+            print("Error sharing the result:",ex)
+
+    return (success, result, b64_output ,b64_error, orch_access.exec_info )
+
+def run_pipeline_chunk(orch_access, pipeline_fn, items, kwargs):
+    # runs a pipeline for each item of a chunk of a map (see MapRunner), in
+    # one execution. A failing item does not stop the others, the chunk then
+    # fails with the results and the errors of all of them
+    import traceback
+    from orch.exceptions import PipelineMapError
+
+    # make available the orch_access instance to the pipeline
+    pipeline_fn = with_orch_access(pipeline_fn, orch_access)
+
+    results = []
+    errors  = {}
+    for i, item in enumerate(items):
+        try:
+            results.append(pipeline_fn(item, **kwargs))
+        except Exception as ex:
+            print("item %d of the chunk failed: %s" % (i, ex))
+            traceback.print_exc()
+            results.append(None)
+            errors[i] = "%s: %s" % (type(ex).__name__, ex)
+
+    if len(errors) > 0:
+        raise PipelineMapError(results, errors)
+    return results
+
+run_pipeline_chunk.takes_orch_access = True
+
+def execute_pipeline_as_local(cores, pipeline_fn, orch_access, args, kwargs, log_paths=None, result_tag=None):
+    from ..base import asLocalJob
+    @asLocalJob(cores=cores, verbose=True)
+    def run_pipeline_as_local(pipeline_fn, args, kwargs):
+        from orch.base import Argument
+        return Argument(run_pipeline_local(pipeline_fn, orch_access, args, kwargs, log_paths, result_tag))
 
     return run_pipeline_as_local(pipeline_fn, args, kwargs )
 
+# execute the pipeline in a warm worker of the pool. The workers are not
+# forked from the orchestrator, they get the orch_access without the
+# manager (as the jobs) and the pipeline with its columns
+def execute_pipeline_in_worker(pool, pipeline_fn, orch_access, args, kwargs, log_paths=None, result_tag=None):
+    from ..orchestrator import OrchestratorAccess
+    worker_access = OrchestratorAccess(None, orch_access.pipeline)
+    worker_access.exec_info = orch_access.exec_info
+
+    return pool.submit(run_pipeline_local, pipeline_fn, worker_access, args, kwargs, log_paths, result_tag)
+
 
 # execute the pipeline as job
 def execute_pipeline_as_job(cores, pipeline_fn, orch_access, args, kwargs):
@@ -116,9 +190,11 @@ def execute_pipeline_as_job(cores, pipeline_fn, orch_access, args, kwargs):
                     print("Execution at: ", platform.node())
                     print("executing function:",pipeline_fn)
 
-                    pipeline_fn.__globals__["orch_access"] = orch_access
-                    
-                    result = pipeline_fn(*args,**kwargs)
+                    if getattr(pipeline_fn, "takes_orch_access", False):
+                        result = pipeline_fn(orch_access, *args, **kwargs)
+                    else:
+                        from orch.pipelinemanager.executePipelineAsJob import with_orch_access
+                        result = with_orch_access(pipeline_fn, orch_access)(*args,**kwargs)
                     success = True
                 except Exception as ex:
                     print("Exeption when running function:",ex)
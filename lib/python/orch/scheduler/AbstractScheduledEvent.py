@@ -2,6 +2,8 @@ import base64
 import dill
 import inspect
 
+from .RecurrenceRule import RecurrenceRule
+
 # AbstractScheduledEvent
 
 class AbstractScheduledEvent(object):
@@ -30,6 +32,14 @@ class AbstractScheduledEvent(object):
         else:
             return {}
     
+    def setRecurrenceRule(self, rule):
+        self.rule = rule.serialize()
+
+    def getRecurrenceRule(self):
+        if getattr(self, "rule", None) is not None:
+            return RecurrenceRule.deserialize(self.rule)
+        return None
+
     def __repr__(self):
         return "<ScheduledEvent[name=%s, owner=%s, uuid=%s, trigger_time=%s, recurrency=%s, active=%s, pipeline=%s]>" % (
             self.name,
@@ -0,0 +1,276 @@
+from datetime import datetime, timedelta
+import numpy as np
+
+from .RecurrenceRule import RecurrenceRule, toMicroseconds, fromMicroseconds
+
+# CronRule
+#
+# recurrence rule given as a cron expression (minute hour day-of-month
+# month day-of-week), e.g. "*/15 8-18 * * mon-fri". Each field is compiled
+# into a boolean lookup table, which allows to evaluate many rules over a
+# minute grid at once with numpy (see occurrencesBetween).
+#
+# as in cron, when both day-of-month and day-of-week are restricted, a day
+# matches if any of them matches.
+
+class CronRule(RecurrenceRule):
+
+    macros = {
+        "@yearly"   : "0 0 1 1 *",
+        "@annually" : "0 0 1 1 *",
+        "@monthly"  : "0 0 1 * *",
+        "@weekly"   : "0 0 * * 0",
+        "@daily"    : "0 0 * * *",
+        "@midnight" : "0 0 * * *",
+        "@hourly"   : "0 * * * *"
+    }
+
+    month_names = ["jan","feb","mar","apr","may","jun","jul","aug","sep","oct","nov","dec"]
+    dow_names   = ["sun","mon","tue","wed","thu","fri","sat"]
+
+    # (size of the lookup table, min value, max value, names)
+    fields = [
+        (60, 0, 59, None),
+        (24, 0, 23, None),
+        (32, 1, 31, None),
+        (13, 1, 12, month_names),
+        (8,  0, 7,  dow_names)
+    ]
+
+    def __init__(self, expression, anchor=0):
+        super().__init__(anchor, kind="cron")
+        self.expression = expression
+
+        expr = self.macros.get(expression.strip().lower(), expression)
+        parts = expr.split()
+        if len(parts) != 5:
+            raise ValueError("cron expression must have 5 fields: %s" % expression)
+
+        tables = []
+        for part, (size, lo, hi, names) in zip(parts, self.fields):
+            tables.append(self.parseField(part, size, lo, hi, names))
+
+        self.minutes, self.hours, self.dom, self.months, dow = tables
+        # 7 is also sunday
+        dow[0] = dow[0] or dow[7]
+        self.dow = dow[:7]
+
+        # as in vixie cron, fields starting with * are not restrictions
+        self.dom_restricted = not parts[2].startswith("*")
+        self.dow_restricted = not parts[4].startswith("*")
+
+    @classmethod
+    def parseValue(cls, value, names):
+        if names is not None and value.lower()[:3] in names:
+            idx = names.index(value.lower()[:3])
+            # month names start at 1
+            return idx + 1 if len(names) == 12 else idx
+        return int(value)
+
+    @classmethod
+    def parseField(cls, field, size, lo, hi, names):
+        table = np.zeros(size, dtype=bool)
+        for item in field.split(","):
+            step = 1
+            if "/" in item:
+                item, step_str = item.split("/")
+                step = int(step_str)
+                if step <= 0:
+                    raise ValueError("cron step must be positive: %s" % field)
+
+            if item == "*":
+                start, end = lo, hi
+            elif "-" in item:
+                a, b = item.split("-")
+                start, end = cls.parseValue(a, names), cls.parseValue(b, names)
+            else:
+                start = cls.parseValue(item, names)
+                end = hi if step > 1 else start
+
+            if start < lo or end > hi or start > end:
+                raise ValueError("cron field out of range: %s" % field)
+
+            table[start:end + 1:step] = True
+        return table
+
+    @classmethod
+    def isCronExpression(cls, expression):
+        if expression is None:
+            return False
+        try:
+            cls(expression)
+            return True
+        except Exception:
+            return False
+
+    def isRecurrent(self):
+        return True
+
+    def matchDay(self, dt):
+        dom = self.dom[dt.day]
+        # python weekday: monday=0. cron: sunday=0
+        dow = self.dow[(dt.weekday() + 1) % 7]
+        if self.dom_restricted and self.dow_restricted:
+            return dom or dow
+        return dom and dow
+
+    def nextFireTime(self, after):
+        # first minute strictly after 'after' (and not before the anchor)
+        start = max(after + 1, self.anchor)
+        dt = fromMicroseconds(start)
+        if dt.second != 0 or dt.microsecond != 0:
+            dt = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+
+        limit = dt.year + 30
+        while dt.year <= limit:
+            if not self.months[dt.month]:
+                if dt.month == 12:
+                    dt = datetime(dt.year + 1, 1, 1)
+                else:
+                    dt = datetime(dt.year, dt.month + 1, 1)
+                continue
+            if not self.matchDay(dt):
+                dt = datetime(dt.year, dt.month, dt.day) + timedelta(days=1)
+                continue
+            if not self.hours[dt.hour]:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+                continue
+            if not self.minutes[dt.minute]:
+                dt = dt + timedelta(minutes=1)
+                continue
+            return toMicroseconds(dt)
+
+        # the expression never matches (e.g. 30th of february)
+        return None
+
+    def nextFireTimes(self, after, n):
+        # next n fire times as a datetime64[us] array
+        return nextOccurrences([self], n, after)[0]
+
+    def asJson(self):
+        return {
+            "kind"       : self.kind,
+            "anchor"     : self.anchor,
+            "expression" : self.expression
+        }
+
+    @classmethod
+    def fromJson(cls, json_obj):
+        return cls(json_obj["expression"], json_obj["anchor"])
+
+    def __repr__(self):
+        return "CronRule[%s]" % self.expression
+
+def toDatetime64(value):
+    if value is None:
+        value = datetime.now()
+    if isinstance(value, datetime):
+        return np.datetime64(toMicroseconds(value), "us")
+    if isinstance(value, (int, np.integer)):
+        return np.datetime64(int(value), "us")
+    return np.datetime64(value, "us")
+
+def cronOccurrencesBetween(rules, start, end):
+    # evaluate the cron rules over the minute grid (start, end] with
+    # stacked lookup tables: one boolean matrix of rules x minutes
+    start_min = start.astype("datetime64[m]") + np.timedelta64(1, "m")
+    grid = np.arange(start_min, end.astype("datetime64[m]") + np.timedelta64(1, "m"), dtype="datetime64[m]")
+
+    if len(rules) == 0 or len(grid) == 0:
+        return [ np.array([], dtype="datetime64[us]") for r in rules ]
+
+    ticks  = grid.astype(np.int64)
+    days   = grid.astype("datetime64[D]")
+    months = days.astype("datetime64[M]")
+
+    minute = ticks % 60
+    hour   = grid.astype("datetime64[h]").astype(np.int64) % 24
+    dom    = (days - months.astype("datetime64[D]")).astype(np.int64) + 1
+    month  = months.astype(np.int64) % 12 + 1
+    # 1970-01-01 was a thursday (cron day 4)
+    dow    = (days.astype(np.int64) + 4) % 7
+
+    MIN   = np.stack([ r.minutes for r in rules ])
+    HOUR  = np.stack([ r.hours for r in rules ])
+    DOM   = np.stack([ r.dom for r in rules ])
+    MONTH = np.stack([ r.months for r in rules ])
+    DOW   = np.stack([ r.dow for r in rules ])
+    both  = np.array([ r.dom_restricted and r.dow_restricted for r in rules ])[:, None]
+
+    day_or  = DOM[:, dom] | DOW[:, dow]
+    day_and = DOM[:, dom] & DOW[:, dow]
+    mask = MIN[:, minute] & HOUR[:, hour] & MONTH[:, month] & np.where(both, day_or, day_and)
+
+    anchors = np.array([ r.anchor for r in rules ], dtype=np.int64)[:, None]
+    mask &= grid.astype("datetime64[us]").astype(np.int64)[None, :] >= anchors
+
+    grid_us = grid.astype("datetime64[us]")
+    return [ grid_us[row] for row in mask ]
+
+def occurrencesBetween(rules, start=None, end=None):
+    # fire times in (start, end] of each rule, as datetime64[us] arrays.
+    # cron rules are evaluated together, interval rules with numpy ranges
+    start = toDatetime64(start)
+    if end is None:
+        end = start + np.timedelta64(1, "D")
+    end = toDatetime64(end)
+
+    result = [ None ] * len(rules)
+    cron_idx = [ i for i, r in enumerate(rules) if isinstance(r, CronRule) ]
+    cron_occ = cronOccurrencesBetween([ rules[i] for i in cron_idx ], start, end)
+    for i, occ in zip(cron_idx, cron_occ):
+        result[i] = occ
+
+    start_us = int(start.astype(np.int64))
+    end_us   = int(end.astype(np.int64))
+    for i, rule in enumerate(rules):
+        if result[i] is not None:
+            continue
+        first = rule.nextFireTime(start_us)
+        if first is None or first > end_us:
+            result[i] = np.array([], dtype="datetime64[us]")
+        elif rule.kind == "interval" and rule.unit != "months":
+            period = rule.period()
+            result[i] = np.arange(first, end_us + 1, period, dtype=np.int64).astype("datetime64[us]")
+        elif not rule.isRecurrent():
+            result[i] = np.array([first], dtype="datetime64[us]")
+        else:
+            occ = []
+            while first is not None and first <= end_us:
+                occ.append(first)
+                first = rule.nextFireTime(first)
+            result[i] = np.array(occ, dtype=np.int64).astype("datetime64[us]")
+
+    return result
+
+def nextOccurrences(rules, n, after=None):
+    # next n fire times of each rule as datetime64[us] arrays. The window is
+    # widened until every rule has n occurrences or will not fire anymore
+    after = toDatetime64(after)
+    result = [ np.array([], dtype="datetime64[us]") for r in rules ]
+    pending = list(range(len(rules)))
+    start = after
+    window = np.timedelta64(1, "D")
+    max_window = np.timedelta64(32, "D")
+
+    while len(pending) > 0:
+        end = start + window
+        occ = occurrencesBetween([ rules[i] for i in pending ], start, end)
+        still = []
+        next_start = None
+        end_us = int(end.astype(np.int64))
+        for i, o in zip(pending, occ):
+            result[i] = np.concatenate([ result[i], o[:n - len(result[i])] ])
+            if len(result[i]) < n:
+                next_fire = rules[i].nextFireTime(end_us)
+                if next_fire is not None:
+                    still.append(i)
+                    if next_start is None or next_fire < next_start:
+                        next_start = next_fire
+        pending = still
+        if next_start is not None:
+            # skip the stretch where no pending rule fires
+            start = np.datetime64(next_start - 1, "us")
+        window = min(window * 2, max_window)
+
+    return result
@@ -1,16 +1,18 @@
 from ..base import ActionEvent
 
 class ExecutePipeline(ActionEvent):
-    def __init__(self,sch_evt_uuid, pipeline, args, kw_args):
+    def __init__(self,sch_evt_uuid, pipeline, args, kw_args, fire_time=None):
         super().__init__()
         self.sch_evt_uuid = sch_evt_uuid
         self.pipeline     = pipeline
         self.args         = args
         self.kw_args      = kw_args
+        self.fire_time    = fire_time
     def __repr__(self):
-        return "<ExecutePipeline[sch_evt_uuid=%s, pipeline=%s, args=%s, kw_args=%s]>" % (
+        return "<ExecutePipeline[sch_evt_uuid=%s, pipeline=%s, fire_time=%s, args=%s, kw_args=%s]>" % (
             self.sch_evt_uuid,
             self.pipeline,
+            self.fire_time,
             self.args,
             self.kw_args
         )
@@ -0,0 +1,189 @@
+import re
+import json
+from datetime import datetime, timedelta
+from dateutil import parser
+from dateutil.relativedelta import relativedelta
+
+# RecurrenceRule
+#
+# compiled representation of a (trigger_time, recurrency) pair. It is
+# built once when a ScheduledEvent is created and stored along with it,
+# so computing the next fire time does not require parsing natural
+# language again.
+#
+# times are handled as microseconds of local wall-clock time (naive
+# datetimes, as used by the rest of the scheduler) since the epoch, so
+# day and month recurrences keep the time of the day.
+#
+# kind "interval": fires at anchor + k * interval unit (k >= 0)
+# kind "once"    : fires only at anchor
+# kind "cron"    : cron expression (see CronRule)
+
+EPOCH = datetime(1970,1,1)
+
+US_PER_UNIT = {
+    "minutes" : 60 * 1000000,
+    "hours"   : 3600 * 1000000,
+    "days"    : 86400 * 1000000
+}
+
+def toMicroseconds(dt):
+    delta = dt.replace(tzinfo=None) - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+def fromMicroseconds(us):
+    return EPOCH + timedelta(microseconds=us)
+
+class RecurrenceRule(object):
+
+    re_short = r"^([0-9]+)(m|h|d|M)$"
+    re_long  = r"^(?:every\s+)?([0-9]+)\s*(minute|minutes|min|mins|hour|hours|day|days|month|months)$"
+
+    short_units = { "m": "minutes", "h": "hours", "d": "days", "M": "months" }
+
+    def __init__(self, anchor, interval=None, unit=None, kind=None):
+        self.anchor   = anchor      # microseconds
+        self.interval = interval
+        self.unit     = unit
+        if kind is None:
+            kind = "once" if interval is None else "interval"
+        self.kind     = kind
+
+    @classmethod
+    def parseRecurrency(cls, recurrency_str):
+        # returns (interval, unit) for the recurrency shorthands (Nm, Nh, Nd, NM)
+        # and their long form (N minutes, N hours, ...). None if not recognized
+        if recurrency_str is None:
+            return None
+
+        recurrency_str = recurrency_str.strip()
+        match = re.match(cls.re_short, recurrency_str)
+        if match:
+            return int(match.group(1)), cls.short_units[match.group(2)]
+
+        match = re.match(cls.re_long, recurrency_str, re.IGNORECASE)
+        if match:
+            unit = match.group(2).lower()
+            for u in ["minutes","hours","days","months"]:
+                if u.startswith(unit[:3]):
+                    return int(match.group(1)), u
+        return None
+
+    @classmethod
+    def parseCtparseRecurrency(cls, trigger_time_str, recurrency_str, reference):
+        # fallback for natural language recurrencies. ctparse is called only
+        # once, when the rule is compiled
+        from ctparse import ctparse
+        from ctparse.types import Duration as ctDuration
+        from ctparse.types import DurationUnit
+
+        ctr = ctparse("%s %s" % (trigger_time_str, recurrency_str), reference).resolution
+        if isinstance(ctr, ctDuration):
+            units = {
+                DurationUnit.MINUTES : "minutes",
+                DurationUnit.HOURS   : "hours",
+                DurationUnit.DAYS    : "days",
+                DurationUnit.MONTHS  : "months"
+            }
+            if ctr.unit in units:
+                return int(ctr.value), units[ctr.unit]
+        return None
+
+    @classmethod
+    def compile(cls, trigger_time_str, recurrency_str=None, reference=None):
+        if reference is None:
+            reference = datetime.now()
+
+        if isinstance(trigger_time_str, datetime):
+            anchor_dt = trigger_time_str.replace(tzinfo=None)
+        else:
+            anchor_dt = parser.parse(trigger_time_str, default=reference.replace(hour=0, minute=0, second=0, microsecond=0))
+
+        if recurrency_str is None or recurrency_str == "":
+            # one time event given as a time of the day: next occurrence of it
+            while anchor_dt <= reference:
+                anchor_dt = anchor_dt + timedelta(days=1)
+            return cls(toMicroseconds(anchor_dt))
+
+        from .CronRule import CronRule
+        if CronRule.isCronExpression(recurrency_str):
+            return CronRule(recurrency_str, toMicroseconds(anchor_dt))
+
+        rec = cls.parseRecurrency(recurrency_str)
+        if rec is None:
+            rec = cls.parseCtparseRecurrency(trigger_time_str, recurrency_str, reference)
+        if rec is None:
+            raise ValueError("recurrency not supported: %s" % recurrency_str)
+
+        interval, unit = rec
+        if interval <= 0:
+            raise ValueError("recurrency interval must be positive: %s" % recurrency_str)
+
+        return cls(toMicroseconds(anchor_dt), interval, unit)
+
+    def isRecurrent(self):
+        return self.kind != "once"
+
+    def period(self):
+        # interval length in microseconds (not defined for months)
+        return self.interval * US_PER_UNIT[self.unit]
+
+    def nextFireTime(self, after):
+        # next fire time (microseconds) strictly greater than after (microseconds).
+        # None when the rule will not fire anymore
+        if self.anchor > after:
+            return self.anchor
+
+        if self.kind == "once":
+            return None
+
+        if self.unit == "months":
+            anchor_dt = fromMicroseconds(self.anchor)
+            after_dt  = fromMicroseconds(after)
+            months = (after_dt.year - anchor_dt.year) * 12 + (after_dt.month - anchor_dt.month)
+            k = max(0, months // self.interval)
+            while True:
+                next_dt = anchor_dt + relativedelta(months=k * self.interval)
+                if next_dt > after_dt:
+                    return toMicroseconds(next_dt)
+                k += 1
+
+        period = self.period()
+        k = (after - self.anchor) // period + 1
+        return self.anchor + k * period
+
+    def nextEventTime(self, reference=None):
+        # datetime version of nextFireTime
+        if reference is None:
+            reference = datetime.now()
+        next_us = self.nextFireTime(toMicroseconds(reference))
+        if next_us is None:
+            return None
+        return fromMicroseconds(next_us)
+
+    def asJson(self):
+        return {
+            "kind"     : self.kind,
+            "anchor"   : self.anchor,
+            "interval" : self.interval,
+            "unit"     : self.unit
+        }
+
+    def serialize(self):
+        return json.dumps(self.asJson())
+
+    @classmethod
+    def fromJson(cls, json_obj):
+        if json_obj["kind"] == "cron":
+            from .CronRule import CronRule
+            return CronRule.fromJson(json_obj)
+        return cls(json_obj["anchor"], json_obj["interval"], json_obj["unit"], json_obj["kind"])
+
+    @classmethod
+    def deserialize(cls, rule_str):
+        return cls.fromJson(json.loads(rule_str))
+
+    def __repr__(self):
+        if self.kind == "once":
+            return "RecurrenceRule[once at %s]" % fromMicroseconds(self.anchor)
+        return "RecurrenceRule[every %d %s from %s]" % (self.interval, self.unit, fromMicroseconds(self.anchor))
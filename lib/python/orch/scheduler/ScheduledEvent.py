@@ -7,6 +7,7 @@ import base64
 import dill
 
 from ..base import ActionEvent
+from ..base.db import deduplicate
 from . import AbstractScheduledEvent
 
 # ScheduledEvent
@@ -19,6 +20,17 @@ Base = declarative_base()
 
 class ScheduledEvent(AbstractScheduledEvent, Base, ActionEvent):
     __tablename__ = 'scheduled_events'
+    __table_args__ = (
+        sal.Index('ix_scheduled_events_uuid', 'uuid', unique=True),
+        sal.Index('ix_scheduled_events_active', 'active'),
+        sal.Index('ix_scheduled_events_pipeline', 'pipeline'),
+    )
+    # 2: indexes
+    # 3: duplicated uuids removed before the unique index
+    __schema_version__ = 3
+    __migrations__ = {
+        3 : deduplicate("scheduled_events", "uuid")
+    }
     
     id           = sal.Column('id', sal.Integer, primary_key=True, nullable=False)
     name         = sal.Column('name', sal.String)
@@ -33,6 +45,10 @@ class ScheduledEvent(AbstractScheduledEvent, Base, ActionEvent):
     pipeline     = sal.Column('pipeline', sal.String)
     args         = sal.Column('pipeline_args', sal.TEXT)
     kw_args      = sal.Column('pipeline_kw_args', sal.TEXT)
+    rule         = sal.Column('recurrence_rule', sal.TEXT)
+    last_fired   = sal.Column('last_fired', sal.DateTime(timezone=True))
+    misfire_policy = sal.Column('misfire_policy', sal.String)
+    misfire_grace  = sal.Column('misfire_grace', sal.Integer)
     
     def __init__(self, schm, label):
         self.schm = schm
@@ -61,7 +77,11 @@ class ScheduledEvent(AbstractScheduledEvent, Base, ActionEvent):
             "recurrency"    : self.recurrency,            
             "pipeline"      : self.pipeline,
             "args"          : s_args,
-            "kw_args"       : s_kw_args
+            "kw_args"       : s_kw_args,
+            "rule"          : self.rule,
+            "last_fired"    : self.last_fired,
+            "misfire_policy": self.misfire_policy,
+            "misfire_grace" : self.misfire_grace
         }
         # dict is serialized as b64 dill
         sobj = { "uuid": self.uuid, "sobj": base64.b64encode(dill.dumps(obj)).decode("utf8") }
@@ -1,20 +1,37 @@
-from datetime import datetime
+from datetime import datetime, timezone
 from dateutil import parser
+import numpy as np
+import pandas as pd
 
 from ..base import ActionListener, Observable
 from ..base.db import DataBaseBackend
 from ..exceptions import MultipleScheduledEventFound
 from .TimeManager import TimeManager
 from .TimeEvent import TimeEvent
+from .RecurrenceRule import RecurrenceRule, toMicroseconds, fromMicroseconds
+from .CronRule import occurrencesBetween, nextOccurrences
 from .ScheduledEvent import ScheduledEvent
 from .Events import *
 
 class SchedulerManager(DataBaseBackend, ActionListener, Observable):
-    def __init__(self,owner, time_resolution="1s", db_conn_str="sqlite:///orchestrator.sqlite"):
+
+    # misfire policies: what to do with the fire times missed while the
+    # orchestrator was not running
+    #   once : fire once for all the missed fire times (coalesce)
+    #   all  : fire each missed fire time (at most max_catchup per event)
+    #   skip : do not fire missed fire times
+    misfire_policies = ["once", "all", "skip"]
+
+    def __init__(self,owner, time_resolution="1s", db_conn_str="sqlite:///orchestrator.sqlite", misfire_horizon=86400, max_catchup=10):
         Observable.__init__(self)
         self.owner = owner
         self.tm    = TimeManager(time_resolution)
 
+        # missed fire times older than misfire_horizon seconds are never fired
+        self.misfire_horizon = misfire_horizon
+        self.max_catchup     = max_catchup
+        self.misfired        = []
+
         self.tm.addActionListener(self)
         super().__init__(db_conn_str)
         
@@ -31,14 +48,117 @@ class SchedulerManager(DataBaseBackend, ActionListener, Observable):
             trigger_time_str = sch_evt.trigger_time.strftime("%H:%M:%S")
             print("scheduling %s" % sch_evt)
             try:
-                self.tm.addTimeEvent(sch_evt.uuid,trigger_time_str,sch_evt.recurrency)
+                rule = self.getRecurrenceRule(sch_evt)
+                self.tm.addTimeEvent(sch_evt.uuid,trigger_time_str,sch_evt.recurrency, rule=rule)
             except Exception as e:
                 print(e)
 
-    def scheduleAt(self, pipeline, label = None, trigger_time_str=datetime.now().strftime("%H:%M:%S"), recurrency=None, tags=[]):
+        # fire times missed while not running. They are fired by
+        # fireMissedEvents once the listeners are in place
+        try:
+            self.misfired = self.getMissedFireTimes(active_scheduled_events)
+        except Exception as e:
+            print("could not compute missed fire times:",e)
+            self.misfired = []
+
+    def getMissedFireTimes(self, sch_evt_list, now=None):
+        # computes in bulk the fire times missed since last_fired for the
+        # given scheduled events, already filtered by their misfire policy
+        # and grace window. returns a list of (scheduled event, fire times)
+        if now is None:
+            now = datetime.now()
+        now_us = toMicroseconds(now)
+        horizon_us = now_us - int(self.misfire_horizon * 1000000)
+
+        candidates = []
+        for sch_evt in sch_evt_list:
+            policy = sch_evt.misfire_policy
+            # scheduled events without policy (created before misfire
+            # policies existed) keep skipping missed fire times
+            if policy is None or policy == "skip":
+                continue
+
+            reference = self.toLocalTime(sch_evt.last_fired)
+            if reference is None:
+                # creation is set by the database (func.now()), stored in
+                # UTC by SQLite
+                reference = self.toLocalTime(sch_evt.creation, naive_utc=True)
+            if reference is None:
+                continue
+
+            rule = self.getRecurrenceRule(sch_evt)
+            if rule is None:
+                continue
+
+            start_us = max(toMicroseconds(reference), horizon_us)
+            if sch_evt.misfire_grace is not None:
+                start_us = max(start_us, now_us - int(sch_evt.misfire_grace * 1000000))
+
+            candidates.append((sch_evt, rule, start_us))
+
+        if len(candidates)==0:
+            return []
+
+        start = min([ c[2] for c in candidates ])
+        occ = occurrencesBetween([ c[1] for c in candidates ], start, now_us)
+
+        missed = []
+        for (sch_evt, rule, start_us), fire_times in zip(candidates, occ):
+            fire_times = fire_times[fire_times.astype(np.int64) > start_us]
+            if len(fire_times)==0:
+                continue
+
+            if sch_evt.misfire_policy == "once":
+                fire_times = fire_times[-1:]
+            else:
+                fire_times = fire_times[-self.max_catchup:]
+
+            missed.append((sch_evt, [ fromMicroseconds(int(t)) for t in fire_times.astype(np.int64) ]))
+
+        return missed
+
+    def toLocalTime(self, dt, naive_utc=False):
+        # naive local time, as the fire times computed by the recurrence
+        # rules. Naive datetimes are local unless naive_utc is given
+        if dt is None:
+            return None
+        if dt.tzinfo is None:
+            if not naive_utc:
+                return dt
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt.astimezone().replace(tzinfo=None)
+
+    def fireMissedEvents(self):
+        # fire the executions missed while the orchestrator was not running
+        misfired = self.misfired
+        self.misfired = []
+        for sch_evt, fire_times in misfired:
+            print("scheduled event %s missed %d fire times. policy %s" % (sch_evt.uuid, len(fire_times), sch_evt.misfire_policy))
+            for fire_time in fire_times:
+                self.fireScheduledEvent(sch_evt, fire_time, not sch_evt.getRecurrenceRule().isRecurrent())
+
+    def getRecurrenceRule(self, sch_evt):
+        # compiled recurrence rule of the scheduled event. Scheduled events
+        # stored without it are compiled once and updated in the database
+        rule = sch_evt.getRecurrenceRule()
+        if rule is None:
+            try:
+                rule = RecurrenceRule.compile(sch_evt.trigger_time, sch_evt.recurrency)
+            except Exception as e:
+                print("could not compile recurrence rule for %s: %s" % (sch_evt.uuid, e))
+                return None
+
+            sch_evt.setRecurrenceRule(rule)
+            self.saveObject(sch_evt)
+        return rule
+
+    def scheduleAt(self, pipeline, label = None, trigger_time_str=datetime.now().strftime("%H:%M:%S"), recurrency=None, tags=[], misfire_policy="once", misfire_grace=None):
         
         if label is None:
             label = pipeline.name
+
+        if misfire_policy not in self.misfire_policies:
+            raise RuntimeError("misfire_policy must be one of: %s" % ",".join(self.misfire_policies))
         
         sch_evt      = ScheduledEvent(self,label)
         trigger_time = parser.parse(trigger_time_str)
@@ -48,6 +168,8 @@ class SchedulerManager(DataBaseBackend, ActionListener, Observable):
         sch_evt.trigger_time  = trigger_time
         sch_evt.recurrency    = recurrency
         sch_evt.pipeline      = pipeline.name
+        sch_evt.misfire_policy = misfire_policy
+        sch_evt.misfire_grace  = misfire_grace
         
         if hasattr(pipeline,"args"):
             print("execution args:",pipeline.args)
@@ -61,10 +183,19 @@ class SchedulerManager(DataBaseBackend, ActionListener, Observable):
         else:
             sch_evt.setKeywordArguments({})
             
+        # natural language recurrencies not supported by RecurrenceRule are
+        # handled by the TimeEvent as before
+        rule = None
+        try:
+            rule = RecurrenceRule.compile(trigger_time_str, recurrency)
+            sch_evt.setRecurrenceRule(rule)
+        except Exception as e:
+            print("could not compile recurrence rule:",e)
+
         sch_evt.active        = True
         try:
             if self.saveObject(sch_evt):
-                self.tm.addTimeEvent(sch_evt.uuid,trigger_time_str,recurrency)
+                self.tm.addTimeEvent(sch_evt.uuid,trigger_time_str,recurrency, rule=rule)
                 return True
         except Exception as e:
             print("could not schedule the pipeline")
@@ -94,16 +225,7 @@ class SchedulerManager(DataBaseBackend, ActionListener, Observable):
         if len(sch_evt_list)==1:
             sch_evt = sch_evt_list[0]
             if sch_evt.active:
-            
-                args = sch_evt.getArguments()
-                kw_args = sch_evt.getKeywordArguments()
-
-                if not evt.isRecurrent():
-                    print("scheduled event not recurrent.")
-                    sch_evt.active = False
-                    self.saveObject(sch_evt)
-
-                Observable.actionPerformed(self,ExecutePipeline(sch_evt.uuid, sch_evt.pipeline, args, kw_args))
+                self.fireScheduledEvent(sch_evt, datetime.now(), not evt.isRecurrent())
             else:
                 print("SchedulerManager: scheduled event not active. ignoring time event")
                 
@@ -112,6 +234,20 @@ class SchedulerManager(DataBaseBackend, ActionListener, Observable):
         else:
             print("no ScheduledEvent found for ",evt)
             
+    def fireScheduledEvent(self, sch_evt, fire_time, last=False):
+        args = sch_evt.getArguments()
+        kw_args = sch_evt.getKeywordArguments()
+
+        if last:
+            print("scheduled event not recurrent.")
+            sch_evt.active = False
+
+        # last_fired is the reference for computing missed fire times
+        sch_evt.last_fired = fire_time
+        self.saveObject(sch_evt)
+
+        Observable.actionPerformed(self,ExecutePipeline(sch_evt.uuid, sch_evt.pipeline, args, kw_args, fire_time=fire_time))
+
     def getScheduledEvents(self, pipeline, **kw_args):
         sch_evt_list = self.getObjects(ScheduledEvent, pipeline=pipeline.name, **kw_args)
         return sch_evt_list
@@ -125,5 +261,42 @@ class SchedulerManager(DataBaseBackend, ActionListener, Observable):
         else:
             raise MultipleScheduledEventFound(scheduled_event_id)
     
+    def getActiveRules(self, **kw_args):
+        # (scheduled event, compiled rule) of the active scheduled events
+        sch_evt_list = self.getObjects(ScheduledEvent, active=True, **kw_args)
+        rules = []
+        for sch_evt in sch_evt_list:
+            rule = self.getRecurrenceRule(sch_evt)
+            if rule is not None:
+                rules.append((sch_evt, rule))
+        return rules
+
+    def getNextOccurrences(self, n=10, after=None, **kw_args):
+        # next n fire times of each active scheduled event (uuid -> datetime64 array)
+        rules = self.getActiveRules(**kw_args)
+        occ = nextOccurrences([ r for e, r in rules ], n, after)
+        return { e.uuid: o for (e, r), o in zip(rules, occ) }
+
+    def getLoadForecast(self, hours=24, bucket="1h", start=None, **kw_args):
+        # number of scheduled executions per pipeline and time bucket in the
+        # next given hours. rows are buckets, columns are pipelines
+        if start is None:
+            start = datetime.now()
+        start = np.datetime64(start, "us")
+        end   = start + np.timedelta64(int(hours * 3600), "s")
+
+        rules = self.getActiveRules(**kw_args)
+        occ = occurrencesBetween([ r for e, r in rules ], start, end)
+
+        times     = np.concatenate([ o for o in occ ] + [ np.array([], dtype="datetime64[us]") ])
+        pipelines = np.concatenate([ np.repeat(e.pipeline, len(o)) for (e, r), o in zip(rules, occ) ] + [ np.array([], dtype=object) ])
+
+        df = pd.DataFrame({ "time": times, "pipeline": pipelines })
+        df["time"] = df["time"].dt.floor(bucket)
+        buckets = pd.date_range(pd.Timestamp(start).floor(bucket), pd.Timestamp(end), freq=bucket)
+
+        forecast = df.groupby(["time","pipeline"]).size().unstack(fill_value=0)
+        return forecast.reindex(buckets, fill_value=0)
+
     def stop(self):
         self.tm.stop()
@@ -58,7 +58,7 @@ class TimeEvent(ActionEvent):
 
         return next_evt_date
 
-    def __init__(self, label, when=datetime.now(), recurrency_str=None, resolution=1):
+    def __init__(self, label, when=datetime.now(), recurrency_str=None, resolution=1, rule=None):
         super().__init__()
         
         self.label             = label
@@ -72,8 +72,15 @@ class TimeEvent(ActionEvent):
         self.evt_time          = None
         self.resolution        = resolution
 
+        # compiled recurrence rule. when given, ctparse is not used
+        self.rule              = rule
+        self.ct_recurrency     = None
+
         try:
-            self.evt_time          = self.getTime2Trigger(self.when, self.recurrency)
+            if self.rule is not None:
+                self.evt_time      = self.rule.nextEventTime(datetime.now())
+            else:
+                self.evt_time      = self.getTime2Trigger(self.when, self.recurrency)
             print("Event scheduled at",self.evt_time)
         except Exception as e:
             print("error computing next event time")
@@ -82,6 +89,14 @@ class TimeEvent(ActionEvent):
       
         print("updating event time")
         tm = datetime.now()
+
+        if self.rule is not None:
+            next_evt_ts = self.rule.nextEventTime(tm)
+            if next_evt_ts is not None:
+                self.evt_time = next_evt_ts
+                print("Time Event updated:",self.evt_time)
+            return next_evt_ts
+
         try:
             next_evt_ts = self.getTime2Trigger(self.when, self.recurrency ,tm)
 
@@ -104,18 +119,24 @@ class TimeEvent(ActionEvent):
         return None
 
     def isRecurrent(self):
+        if self.rule is not None:
+            return self.rule.isRecurrent()
         if self.recurrency is not None:
             return True
         return False
         
     def getRecurrency(self):
         if self.isRecurrent():
-            try:
-                evt_time = "%s %s" % (self.when, self.recurrency)
-                ctr = ctparse(evt_time,datetime.now()).resolution
-                return ctr
-            except Exception as e:
-                return self.recurrency
+            if self.rule is not None:
+                return self.rule
+            if self.ct_recurrency is None:
+                # parsed once and kept, since it is used for printing the event
+                try:
+                    evt_time = "%s %s" % (self.when, self.recurrency)
+                    self.ct_recurrency = ctparse(evt_time,datetime.now()).resolution
+                except Exception as e:
+                    self.ct_recurrency = self.recurrency
+            return self.ct_recurrency
         return None
         
     def trigger(self, tm):
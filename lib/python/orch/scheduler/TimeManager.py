@@ -1,5 +1,6 @@
-from threading import Thread
-import time
+from threading import Thread, Condition
+import heapq
+import itertools
 from datetime import datetime, timedelta
 from pytimeparse.timeparse import timeparse
 import re
@@ -8,26 +9,60 @@ from ..base import Observable
 from . import TimeEvent
 from ..exceptions import EventWithNoRecurrence
 
+# TimeManager
+#
+# keeps the time events in a heap ordered by next event time. The manager
+# thread sleeps on a condition variable until the earliest event is due
+# (or until the head of the heap changes) instead of polling the whole
+# event list every resolution tick.
+#
+# heap entries are (evt_time, seq, label, evt). Entries are invalidated
+# lazily: an entry is only fired when its event is still registered under
+# the label and its event time has not been updated since it was pushed.
+
 class TimeManager(Thread, Observable):
     def __init__(self, resolution="1s"):
         Thread.__init__(self)
         Observable.__init__(self)
-        try:        
+        try:
             self.resolution = timeparse(resolution)
         except Exception as e:
             raise e
-        self.running = False
-        
+
         self.event_list = {}
-        
-        self.start()
+        self.event_heap = []
+        self.seq        = itertools.count()
+        self.cv         = Condition()
+
         self.localtime = datetime.now()
 
-    def addTimeEvent(self, label, trigger_time_str, recurrency_str=None):
+        # set before starting the thread so an early stop() is not lost
+        self.running = True
+        self.start()
+
+    def __push(self, evt):
+        # must be called holding self.cv
+        if evt.evt_time is None:
+            print("TimeEvent without event time. not scheduling it",evt.label)
+            return False
+
+        head = self.event_heap[0] if len(self.event_heap)>0 else None
+        heapq.heappush(self.event_heap, (evt.evt_time, next(self.seq), evt.label, evt))
+
+        # wake up the manager thread only when the earliest deadline changed
+        if head is None or evt.evt_time < head[0]:
+            self.cv.notify()
+        return True
+
+    def __isValid(self, entry):
+        evt_time, seq, label, evt = entry
+        return self.event_list.get(label) is evt and evt.evt_time == evt_time
+
+    def addTimeEvent(self, label, trigger_time_str, recurrency_str=None, rule=None):
         # translate short recurrency format to long one
         re_dur  = "([0-9]*)(m|h|d|M)"
         t = None
-        
+
         if recurrency_str is not None:
             if re.match(re_dur, recurrency_str):
                 match = re.search(re_dur, recurrency_str)
@@ -41,43 +76,91 @@ class TimeManager(Thread, Observable):
                     t = "%d months" % int(match.group(1))
                 recurrency_str = t
 
-        self.event_list[label] = TimeEvent(label, trigger_time_str, recurrency_str, self.resolution)
-        
+        evt = TimeEvent(label, trigger_time_str, recurrency_str, self.resolution, rule=rule)
+        with self.cv:
+            self.event_list[label] = evt
+            self.__push(evt)
+
     def removeTimeEvent(self, evt_label):
-        if evt_label in self.event_list:
-            del self.event_list[evt_label] 
-            return True
-        
+        with self.cv:
+            if evt_label in self.event_list:
+                was_head = len(self.event_heap)>0 and self.event_heap[0][2] == evt_label
+                del self.event_list[evt_label]
+                if was_head:
+                    self.cv.notify()
+                return True
+
         return False
-        
+
+    def getNextEventTime(self):
+        with self.cv:
+            while len(self.event_heap)>0 and not self.__isValid(self.event_heap[0]):
+                heapq.heappop(self.event_heap)
+            if len(self.event_heap)>0:
+                return self.event_heap[0][0]
+        return None
+
     def stop(self):
-        self.running = False
-        
+        with self.cv:
+            self.running = False
+            self.cv.notify()
+
+    def __nextDueEvent(self):
+        # block until the head of the heap is due. returns None when stopped
+        with self.cv:
+            while self.running:
+                # drop invalidated entries at the head
+                while len(self.event_heap)>0 and not self.__isValid(self.event_heap[0]):
+                    heapq.heappop(self.event_heap)
+
+                if len(self.event_heap)==0:
+                    self.cv.wait()
+                    continue
+
+                self.localtime = datetime.now()
+                evt = self.event_heap[0][3]
+
+                if evt.trigger(self.localtime):
+                    heapq.heappop(self.event_heap)
+                    return evt
+
+                delay = (self.event_heap[0][0] - self.localtime).total_seconds()
+                self.cv.wait(max(delay, 0.001))
+
+        return None
+
     def run(self):
-        
+
         print("TimeManager starting time:",datetime.now())
-        self.running = True
+
         while self.running:
-            time.sleep(self.resolution)
-            self.localtime = datetime.now()
-            for evt_label, evt in list(self.event_list.items()):
-                try:
-                    if evt.trigger(self.localtime):
-                        print("triggerred",evt)
-                        if evt.isRecurrent():
-                            # update next event time
-                            self.event_list[evt_label].updateEventTime()
-                            
-                        else:
-                            print("one time event list. removing it")
-                            # one time event. removing it from event list
-                            del self.event_list[evt_label]
-                            
-                        # trigger the event to the listeners
-                        self.actionPerformed(evt)
-
-                except Exception as e:
-                    print("TimeManager Exception:",e)
-                    print("Event:",evt)
+            evt = self.__nextDueEvent()
+            if evt is None:
+                break
+
+            try:
+                print("triggerred",evt)
+                with self.cv:
+                    if evt.isRecurrent():
+                        # update next event time and reschedule it
+                        evt.updateEventTime()
+                        if self.event_list.get(evt.label) is evt:
+                            if evt.evt_time is not None and evt.evt_time > self.localtime:
+                                self.__push(evt)
+                            else:
+                                print("next event time is not in the future. event not rescheduled",evt.label)
+                                del self.event_list[evt.label]
+                    else:
+                        print("one time event list. removing it")
+                        # one time event. removing it from event list
+                        if self.event_list.get(evt.label) is evt:
+                            del self.event_list[evt.label]
+
+                # trigger the event to the listeners
+                self.actionPerformed(evt)
+
+            except Exception as e:
+                print("TimeManager Exception:",e)
+                print("Event:",evt)
 
         print("TimeManager ending time:",datetime.now())
@@ -1,4 +1,6 @@
 
+from .RecurrenceRule import *
+from .CronRule import *
 from .TimeEvent import *
 from .TimeManager import *
 from .Events import *
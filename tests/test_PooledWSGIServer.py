@@ -0,0 +1,102 @@
+# PooledWSGIServer tests
+#
+# keep alive connections (which rely on werkzeug internals) and the limit
+# of open connections. Run with the environment of the orchestrator:
+#
+#   source env
+#   python -m unittest discover tests
+
+from threading import Thread
+import http.client
+import json
+import socket
+import time
+import unittest
+
+from flask import Flask, request
+
+from orch.base import PooledWSGIServer
+
+class PooledWSGIServerTest(unittest.TestCase):
+
+    def startServer(self, **kwargs):
+        app = Flask("PooledWSGIServerTest")
+
+        @app.route("/port", methods=["GET", "POST"])
+        def port():
+            # the body of the posts is left unread
+            return { "port" : request.environ["REMOTE_PORT"] }
+
+        srv = PooledWSGIServer("127.0.0.1", 0, app, threads=2, request_timeout=5, **kwargs)
+        Thread(target=srv.serve_forever, daemon=True).start()
+        self.addCleanup(srv.server_close)
+        self.addCleanup(srv.shutdown)
+        return srv
+
+    def waitFor(self, condition, timeout=5):
+        start = time.time()
+        while not condition():
+            if time.time() - start > timeout:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def test_requests_on_one_connection(self):
+        srv = self.startServer()
+        conn = http.client.HTTPConnection("127.0.0.1", srv.server_port, timeout=5)
+        self.addCleanup(conn.close)
+
+        conn.request("GET", "/port")
+        first = conn.getresponse()
+        self.assertEqual(first.status, 200)
+        self.assertNotEqual(first.getheader("Connection", "").lower(), "close")
+        port = json.loads(first.read())["port"]
+
+        conn.request("POST", "/port", body=b"x" * 1000)
+        second = conn.getresponse()
+        self.assertEqual(second.status, 200)
+        self.assertEqual(json.loads(second.read())["port"], port)
+
+        conn.request("GET", "/port")
+        third = conn.getresponse()
+        self.assertEqual(third.status, 200)
+        self.assertEqual(json.loads(third.read())["port"], port)
+
+        self.assertTrue(self.waitFor(lambda: srv.getStatus()["idle"] == 1))
+        self.assertEqual(srv.getStatus()["connections"], 1)
+
+    def test_connections_beyond_the_limit_are_rejected(self):
+        srv = self.startServer(max_connections=2)
+
+        # connections not sending any request are not idle, they count
+        silent = [ socket.create_connection(("127.0.0.1", srv.server_port)) for i in range(2) ]
+        for s in silent:
+            self.addCleanup(s.close)
+        self.assertTrue(self.waitFor(lambda: srv.getStatus()["connections"] == 2))
+
+        conn = http.client.HTTPConnection("127.0.0.1", srv.server_port, timeout=5)
+        self.addCleanup(conn.close)
+        conn.request("GET", "/port")
+        self.assertEqual(conn.getresponse().status, 503)
+        self.assertEqual(srv.getStatus()["rejected"], 1)
+
+    def test_idle_connections_make_room(self):
+        srv = self.startServer(max_connections=2)
+
+        idle = []
+        for i in range(2):
+            conn = http.client.HTTPConnection("127.0.0.1", srv.server_port, timeout=5)
+            self.addCleanup(conn.close)
+            conn.request("GET", "/port")
+            conn.getresponse().read()
+            idle.append(conn)
+        self.assertTrue(self.waitFor(lambda: srv.getStatus()["idle"] == 2))
+
+        conn = http.client.HTTPConnection("127.0.0.1", srv.server_port, timeout=5)
+        self.addCleanup(conn.close)
+        conn.request("GET", "/port")
+        self.assertEqual(conn.getresponse().status, 200)
+        self.assertEqual(srv.getStatus()["rejected"], 0)
+
+if __name__ == "__main__":
+    unittest.main()